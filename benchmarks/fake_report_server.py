@@ -0,0 +1,332 @@
+"""local stand-in of the CCSR report server, serving synthetic reports and invoices with injectable latency and failures
+
+    $ python ./benchmarks/fake_report_server.py --port 8080 --invoices 10000 --latency 0.05 --error-rate 0.01
+
+then set URL = http://127.0.0.1:8080 in the [REPORT_SERVER] section of the config file. It answers
+/Reports/browse/, the STAT_FATTURATO_CTERZI report in the EXCELOPENXML, XML and CSV formats,
+restricted to the invoices issued between dataI and dataF, and the invoice pdfs the xlsx and csv
+reports link to. The invoices are the ones of benchmarks/generators.py, so a given --invoices and
+--seed always serve the same data.
+
+Like IIS it authenticates every connection with the NTLM handshake of requests_ntlm: a request
+without credentials gets a 401 asking for NTLM, the negotiate message gets a challenge and the
+authenticate message is accepted if its user is --username (any user if not set). The password is
+not checked. With --auth none every request is served without authentication.
+"""
+
+import os
+import sys
+import time
+import base64
+import random
+import struct
+import shutil
+import signal
+import argparse
+import datetime
+import tempfile
+import threading
+import urllib.parse
+import http.server
+
+import generators
+
+REPORT_NAME = '/STAT_FATTURATO_CTERZI'
+REPORT_FORMATS = {
+    'EXCELOPENXML': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'XML': ('.xml', 'text/xml; charset=utf-8'),
+    'CSV': ('.csv', 'text/csv; charset=utf-8'),
+}
+CHUNK_SIZE = 16*1024
+
+NTLM_SIGNATURE = b'NTLMSSP\0'
+NTLM_NEGOTIATE = 1
+NTLM_AUTHENTICATE = 3
+NTLM_CHALLENGE_FLAGS = 0xE2898215  # unicode, ntlm, extended session security, target info, version, 128/56 bit, key exchange
+NTLM_DOMAIN = "SANROSSORE"
+NTLM_COMPUTER = "FAKESSRS"
+
+def av_pair(av_id: int, value: bytes) -> bytes:
+    """return an AV_PAIR of the target info of an NTLM challenge"""
+    return struct.pack('<HH', av_id, len(value)) + value
+
+def ntlm_challenge() -> bytes:
+    """return an NTLM challenge message with a random server challenge"""
+    target_name = NTLM_DOMAIN.encode('utf-16-le')
+    filetime = int((time.time() + 11644473600) * 10**7)
+    target_info = b''.join((
+        av_pair(2, NTLM_DOMAIN.encode('utf-16-le')),
+        av_pair(1, NTLM_COMPUTER.encode('utf-16-le')),
+        av_pair(7, struct.pack('<Q', filetime)),
+        av_pair(0, b''),
+    ))
+    header_size = 56
+    return b''.join((
+        NTLM_SIGNATURE,
+        struct.pack('<I', 2),
+        struct.pack('<HHI', len(target_name), len(target_name), header_size),
+        struct.pack('<I', NTLM_CHALLENGE_FLAGS),
+        os.urandom(8),
+        b'\0'*8,
+        struct.pack('<HHI', len(target_info), len(target_info), header_size+len(target_name)),
+        bytes((10, 0)) + struct.pack('<H', 19041) + b'\0\0\0\x0f',
+        target_name,
+        target_info,
+    ))
+
+def ntlm_message(header: str):
+    """return (type, message) of the NTLM message of an Authorization header, None if it is not one"""
+    scheme, _, token = (header or '').partition(' ')
+    if scheme.upper() not in ('NTLM', 'NEGOTIATE'):
+        return None
+    try:
+        message = base64.b64decode(token.strip())
+    except ValueError:
+        return None
+    if len(message) < 12 or not message.startswith(NTLM_SIGNATURE):
+        return None
+    return struct.unpack('<I', message[8:12])[0], message
+
+def ntlm_user(message: bytes) -> str:
+    """return the user name of an NTLM authenticate message"""
+    length, _, offset = struct.unpack('<HHI', message[36:44])
+    flags = struct.unpack('<I', message[60:64])[0]
+    return message[offset:offset+length].decode('utf-16-le' if flags & 1 else 'latin-1')
+
+class FaultPolicy:
+    """latency, bandwidth and failures injected in the responses"""
+    def __init__(self, args):
+        self.latency = args.latency
+        self.jitter = args.jitter
+        self.bandwidth = args.bandwidth*1024 if args.bandwidth else None
+        self.error_rate = args.error_rate
+        self.drop_rate = args.drop_rate
+        self.corrupt_rate = args.corrupt_rate
+        self.render_seconds = args.render_seconds
+        self.rng = random.Random(args.fault_seed)
+        self.lock = threading.Lock()
+
+    def chance(self, rate: float) -> bool:
+        """return True with probability rate"""
+        if rate <= 0:
+            return False
+        with self.lock:
+            return self.rng.random() < rate
+
+    def delay(self) -> float:
+        """return the latency of a response"""
+        with self.lock:
+            return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+class ReportServer(http.server.ThreadingHTTPServer):
+    """http server holding the synthetic data set, the generated reports and the request counters"""
+    daemon_threads = True
+
+    def __init__(self, address, args):
+        super(ReportServer, self).__init__(address, ReportRequestHandler)
+        self.args = args
+        self.faults = FaultPolicy(args)
+        self.reports_dir = tempfile.mkdtemp(prefix='fake_report_server_')
+        self.reports_lock = threading.Lock()
+        self.counters = dict()
+        self.counters_lock = threading.Lock()
+
+    def base_url(self) -> str:
+        """return the url the invoice hyperlinks of the xlsx report point to"""
+        return self.args.public_url or "http://%s:%d" % (self.server_address[0], self.server_address[1])
+
+    def count(self, name: str):
+        """increment a request counter"""
+        with self.counters_lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def report_path(self, report_format: str, start_date, end_date) -> str:
+        """return the path of the report of the period, generating it the first time it is asked"""
+        suffix = REPORT_FORMATS[report_format][0]
+        path = os.path.join(self.reports_dir, "%s_%s%s" % (start_date.isoformat(), end_date.isoformat(), suffix))
+        with self.reports_lock:
+            if not os.path.exists(path):
+                if report_format == 'XML':
+                    generators.write_report_xml(path, self.args.invoices, self.args.seed, start_date, end_date)
+                elif report_format == 'CSV':
+                    generators.write_report_csv(path, self.args.invoices, self.base_url(), self.args.seed, start_date, end_date)
+                else:
+                    generators.write_report_xlsx(path, self.args.invoices, self.base_url(), self.args.seed, start_date, end_date)
+        return path
+
+    def server_close(self):
+        super(ReportServer, self).server_close()
+        shutil.rmtree(self.reports_dir, ignore_errors=True)
+
+class ReportRequestHandler(http.server.BaseHTTPRequestHandler):
+    """handle the requests of a connection, authenticated once by the NTLM handshake"""
+    protocol_version = 'HTTP/1.1'
+    server_version = 'Microsoft-HTTPAPI/2.0'
+
+    def setup(self):
+        super(ReportRequestHandler, self).setup()
+        self.authenticated = False
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        if self.server.args.verbose:
+            super(ReportRequestHandler, self).log_message(format, *args)
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """authenticate the connection, inject the faults and route the request"""
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        if not self.authenticate():
+            return
+
+        faults = self.server.faults
+        time.sleep(faults.delay())
+        url = urllib.parse.urlsplit(self.path)
+        if url.path.rstrip('/') == '/Reports/browse':
+            self.server.count('browse')
+            self.send_body(200, b'<html><body>SQL Server Reporting Services</body></html>', 'text/html; charset=utf-8')
+        elif url.path.lower() == '/reportserver':
+            self.server.count('report')
+            if faults.chance(faults.error_rate):
+                self.send_error_body(500)
+            else:
+                self.send_report(url.query)
+        elif url.path.startswith('/invoices/') and url.path.endswith('.pdf'):
+            self.server.count('invoice')
+            if faults.chance(faults.error_rate):
+                self.send_error_body(503)
+            else:
+                self.send_invoice(url.path[len('/invoices/'):-len('.pdf')])
+        else:
+            self.send_error_body(404)
+
+    def authenticate(self) -> bool:
+        """run a step of the NTLM handshake, return True if the request can be served"""
+        if self.server.args.auth == 'none':
+            return True
+        message = ntlm_message(self.headers.get('Authorization'))
+        if message is None and self.authenticated:
+            return True
+        if message is None:
+            self.server.count('401')
+            self.send_body(401, b'', 'text/plain', {'WWW-Authenticate': 'NTLM'})
+        elif message[0] == NTLM_NEGOTIATE:
+            # a negotiate message restarts the handshake even on an authenticated connection
+            self.authenticated = False
+            self.send_body(401, b'', 'text/plain', {'WWW-Authenticate': 'NTLM '+base64.b64encode(ntlm_challenge()).decode()})
+        elif message[0] == NTLM_AUTHENTICATE:
+            user = ntlm_user(message[1])
+            if self.server.args.username and user.lower() != self.server.args.username.lower():
+                self.server.count('login_failed')
+                self.send_body(401, b'', 'text/plain', {'WWW-Authenticate': 'NTLM'})
+            else:
+                self.server.count('login')
+                self.authenticated = True
+        else:
+            self.send_error_body(400)
+        return self.authenticated
+
+    def send_report(self, query: str):
+        """send the report of the dataI..dataF period in the rs:Format format"""
+        params = urllib.parse.parse_qs(query, keep_blank_values=True)
+        report_format = params.get('rs:Format', [''])[0].upper()
+        if REPORT_NAME not in params or report_format not in REPORT_FORMATS:
+            self.send_error_body(400)
+            return
+        try:
+            start_date, end_date = (datetime.datetime.strptime(params[name][0], "%d/%m/%Y").date() for name in ('dataI', 'dataF'))
+        except (KeyError, ValueError):
+            self.send_error_body(400)
+            return
+        path = self.server.report_path(report_format, start_date, end_date)
+        faults = self.server.faults
+        if faults.render_seconds:
+            days = (end_date-start_date).days + 1
+            time.sleep(faults.render_seconds * self.server.args.invoices * min(days, generators.DAYS) / generators.DAYS / 1000)
+        with open(path, 'rb') as report:
+            self.send_body(200, report.read(), REPORT_FORMATS[report_format][1])
+
+    def send_invoice(self, index: str):
+        """send the pdf of an invoice, corrupted if the policy says so"""
+        try:
+            index = int(index)
+        except ValueError:
+            index = 0
+        if not 1 <= index <= self.server.args.invoices:
+            self.send_error_body(404)
+            return
+        pdf = generators.invoice_pdf(index, 1 + (index % 10 == 0))
+        faults = self.server.faults
+        if faults.chance(faults.corrupt_rate):
+            self.server.count('corrupt')
+            pdf = pdf[:len(pdf)//2]
+        self.send_body(200, pdf, 'application/pdf')
+
+    def send_error_body(self, status: int):
+        """send an error page"""
+        self.server.count(str(status))
+        self.send_body(status, ('<html><body>%d %s</body></html>' % (status, self.responses.get(status, ('',))[0])).encode(), 'text/html; charset=utf-8')
+
+    def send_body(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        """send a response throttled to the bandwidth cap, dropping the connection midway if the policy says so"""
+        faults = self.server.faults
+        drop = status == 200 and faults.chance(faults.drop_rate)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or dict()).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        end = len(body)//2 if drop else len(body)
+        start = time.perf_counter()
+        for offset in range(0, end, CHUNK_SIZE):
+            chunk = body[offset:min(offset+CHUNK_SIZE, end)]
+            self.wfile.write(chunk)
+            if faults.bandwidth:
+                wait = (offset+len(chunk))/faults.bandwidth - (time.perf_counter()-start)
+                if wait > 0:
+                    time.sleep(wait)
+        if drop:
+            self.server.count('dropped')
+            self.wfile.flush()
+            self.close_connection = True
+
+def parse_args(argv=None):
+    """parse the command line"""
+    parser = argparse.ArgumentParser(prog='fake_report_server', description="Serve synthetic CCSR reports and invoices injecting latency and failures")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--public-url', help="base url of the invoice links (default http://HOST:PORT)")
+    parser.add_argument('--invoices', type=int, default=1000, help="invoices issued over %d days from %s" % (generators.DAYS, generators.FIRST_DATE))
+    parser.add_argument('--seed', type=int, default=0, help="seed of the invoices")
+    parser.add_argument('--auth', choices=('ntlm', 'none'), default='ntlm')
+    parser.add_argument('--username', help="the only user accepted by the NTLM login (default any)")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds waited before every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="random seconds added to or removed from the latency")
+    parser.add_argument('--bandwidth', type=float, default=0.0, help="KiB/s cap of every response, 0 for none")
+    parser.add_argument('--render-seconds', type=float, default=0.0, help="seconds the report takes to render every 1000 invoices")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of the reports and invoices answered with an error status")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="fraction of the responses whose connection is dropped halfway")
+    parser.add_argument('--corrupt-rate', type=float, default=0.0, help="fraction of the invoices sent truncated")
+    parser.add_argument('--fault-seed', type=int, help="seed of the injected faults (default random)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log every request")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    """serve until interrupted or terminated, then print the request counters"""
+    args = parse_args(argv)
+    server = ReportServer((args.host, args.port), args)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print("fake report server on %s with %d invoices from %s" % (server.base_url(), args.invoices, generators.FIRST_DATE), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(', '.join("%s: %d" % item for item in sorted(server.counters.items())), file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
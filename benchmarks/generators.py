@@ -0,0 +1,209 @@
+"""synthetic CCSR inputs for the benchmarks: the xml, xlsx and csv reports and the invoice pdfs
+
+Every generator is deterministic for a given count and seed, so timings taken on different commits
+are measured on the same data.
+"""
+
+import os
+import csv
+import random
+import zipfile
+import datetime
+from xml.sax.saxutils import quoteattr, escape
+
+REPORT_NAMESPACE = 'STAT_FATTURATO_CTERZI'
+SHEET_NAMESPACE = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NAMESPACE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NAMESPACE = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+FIRST_NAMES = ("MARIO", "LUCA", "GIULIA", "ANNA", "PAOLO", "FRANCESCA", "MARCO LUIGI", "ELENA MARIA")
+LAST_NAMES = ("ROSSI", "BIANCHI", "VERDI", "ESPOSITO", "DELL'ORTO", "DI NICOLA", "FERRARI", "ROMANO")
+DESCRIPTIONS = ("Visita specialistica", "Esame diagnostico", "Ecografia", "Prestazione ambulatoriale", "Day hospital")
+CREDIT_NOTE_RATIO = 0.05
+FIRST_DATE = datetime.date(2020, 1, 1)
+DAYS = 366  # the invoices are spread over FIRST_DATE and the following days, numbered by date
+LETTERHEAD_WIDTH, LETTERHEAD_HEIGHT = 48, 24  # rgb image every invoice pdf embeds, as the CCSR logo
+LETTERHEAD_SIZE = LETTERHEAD_WIDTH*LETTERHEAD_HEIGHT*3
+LETTERHEAD = random.Random(0).getrandbits(LETTERHEAD_SIZE*8).to_bytes(LETTERHEAD_SIZE, 'little')  # the bytes of randbytes, new in python 3.9
+CSV_ATTRIBUTES = ("codice_fatturaattivatipo", "protocollo_fatturatestata", "data_fatturatestata", "cartellaclinica",
+                  "protocollo_fatturatestata1", "nome_cliente", "cognome_cliente", "cf_piva_cliente", "fat_ndc", "pagante",
+                  "denorm_importototale_fatturatestata", "denorm_importopagato_fatturatestata", "denorm_importoresiduo_fatturatestata", "operatore")
+
+def invoice_number(index: int, year: int = 2020) -> str:
+    """return the CCSR number of the index-th invoice"""
+    return "CCSR/%05d/%d" % (index % 100000, year + index // 100000)
+
+def invoice_type(index: int) -> str:
+    """return the document type of the index-th invoice, one every 1/CREDIT_NOTE_RATIO is a credit note"""
+    return "Nota di credito" if index % int(1/CREDIT_NOTE_RATIO) == 0 else "Fattura"
+
+def fiscal_code(rng) -> str:
+    """return a random codice fiscale, the converter rejects the 11 digits partite iva"""
+    letters = ''.join(rng.choice("ABCDEFGHILMNOPRSTUVZ") for _ in range(6))
+    return "%s%02dA%02dH501%s" % (letters, rng.randint(40, 99), rng.randint(1, 28), rng.choice("ABCDEFGHILMNOPRSTUVZ"))
+
+def iter_invoices(count: int, seed: int = 0, start_date=None, end_date=None):
+    """yield the index, the attributes and the lines of count invoices, only the ones issued between start_date and end_date if given"""
+    rng = random.Random(seed)
+    for index in range(1, count+1):
+        doc_type = invoice_type(index)
+        sign = -1 if doc_type == "Nota di credito" else 1
+        lines = [(rng.choice(DESCRIPTIONS), sign*rng.randint(1000, 90000)/100) for _ in range(rng.randint(1, 4))]
+        if rng.random() < 0.6:
+            lines.append(("Bollo", sign*2.0))
+        if rng.random() < 0.05:
+            lines.append(("Ritenuta d'acconto", rng.randint(100, 5000)/100))
+        total = sum(amount for desc, amount in lines if desc != "Ritenuta d'acconto")
+        date = FIRST_DATE + datetime.timedelta(days=(index-1)*DAYS//count)
+        attributes = {
+            "codice_fatturaattivatipo": "FT" if sign > 0 else "NC",
+            "protocollo_fatturatestata": invoice_number(index),
+            "data_fatturatestata": date.isoformat()+"T00:00:00",
+            "cartellaclinica": str(rng.randint(1, 999999)),
+            "protocollo_fatturatestata1": invoice_number(max(1, index-1)) if sign < 0 else "",
+            "nome_cliente": rng.choice(FIRST_NAMES),
+            "cognome_cliente": rng.choice(LAST_NAMES),
+            "cf_piva_cliente": fiscal_code(rng),
+            "fat_ndc": doc_type,
+            "pagante": "PAZIENTE",
+            "denorm_importototale_fatturatestata": "%.2f" % total,
+            "denorm_importopagato_fatturatestata": "%.2f" % total,
+            "denorm_importoresiduo_fatturatestata": "0.00",
+            "operatore": "BENCH",
+        }
+        # the random values are drawn for every invoice so that an invoice is the same in any period
+        if (start_date is None or date >= start_date) and (end_date is None or date <= end_date):
+            yield index, attributes, lines
+
+def write_report_xml(path: str, count: int, seed: int = 0, start_date=None, end_date=None):
+    """write a STAT_FATTURATO_CTERZI xml report, valid against res/schema.xsd if it has at least one invoice"""
+    written = 0
+    with open(path, "w", encoding="utf-8") as output:
+        output.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        output.write('<Report xmlns="%s" Name="STAT_FATTURATO_CTERZI" ReportTitle="STAT_FATTURATO_CTERZI">' % REPORT_NAMESPACE)
+        output.write('<FatturaTestata><Dettagli_Collection>')
+        for _, attributes, lines in iter_invoices(count, seed, start_date, end_date):
+            written += 1
+            output.write('<Dettagli %s>' % ' '.join('%s=%s' % (name, quoteattr(value)) for name, value in attributes.items()))
+            output.write('<Tablix7 Textbox5="%s"><Dettagli2_Collection>' % attributes["denorm_importototale_fatturatestata"])
+            for desc, amount in lines:
+                output.write('<Dettagli2 descrizione_fatturariga1=%s prezzounitario_fatturariga1="%.2f"/>' % (quoteattr(desc), amount))
+            output.write('</Dettagli2_Collection></Tablix7></Dettagli>')
+        output.write('</Dettagli_Collection></FatturaTestata>')
+        output.write('<Tablix2 Textbox70="%d" Textbox71="0" Textbox72="0" Textbox73="0"><Dettagli1_Collection>' % (written % 65536))
+        output.write('<Dettagli1 codice_fatturaattivatipo1="FT" Textbox39="1" denorm_importototale_fatturatestata1="0" denorm_importopagato_fatturatestata1="0" denorm_importoresiduo_fatturatestata1="0"/>')
+        output.write('</Dettagli1_Collection></Tablix2></Report>\n')
+
+def write_report_csv(path: str, count: int, base_url: str = "http://127.0.0.1:8080", seed: int = 0, start_date=None, end_date=None, owner: str = "Fatture emesse Casa di Cura San Rossore"):
+    """write a STAT_FATTURATO_CTERZI csv report as SSRS renders it: a record per invoice line with the invoice attributes, its pdf link and the owner, then the totals"""
+    written = 0
+    with open(path, "w", encoding="utf-8-sig", newline='') as output:
+        writer = csv.writer(output)
+        writer.writerow(("intestazione",) + CSV_ATTRIBUTES + ("Textbox5", "descrizione_fatturariga1", "prezzounitario_fatturariga1", "link_fattura"))
+        for index, attributes, lines in iter_invoices(count, seed, start_date, end_date):
+            written += 1
+            attributes["data_fatturatestata"] = datetime.date.fromisoformat(attributes["data_fatturatestata"][:10]).strftime("%d/%m/%Y 00:00:00")
+            values = (owner,) + tuple(attributes[name] for name in CSV_ATTRIBUTES) + (attributes["denorm_importototale_fatturatestata"],)
+            url = invoice_url(base_url, index)
+            writer.writerows(values + (desc, "%.2f" % amount, url) for desc, amount in lines)
+        output.write("\r\n")
+        writer.writerow(("Textbox70", "Textbox71", "Textbox72", "Textbox73", "codice_fatturaattivatipo1", "Textbox39"))
+        writer.writerow((written % 65536, 0, 0, 0, "FT", 1))
+
+def invoice_url(base_url: str, index: int) -> str:
+    """return the pdf url of the index-th invoice"""
+    return "%s/invoices/%d.pdf" % (base_url, index)
+
+def write_report_xlsx(path: str, count: int, base_url: str = "http://127.0.0.1:8080", seed: int = 0, start_date=None, end_date=None, owner: str = "Fatture emesse Casa di Cura San Rossore"):
+    """write an EXCELOPENXML report with the owner in B1, the invoice number in I, its type in AP and a hyperlink to its pdf in BG"""
+    strings = list()
+    string_index = dict()
+
+    def shared(value: str) -> int:
+        if value not in string_index:
+            string_index[value] = len(strings)
+            strings.append(value)
+        return string_index[value]
+
+    rows = ['<row r="1"><c r="B1" t="s"><v>%d</v></c></row>' % shared(owner)]
+    header = (("I", "Numero"), ("AP", "Tipo"), ("BG", "Pdf"))
+    rows.append('<row r="2">%s</row>' % ''.join('<c r="%s2" t="s"><v>%d</v></c>' % (column, shared(label)) for column, label in header))
+    hyperlinks = list()
+    link_text = shared("Apri")
+    for row, (index, attributes, _) in enumerate(iter_invoices(count, seed, start_date, end_date), start=3):
+        rows.append('<row r="%d"><c r="A%d"><v>%d</v></c><c r="I%d" t="s"><v>%d</v></c><c r="AP%d" t="s"><v>%d</v></c><c r="BG%d" t="s"><v>%d</v></c></row>' % (
+            row, row, index, row, shared(attributes["protocollo_fatturatestata"]), row, shared(attributes["fat_ndc"]), row, link_text))
+        hyperlinks.append(('BG%d' % row, 'rId%d' % row, invoice_url(base_url, index)))
+
+    sheet = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n',
+             '<worksheet xmlns="%s" xmlns:r="%s"><sheetData>' % (SHEET_NAMESPACE, REL_NAMESPACE)]
+    sheet.extend(rows)
+    sheet.append('</sheetData><hyperlinks>')
+    sheet.extend('<hyperlink ref="%s" r:id="%s"/>' % (ref, rel_id) for ref, rel_id, _ in hyperlinks)
+    sheet.append('</hyperlinks></worksheet>')
+
+    sheet_rels = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<Relationships xmlns="%s">' % PKG_REL_NAMESPACE]
+    sheet_rels.extend('<Relationship Id="%s" Type="%s/hyperlink" Target=%s TargetMode="External"/>' % (rel_id, REL_NAMESPACE, quoteattr(url)) for _, rel_id, url in hyperlinks)
+    sheet_rels.append('</Relationships>')
+
+    shared_strings = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<sst xmlns="%s" count="%d" uniqueCount="%d">' % (SHEET_NAMESPACE, len(strings), len(strings))]
+    shared_strings.extend('<si><t>%s</t></si>' % escape(value) for value in strings)
+    shared_strings.append('</sst>')
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as xlsx:
+        xlsx.writestr('[Content_Types].xml', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                      '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                      '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                      '<Default Extension="xml" ContentType="application/xml"/>'
+                      '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                      '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                      '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+                      '</Types>')
+        xlsx.writestr('_rels/.rels', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                      '<Relationships xmlns="%s"><Relationship Id="rId1" Type="%s/officeDocument" Target="xl/workbook.xml"/></Relationships>' % (PKG_REL_NAMESPACE, REL_NAMESPACE))
+        xlsx.writestr('xl/workbook.xml', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                      '<workbook xmlns="%s" xmlns:r="%s"><bookViews><workbookView activeTab="0"/></bookViews>'
+                      '<sheets><sheet name="STAT_FATTURATO_CTERZI" sheetId="1" r:id="rId1"/></sheets></workbook>' % (SHEET_NAMESPACE, REL_NAMESPACE))
+        xlsx.writestr('xl/_rels/workbook.xml.rels', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                      '<Relationships xmlns="%s"><Relationship Id="rId1" Type="%s/worksheet" Target="worksheets/sheet1.xml"/>'
+                      '<Relationship Id="rId2" Type="%s/sharedStrings" Target="sharedStrings.xml"/></Relationships>' % (PKG_REL_NAMESPACE, REL_NAMESPACE, REL_NAMESPACE))
+        xlsx.writestr('xl/worksheets/sheet1.xml', ''.join(sheet))
+        xlsx.writestr('xl/worksheets/_rels/sheet1.xml.rels', ''.join(sheet_rels))
+        xlsx.writestr('xl/sharedStrings.xml', ''.join(shared_strings))
+
+def invoice_pdf(index: int, pages: int = 1) -> bytes:
+    """return a small valid pdf with the letterhead and the number of the index-th invoice on every page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+               "<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB /BitsPerComponent 8 /Length %d >>\nstream\n%s\nendstream" % (
+                   LETTERHEAD_WIDTH, LETTERHEAD_HEIGHT, len(LETTERHEAD), LETTERHEAD.decode("latin-1"))]
+    kids = list()
+    for page in range(pages):
+        text = "Fattura %s pagina %d" % (invoice_number(index), page+1)
+        content = "q 144 0 0 72 36 750 cm /Im1 Do Q BT /F1 14 Tf 72 700 Td (%s) Tj ET" % text
+        objects.append("<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> /XObject << /Im1 4 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append("%d 0 R" % len(objects))
+    objects[1] = "<< /Type /Pages /Kids [%s] /Count %d >>" % (' '.join(kids), pages)
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = list()
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body.encode("latin-1"))
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects)+1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects)+1, xref)
+    return bytes(pdf)
+
+def write_invoice_pdfs(directory: str, count: int) -> list:
+    """write count invoice pdfs in directory and return their paths"""
+    os.makedirs(directory, exist_ok=True)
+    paths = list()
+    for index in range(1, count+1):
+        path = os.path.join(directory, "%d.pdf" % index)
+        if not os.path.exists(path):
+            with open(path, "wb") as output:
+                output.write(invoice_pdf(index, 1 + (index % 10 == 0)))
+        paths.append(path)
+    return paths
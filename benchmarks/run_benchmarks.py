@@ -0,0 +1,269 @@
+"""time the hot paths of fatture_ccsr on synthetic reports and compare the results between commits
+
+    $ python ./benchmarks/run_benchmarks.py run --sizes 1000 10000 100000
+    $ python ./benchmarks/run_benchmarks.py compare ./benchmarks/results/<base>.json ./benchmarks/results/<new>.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import configparser
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), 'fatture_ccsr'))
+
+import generators # pylint: disable=wrong-import-position
+import csv_reader # pylint: disable=wrong-import-position
+import downloader # pylint: disable=wrong-import-position
+import pdf_merge # pylint: disable=wrong-import-position
+import run_context # pylint: disable=wrong-import-position
+import traf2000_converter # pylint: disable=wrong-import-position
+import traf2000_layout # pylint: disable=wrong-import-position
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.1  # slowdown reported as a regression by compare
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+WORK_DIR = os.path.join(tempfile.gettempdir(), 'fatture_ccsr_benchmarks')
+
+TRAF2000_CONFIG = {
+    'TRF-DITTA': '00001',
+    'TRF-ALIQ': '022',
+    'TRF-ALIQ-BOLLO': '000',
+    'TRF-CONTO-RIC': '1234567',
+    'TRF-CONTO-RIC-BOLLO': '7654321',
+}
+
+class BenchmarkContext(run_context.RunContext):
+    """run context discarding the progress messages, errors are still written to stderr"""
+    def log(self, text: str):
+        pass
+
+    def credit_note(self, text: str):
+        pass
+
+def new_context(workers: int = 1) -> BenchmarkContext:
+    """return a context converting with the default validation and workers processes"""
+    config = configparser.ConfigParser()
+    config['TRAF2000'] = dict(TRAF2000_CONFIG, WORKERS=str(workers))
+    config['METRICS'] = {'SUMMARY': 'no'}
+    return BenchmarkContext(config, None, None, None)
+
+def new_records() -> traf2000_layout.Traf2000Records:
+    """return the TRAF2000 records of the benchmark config"""
+    return traf2000_layout.Traf2000Records(*(TRAF2000_CONFIG[key] for key in ('TRF-DITTA', 'TRF-ALIQ', 'TRF-ALIQ-BOLLO', 'TRF-CONTO-RIC', 'TRF-CONTO-RIC-BOLLO')))
+
+def generate(path: str, write_func, *args):
+    """write path with write_func(path, *args) unless it was generated by a previous run"""
+    if not os.path.exists(path):
+        tmp_path = path+".tmp"
+        write_func(tmp_path, *args)
+        os.replace(tmp_path, path)
+    return path
+
+def prepare_inputs(work_dir: str, size: int, seed: int) -> dict:
+    """generate, or reuse, the inputs of size invoices"""
+    size_dir = os.path.join(work_dir, "%d_%d" % (size, seed))
+    os.makedirs(size_dir, exist_ok=True)
+    return {
+        "xml": generate(os.path.join(size_dir, "report.xml"), generators.write_report_xml, size, seed),
+        "xlsx": generate(os.path.join(size_dir, "report.xlsx"), generators.write_report_xlsx, size, "http://127.0.0.1:8080", seed),
+        "csv": generate(os.path.join(size_dir, "report.csv"), generators.write_report_csv, size, "http://127.0.0.1:8080", seed),
+        "dir": size_dir,
+        "size": size,
+    }
+
+def load_invoices(inputs: dict):
+    """parse the convertible invoices the render benchmarks start from"""
+    if "invoices" not in inputs:
+        inputs["invoices"] = list(traf2000_converter.iter_convertible(new_context(), [inputs["xml"]]))
+
+def load_pdfs(inputs: dict):
+    """generate, or reuse, the invoice pdfs the merge benchmark starts from"""
+    if "pdfs" not in inputs:
+        inputs["pdfs"] = generators.write_invoice_pdfs(os.path.join(os.path.dirname(inputs["dir"]), "invoices"), inputs["size"])
+
+def bench_invoices_info(inputs: dict):
+    """downloader.get_invoices_info streaming the xlsx"""
+    return len(downloader.get_invoices_info(inputs["xlsx"])[1])
+
+def bench_invoices_info_openpyxl(inputs: dict):
+    """downloader.get_invoices_info loading the xlsx with openpyxl"""
+    return len(downloader.get_invoices_info(inputs["xlsx"], fast=False)[1])
+
+def bench_invoices_info_csv(inputs: dict):
+    """csv_reader.get_invoices_info streaming the csv"""
+    return len(csv_reader.get_invoices_info(inputs["csv"])[1])
+
+def bench_import_xml(inputs: dict):
+    """traf2000_converter.import_xml with the default validation"""
+    return len(traf2000_converter.import_xml(new_context(), inputs["xml"]))
+
+def bench_import_csv(inputs: dict):
+    """traf2000_converter.import_csv"""
+    return len(traf2000_converter.import_csv(new_context(), inputs["csv"]))
+
+def render(inputs: dict, workers: int):
+    """render the convertible invoices as convert does and return the TRAF2000 size"""
+    size = 0
+    for _, rendered, error, _ in traf2000_converter.iter_rendered(new_context(workers), new_records(), iter(inputs["invoices"])):
+        if error is None:
+            size += len(rendered)
+    return size
+
+def bench_render(inputs: dict):
+    """TRAF2000 rendering of convert, serial"""
+    return render(inputs, 1)
+
+def bench_render_parallel(inputs: dict):
+    """TRAF2000 rendering of convert, a worker process per cpu"""
+    return render(inputs, 0)
+
+def merge(inputs: dict, optimize: bool):
+    """merge the invoice pdfs as download_invoices does and return the size of the outputs"""
+    outputs = {key: os.path.join(inputs["dir"], "merged_%s.pdf" % key) for key in ("all", "ft", "nc")}
+    with pdf_merge.InvoiceMerger(outputs, optimize) as merger:
+        for index, path in enumerate(inputs["pdfs"], start=1):
+            merger.add(path, ("all", "nc" if generators.invoice_type(index) == "Nota di credito" else "ft"))
+        merger.write()
+    size = sum(os.path.getsize(path) for path in outputs.values())
+    for path in outputs.values():
+        os.remove(path)
+    return size
+
+def bench_pdf_merge(inputs: dict):
+    """pdf_merge.InvoiceMerger writing the all, invoices and credit notes outputs"""
+    return merge(inputs, False)
+
+def bench_pdf_merge_optimized(inputs: dict):
+    """pdf_merge.InvoiceMerger writing the outputs with the shared resources deduplicated"""
+    return merge(inputs, True)
+
+BENCHMARKS = {
+    "get_invoices_info": bench_invoices_info,
+    "get_invoices_info_openpyxl": bench_invoices_info_openpyxl,
+    "get_invoices_info_csv": bench_invoices_info_csv,
+    "import_xml": bench_import_xml,
+    "import_csv": bench_import_csv,
+    "render": bench_render,
+    "render_parallel": bench_render_parallel,
+    "pdf_merge": bench_pdf_merge,
+    "pdf_merge_optimized": bench_pdf_merge_optimized,
+}
+SETUPS = {
+    "render": load_invoices,
+    "render_parallel": load_invoices,
+    "pdf_merge": load_pdfs,
+    "pdf_merge_optimized": load_pdfs,
+}
+
+def time_benchmark(bench_func, inputs: dict, repeat: int) -> dict:
+    """run bench_func repeat times and return its best and mean seconds"""
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = bench_func(inputs)
+        timings.append(time.perf_counter()-start)
+    return {"best": min(timings), "mean": sum(timings)/len(timings), "repeat": repeat, "result": result}
+
+def git_commit() -> str:
+    """return the short hash of HEAD, with a -dirty suffix for uncommitted changes"""
+    def git(*args):
+        return subprocess.run(("git",)+args, cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    try:
+        commit = git("rev-parse", "--short", "HEAD")
+        if git("status", "--porcelain", "--untracked-files=no"):
+            commit += "-dirty"
+        return commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run(args) -> int:
+    """run the benchmarks and save their results"""
+    names = args.only or [name for name in BENCHMARKS if name not in args.skip]
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print("unknown benchmarks: %s, choose from %s" % (', '.join(unknown), ', '.join(BENCHMARKS)), file=sys.stderr)
+        return 2
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": args.seed,
+        "benchmarks": dict(),
+    }
+    for size in args.sizes:
+        print("generating %d invoices in %s" % (size, args.work_dir), flush=True)
+        inputs = prepare_inputs(args.work_dir, size, args.seed)
+        for name in names:
+            if name in SETUPS:
+                SETUPS[name](inputs)
+            timing = time_benchmark(BENCHMARKS[name], inputs, args.repeat)
+            results["benchmarks"].setdefault(name, dict())[str(size)] = timing
+            print("%-28s %7d  best %9.3fs  mean %9.3fs" % (name, size, timing["best"], timing["mean"]), flush=True)
+
+    output_path = args.output or os.path.join(RESULTS_DIR, commit+".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print("results saved in %s" % output_path)
+    if args.clean:
+        shutil.rmtree(args.work_dir, ignore_errors=True)
+    return 0
+
+def compare(args) -> int:
+    """print the best times of two results side by side, the exit status is 1 if any regressed"""
+    with open(args.base) as base_file, open(args.new) as new_file:
+        base, new = json.load(base_file), json.load(new_file)
+    print("%-28s %7s %10s %10s %8s" % ("benchmark", "size", base["commit"][:10], new["commit"][:10], "change"))
+    regressed = False
+    for name, sizes in new["benchmarks"].items():
+        for size, timing in sizes.items():
+            base_timing = base["benchmarks"].get(name, dict()).get(size)
+            if base_timing is None:
+                print("%-28s %7s %10s %9.3fs %8s" % (name, size, "-", timing["best"], "new"))
+                continue
+            change = timing["best"]/base_timing["best"]-1
+            flag = ""
+            if change > args.threshold:
+                flag = "  REGRESSION"
+                regressed = True
+            print("%-28s %7s %9.3fs %9.3fs %+7.1f%%%s" % (name, size, base_timing["best"], timing["best"], change*100, flag))
+    return 1 if regressed else 0
+
+def parse_args(argv=None):
+    """parse the command line"""
+    parser = argparse.ArgumentParser(prog='run_benchmarks', description="Benchmark fatture_ccsr on synthetic reports")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="run the benchmarks and save the results")
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="number of invoices of the inputs")
+    run_parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="runs of every benchmark, the best is compared")
+    run_parser.add_argument('--only', nargs='+', metavar='BENCHMARK', help="run only these benchmarks: %s" % ', '.join(BENCHMARKS))
+    run_parser.add_argument('--skip', nargs='+', metavar='BENCHMARK', default=(), help="skip these benchmarks")
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--work-dir', default=WORK_DIR, help="where the generated inputs are kept between runs")
+    run_parser.add_argument('--clean', action='store_true', help="remove the generated inputs at the end")
+    run_parser.add_argument('-o', '--output', help="results file (default ./benchmarks/results/<commit>.json)")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser('compare', help="compare two results files")
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="relative slowdown reported as a regression")
+    compare_parser.set_defaults(func=compare)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    input_args = parse_args()
+    sys.exit(input_args.func(input_args))
@@ -0,0 +1,67 @@
+"""query the local catalog of the invoices from the command line, without asking the report server"""
+
+import sys
+import csv
+import json
+import argparse
+import configparser
+
+import cli
+import invoice_catalog
+
+INVOICE_TYPES = {
+    'fattura': "Fattura",
+    'nc': "Nota di credito",
+}
+
+def parse_args(argv=None):
+    """parse the command line"""
+    parser = argparse.ArgumentParser(prog='fatture_ccsr_catalog', description="Query the local catalog of the downloaded and converted CCSR invoices")
+    parser.add_argument('-i', '--id', help="invoice number, as CCSR/00001/2020 or CCSR-00001-2020")
+    parser.add_argument('-k', '--type', choices=tuple(INVOICE_TYPES), help="only invoices (fattura) or credit notes (nc)")
+    parser.add_argument('-s', '--start-date', type=cli.parse_date, help="first day of the period")
+    parser.add_argument('-e', '--end-date', type=cli.parse_date, help="last day of the period")
+    parser.add_argument('-u', '--customer', help="part of the customer name or its whole cf")
+    parser.add_argument('--downloaded', dest='downloaded', action='store_const', const=True, default=None, help="only the invoices downloaded")
+    parser.add_argument('--not-downloaded', dest='downloaded', action='store_const', const=False, help="only the invoices not downloaded")
+    parser.add_argument('--exported', dest='exported', action='store_const', const=True, default=None, help="only the invoices exported to TRAF2000")
+    parser.add_argument('--not-exported', dest='exported', action='store_const', const=False, help="only the invoices not exported to TRAF2000")
+    parser.add_argument('-n', '--limit', type=int)
+    parser.add_argument('--count', action='store_true', help="print only the number of matching invoices")
+    parser.add_argument('--json', action='store_true', help="print the invoices as json instead of csv")
+    parser.add_argument('-c', '--configfile', default="./config.ini")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    """print the matching invoices, return 0 if any matched, 1 if none and 2 for configuration errors"""
+    input_args = parse_args(argv)
+
+    config = configparser.ConfigParser()
+    try:
+        with open(input_args.configfile) as config_file:
+            config.read_file(config_file)
+    except (OSError, configparser.Error) as e:
+        print(f"Error in reading the config file: {e}", file=sys.stderr)
+        return 2
+
+    catalog = invoice_catalog.open_catalog(config)
+    if catalog is None:
+        print("Error: the catalog is disabled in [CATALOG]", file=sys.stderr)
+        return 2
+    with catalog:
+        rows = catalog.query(input_args.id, INVOICE_TYPES.get(input_args.type), input_args.start_date, input_args.end_date,
+                             input_args.customer, input_args.downloaded, input_args.exported, input_args.limit)
+
+    if input_args.count:
+        print(len(rows))
+    elif input_args.json:
+        json.dump(rows, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        writer = csv.DictWriter(sys.stdout, invoice_catalog.COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return 0 if rows else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""download invoices or generate the TRAF2000 record of a period from the command line, without the gui"""
+
+import startup
+if __name__ == "__main__":
+    startup.begin()
+
+# pylint: disable=wrong-import-position
+import os
+import sys
+import argparse
+import datetime
+import configparser
+import multiprocessing
+import requests
+
+import exc
+import report_server
+import run_context
+# pylint: enable=wrong-import-position
+
+startup.phase("imports")
+
+USERNAME_ENV = 'FATTURE_CCSR_USERNAME'
+PASSWORD_ENV = 'FATTURE_CCSR_PASSWORD'
+
+DOWNLOAD_ACTION = 'download'
+CONVERT_ACTION = 'traf2000'
+BOTH_ACTION = 'both'
+ALL_ACTION = 'all'  # alias of BOTH_ACTION
+
+def parse_date(value: str) -> datetime.date:
+    """parse a YYYY-MM-DD or DD/MM/YYYY date"""
+    for date_format in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError("invalid date %s, use YYYY-MM-DD or DD/MM/YYYY" % value)
+
+def parse_args(argv=None):
+    """parse the command line"""
+    parser = argparse.ArgumentParser(prog='fatture_ccsr_cli', description="Download the CCSR invoices or generate the TRAF2000 record of a period")
+    parser.add_argument('action', choices=(DOWNLOAD_ACTION, CONVERT_ACTION, BOTH_ACTION, ALL_ACTION))
+    parser.add_argument('-s', '--start-date', type=parse_date, required=True, help="first day of the period")
+    parser.add_argument('-e', '--end-date', type=parse_date, required=True, help="last day of the period")
+    parser.add_argument('-p', '--pdf-output', help="merged invoices pdf, the _ft and _nc ones are written next to it (default ./fatture_<owner>.pdf)")
+    parser.add_argument('-z', '--zip-output', help="invoices zip bundle when [DOWNLOADER] OUTPUT is zip (default ./fatture_<owner>.zip)")
+    parser.add_argument('-t', '--traf2000-output', help="TRAF2000 record file (default ./TRAF2000)")
+    parser.add_argument('-c', '--configfile', default="./config.ini")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('-f', '--force-refresh', action='store_true', help="ignore the invoices and reports caches and download everything again")
+    parser.add_argument('--profile', action='store_true', help="dump the cProfile stats of every action next to its output")
+    return parser.parse_args(argv)
+
+def get_credentials(config) -> tuple:
+    """return (username, password) from the environment or else from the [REPORT_SERVER] section"""
+    username = os.environ.get(USERNAME_ENV) or config.get('REPORT_SERVER', 'USERNAME', fallback=None)
+    password = os.environ.get(PASSWORD_ENV) or config.get('REPORT_SERVER', 'PASSWORD', fallback=None)
+    return username, password
+
+def main(argv=None) -> int:
+    """run the action and return the exit status"""
+    input_args = parse_args(argv)
+
+    config = configparser.ConfigParser()
+    try:
+        with open(input_args.configfile) as config_file:
+            config.read_file(config_file)
+    except (OSError, configparser.Error) as e:
+        print(f"Error in reading the config file: {e}", file=sys.stderr)
+        return 2
+    startup.end("config")
+
+    username, password = get_credentials(config)
+    if not username or not password:
+        print(f"Error: missing credentials, set {USERNAME_ENV} and {PASSWORD_ENV} or USERNAME and PASSWORD in [REPORT_SERVER]", file=sys.stderr)
+        return 2
+
+    session = report_server.new_session(config)
+    context = run_context.RunContext(config, session, input_args.start_date, input_args.end_date, input_args.verbose, input_args.force_refresh, input_args.pdf_output, input_args.traf2000_output, input_args.zip_output)
+    try:
+        try:
+            logged_in = report_server.login(session, config, username, password)
+        except requests.exceptions.RequestException:
+            context.error("Errore: impossibile connettersi\n")
+            return 1
+        if not logged_in:
+            context.error("Errore: credenziali errate\n")
+            return 1
+
+        actions = list()
+        if input_args.action in (DOWNLOAD_ACTION, BOTH_ACTION, ALL_ACTION):
+            actions.append(run_context.download_invoices)
+        if input_args.action in (CONVERT_ACTION, BOTH_ACTION, ALL_ACTION):
+            actions.append(run_context.convert)
+        try:
+            succeeded = run_context.run_actions(context, actions, input_args.profile)
+        except exc.DeadlineExceededError as e:
+            context.error("ERRORE: superato il tempo massimo dell'operazione (%d secondi).\n" % e.deadline)
+            return 1
+        return 0 if succeeded else 1
+    finally:
+        context.cleanup()
+        session.close()
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""keep authenticated connections to the report server open between the login and the actions"""
+
+import threading
+import requests
+
+import http_client
+
+DEFAULT_CONNECTIONS = 4
+DEFAULT_KEEPALIVE_INTERVAL = 60.0  # seconds, less than the idle timeout of the IIS connections
+DEFAULT_DOWNLOAD_WORKERS = 4  # as downloader.DEFAULT_WORKERS
+DEFAULT_POOL_SIZE = 2  # as downloader.DEFAULT_POOL_SIZE
+PING_PATH = '/Reports/browse/'
+
+class ConnectionWarmer:
+    """open and authenticate connections in the background, then ping them while no action runs
+
+    The NTLM handshake authenticates a connection, not a request, so every new connection costs the
+    handshake round trips on top of the tcp and tls ones. Right after the login a thread opens
+    connections connections of session, used by the report downloads, and one connection for each
+    of the sessions the invoice download workers take with take_session, then every interval
+    seconds, while not paused by a running action, it pings them all, authenticating again the ones
+    the server has closed meanwhile.
+    The pings of a round are sent together and held until all have an answer, so each gets its own
+    connection instead of reusing the one freed by the previous ping.
+    """
+    def __init__(self, session, config, connections: int = DEFAULT_CONNECTIONS, interval: float = DEFAULT_KEEPALIVE_INTERVAL, workers: int = 0, pool_size: int = DEFAULT_POOL_SIZE):
+        self.session = session
+        self.url = config['REPORT_SERVER']['URL']+PING_PATH
+        self.timeout = http_client.RequestPolicy.from_config(config).timeout()
+        self.connections = connections
+        self.interval = interval
+        self.workers = workers
+        self.pool_size = pool_size
+        self.worker_sessions = list()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """start warming in the background"""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """body of the warming thread, without an interval the connections are warmed again only on resume"""
+        while not self.stop_event.is_set():
+            self.idle.wait()
+            if self.stop_event.is_set():
+                return
+            self.wake.clear()
+            self.warm()
+            self.wake.wait(self.interval if self.interval > 0 else None)
+
+    def warm(self) -> int:
+        """open or ping the connections of a round, return how many are authenticated"""
+        with self.lock:
+            if self.stop_event.is_set():
+                return 0
+            while len(self.worker_sessions) < self.workers:
+                self.worker_sessions.append(http_client.clone_session(self.session, self.pool_size))
+            sessions = [self.session]*self.connections + self.worker_sessions
+        if not sessions:
+            return 0
+        barrier = threading.Barrier(len(sessions))
+        results = list()
+
+        def ping(session):
+            try:
+                resp = session.get(self.url, stream=True, timeout=self.timeout)
+            except requests.exceptions.RequestException:
+                barrier.abort()
+                return
+            try:
+                barrier.wait(self.timeout[1])
+            except threading.BrokenBarrierError:
+                pass
+            # reading the whole body gives the connection back to the pool instead of closing it
+            with resp:
+                try:
+                    resp.content # pylint: disable=pointless-statement
+                except requests.exceptions.RequestException:
+                    return
+            results.append(resp.status_code == 200)
+
+        threads = [threading.Thread(target=ping, args=(session,), daemon=True) for session in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(results)
+
+    def take_session(self):
+        """return a warm session for a download worker, None if there are none left"""
+        with self.lock:
+            if self.worker_sessions:
+                return self.worker_sessions.pop()
+        return None
+
+    def pause(self):
+        """stop pinging while an action uses the connections"""
+        self.idle.clear()
+
+    def resume(self):
+        """ping again now, replacing the sessions taken by the action"""
+        self.idle.set()
+        self.wake.set()
+
+    def stop(self):
+        """stop the thread, without waiting for the pings in flight, and close the warm worker sessions"""
+        self.stop_event.set()
+        self.idle.set()
+        self.wake.set()
+        with self.lock:
+            for session in self.worker_sessions:
+                session.close()
+            self.worker_sessions.clear()
+
+def start_warmer(session, config):
+    """start the ConnectionWarmer of the [REPORT_SERVER] PREWARM-CONNECTIONS and KEEPALIVE-INTERVAL keys, None if disabled"""
+    connections = config.getint('REPORT_SERVER', 'PREWARM-CONNECTIONS', fallback=DEFAULT_CONNECTIONS)
+    if connections <= 0:
+        return None
+    warmer = ConnectionWarmer(
+        session,
+        config,
+        connections,
+        config.getfloat('REPORT_SERVER', 'KEEPALIVE-INTERVAL', fallback=DEFAULT_KEEPALIVE_INTERVAL),
+        config.getint('DOWNLOADER', 'WORKERS', fallback=DEFAULT_DOWNLOAD_WORKERS),
+        config.getint('DOWNLOADER', 'POOL-SIZE', fallback=DEFAULT_POOL_SIZE),
+    )
+    warmer.start()
+    return warmer
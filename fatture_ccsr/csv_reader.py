@@ -0,0 +1,142 @@
+"""read the invoices of a CCSR report rendered as csv, streaming it a record at a time
+
+SSRS renders the STAT_FATTURATO_CTERZI report as csv flattening its first data region: a header
+with the data element names, the same attribute names of the xml report, then a record per invoice
+line with the invoice attributes repeated. The other data regions follow after an empty record and
+are not read. The report title and the pdf link, the hyperlink of the xlsx report, are the
+OWNER_COLUMN and URL_COLUMN textboxes.
+"""
+
+import csv
+
+ENCODING = 'utf-8-sig'  # rc:Encoding=UTF-8 renders a byte order mark
+
+ID_COLUMN = "protocollo_fatturatestata"
+TYPE_COLUMN = "fat_ndc"
+DATE_COLUMN = "data_fatturatestata"
+URL_COLUMN = "link_fattura"
+OWNER_COLUMN = "intestazione"
+LINE_DESCRIPTION_COLUMN = "descrizione_fatturariga1"
+LINE_PRICE_COLUMN = "prezzounitario_fatturariga1"
+AMOUNT_COLUMNS = frozenset(("prezzounitario_fatturariga1", "Textbox5", "denorm_importototale_fatturatestata",
+                            "denorm_importopagato_fatturatestata", "denorm_importoresiduo_fatturatestata"))
+
+def normalize_amount(value: str) -> str:
+    """return an amount as the xs:decimal of the xml report, '1.234,50' and '1,234.50' as '1234.50'
+
+    The decimal separator is the last of '.' and ',' and the other one groups the thousands, a
+    separator repeated in the integer part can only group the thousands. ValueError is raised for
+    an amount not grouped by three digits or, as '1.234', with a single separator followed by three
+    digits, that can be either.
+    """
+    point = max(value.rfind('.'), value.rfind(','))
+    if point < 0:
+        return value
+    separator = value[point]
+    integer, fraction = value[:point], value[point+1:]
+    if separator in integer:
+        integer, fraction, thousands = value, '', separator
+    else:
+        thousands = ',' if separator == '.' else '.'
+        if thousands not in integer and len(fraction) == 3 and integer.lstrip('+-') not in ('', '0'):
+            raise ValueError("ambiguous amount %s" % value)
+    groups = integer.split(thousands)
+    if not groups[0].lstrip('+-').isdigit() or any(len(group) != 3 or not group.isdigit() for group in groups[1:]) \
+            or (fraction and not fraction.isdigit()):
+        raise ValueError("invalid amount %s" % value)
+    integer = ''.join(groups)
+    return integer+'.'+fraction if fraction else integer
+
+def normalize_date(value: str) -> str:
+    """return a date as the xs:dateTime of the xml report, 'DD/MM/YYYY[ HH:MM:SS]' as 'YYYY-MM-DDTHH:MM:SS'"""
+    if '/' not in value:
+        return value
+    day, _, time = value.partition(' ')
+    day, month, year = day.split('/')
+    return "%04d-%02d-%02dT%s" % (int(year), int(month), int(day), time or "00:00:00")
+
+def iter_records(input_file_path: str, required=()):
+    """yield the header and then every record of the first data region as a list
+
+    ValueError is raised if a required column is missing or a record is shorter than the header
+    """
+    with open(input_file_path, newline='', encoding=ENCODING) as input_file:
+        reader = csv.reader(input_file)
+        header = next(reader, None)
+        if header is None:
+            return
+        missing = [column for column in required if column not in header]
+        if missing:
+            raise ValueError("missing columns %s" % ', '.join(missing))
+        yield header
+        for record in reader:
+            if not any(record):
+                return
+            if len(record) < len(header):
+                raise ValueError("record at line %d has %d columns instead of %d" % (reader.line_num, len(record), len(header)))
+            yield record
+
+def iter_invoice_rows(input_file_path: str):
+    """yield the (attributes, lines) of every invoice in report order, attributes by column and lines as (description, price)
+
+    the records of an invoice are consecutive, its attributes are the ones of its first record
+    """
+    records = iter_records(input_file_path, (ID_COLUMN, LINE_DESCRIPTION_COLUMN, LINE_PRICE_COLUMN))
+    header = next(records, None)
+    if header is None:
+        return
+    id_index = header.index(ID_COLUMN)
+    description_index = header.index(LINE_DESCRIPTION_COLUMN)
+    price_index = header.index(LINE_PRICE_COLUMN)
+    amount_indexes = [index for index, column in enumerate(header) if column in AMOUNT_COLUMNS]
+    date_index = header.index(DATE_COLUMN) if DATE_COLUMN in header else None
+
+    attributes = None
+    lines = None
+    for record in records:
+        if attributes is None or record[id_index] != attributes[ID_COLUMN]:
+            if attributes is not None:
+                yield attributes, lines
+            for index in amount_indexes:
+                record[index] = normalize_amount(record[index])
+            if date_index is not None:
+                record[date_index] = normalize_date(record[date_index])
+            attributes = dict(zip(header, record))
+            lines = list()
+        lines.append((record[description_index], normalize_amount(record[price_index])))
+    if attributes is not None:
+        yield attributes, lines
+
+def get_invoices_info(input_file_path: str) -> tuple:
+    """extract invoices IDs and URLs from csv input file, as xlsx_reader.get_invoices_info"""
+    owner_value = None
+    invoices = dict()
+    records = iter_records(input_file_path, (ID_COLUMN,))
+    header = next(records, None)
+    if header is not None:
+        id_index = header.index(ID_COLUMN)
+        type_index = header.index(TYPE_COLUMN) if TYPE_COLUMN in header else None
+        url_index = header.index(URL_COLUMN) if URL_COLUMN in header else None
+        owner_index = header.index(OWNER_COLUMN) if OWNER_COLUMN in header else None
+        previous_id = None
+        for record in records:
+            invoice_id = record[id_index]
+            if invoice_id == previous_id:
+                continue
+            previous_id = invoice_id
+            if owner_value is None and owner_index is not None:
+                owner_value = record[owner_index]
+            if "CCSR" in invoice_id:
+                invoice_id = invoice_id.replace("/", "-")
+                invoice = {
+                    "id": invoice_id,
+                    "type": record[type_index] if type_index is not None else None,
+                    "url": (record[url_index] or None) if url_index is not None else None,
+                    "path": None,
+                    "good": None,
+                }
+                invoices[invoice_id] = invoice
+
+    owner_name = '_'.join((owner_value or '').split()[2:])
+    invoices_info = (owner_name, invoices)
+    return invoices_info
@@ -1,40 +1,46 @@
-"""ask for an input file (.xlsx) and an output file (.pdf) and downloads and unite every invoice"""
+"""download the .xlsx or .csv report of a period, then download and unite every invoice it lists in .pdf files or bundle them in a .zip"""
 
 import os
+import csv
+import time
 import shutil
+import sqlite3
 import tempfile
-import openpyxl
+import threading
+import concurrent.futures
 import PyPDF2
-import wx
 import requests
 
-def download_input_file(parent):
-    """download input file"""
-    start_date = parent.start_date_picker.GetValue().Format("%d/%m/%Y")
-    end_date = parent.end_date_picker.GetValue().Format("%d/%m/%Y")
-    input_file_url = parent.config['REPORT_SERVER']['URL']+'/reportserver?/STAT_FATTURATO_CTERZI&dataI='+start_date+'&dataF='+end_date+'&rs:Format=EXCELOPENXML'
-    try:
-        downloaded_input_file = parent.session.get(input_file_url)
-    except requests.exceptions.RequestException:
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.RED, font=wx.Font(wx.FontInfo(8).Bold())))
-        parent.log_dialog.log_text.AppendText("ERRORE: impossibile connettersi al portale CCSR.")
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-        wx.Yield()
-        return
-    if downloaded_input_file.status_code != 200:
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.RED, font=wx.Font(wx.FontInfo(8).Bold())))
-        parent.log_dialog.log_text.AppendText("ERRORE: impossibile scaricare il file di input.\nControllare la connessione ad internet e l'operatività del portale CCSR. Code %d\n" % downloaded_input_file.status_code)
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-        wx.Yield()
-        return
-
-    input_file_descriptor, parent.input_file_path = tempfile.mkstemp(suffix='.xlsx')
-    parent.input_files.append(parent.input_file_path)
-    with open(input_file_descriptor, 'wb') as input_file:
-        input_file.write(downloaded_input_file.content)
-
-def get_invoices_info(input_file_path: str) -> tuple:
-    """extract invoices IDs and URLs from xlsx input file"""
+import csv_reader
+import exc
+import http_client
+import invoice_bundle
+import invoice_cache
+import invoice_catalog
+import metrics
+import pdf_merge
+import report_server
+import streaming
+import xlsx_reader
+
+DEFAULT_WORKERS = 4
+DEFAULT_POOL_SIZE = 2
+DEFAULT_RETRY_PASSES = 1
+
+OUTPUT_PDF = 'pdf'  # merge the invoices in the all, invoices and credit notes pdfs
+OUTPUT_ZIP = 'zip'  # copy every invoice in a zip archive as soon as it is downloaded
+OUTPUT_MODES = (OUTPUT_PDF, OUTPUT_ZIP)
+
+REPORT_FORMATS = {
+    'xlsx': report_server.FORMAT_XLSX,
+    'csv': report_server.FORMAT_CSV,
+}
+
+def get_invoices_info(input_file_path: str, fast: bool = True) -> tuple:
+    """extract invoices IDs and URLs from xlsx input file, streaming it unless fast is False"""
+    if fast:
+        return xlsx_reader.get_invoices_info(input_file_path)
+    import openpyxl # pylint: disable=import-outside-toplevel
     xlsx_file = openpyxl.load_workbook(input_file_path)
     sheet = xlsx_file.active
     invoices = dict()
@@ -59,103 +65,352 @@ def get_invoices_info(input_file_path: str) -> tuple:
     invoices_info = (owner_name, invoices)
     return invoices_info
 
-def download_invoices(parent):
-    """download invoices from CCSR"""
-    output_all_file_path = None
-    output_ft_file_path = None
-    output_nc_file_path = None
+def format_size(size: int) -> str:
+    """return a file size in KB or MB"""
+    if size < 1048576:
+        return "%.0f KB" % (size/1024)
+    return "%.1f MB" % (size/1048576)
 
-    parent.log_dialog.log_text.AppendText("Download file input\n")
-    wx.Yield()
-    download_input_file(parent)
+def merge_invoices_info(invoices_infos) -> tuple:
+    """merge the (owner, invoices) of the reports of the shards of a period, keeping the first of the invoices listed twice"""
+    owner_name = None
+    invoices = dict()
+    for shard_owner_name, shard_invoices in invoices_infos:
+        owner_name = owner_name or shard_owner_name
+        for invoice_id, invoice in shard_invoices.items():
+            invoices.setdefault(invoice_id, invoice)
+    return owner_name, invoices
 
-    invoices_info = get_invoices_info(parent.input_file_path)
-    invoices = invoices_info[1]
+def download_invoice(session, invoice: dict, tmp_dir: str, cache=None, progress=None, run_metrics=None, policy=None):
+    """download a single invoice in tmp_dir and check it is a valid pdf, return None or an error message
 
-    parent.log_dialog.log_text.AppendText("Inizio download fatture dal portale CCSR\n")
-    wx.Yield()
+    progress is passed to streaming.stream_to_file and may raise to interrupt the download, the
+    download and the validation are added to run_metrics if given. The request and the download
+    are retried together following policy, a default http_client.RequestPolicy if not given.
+    """
+    if invoice["url"] is None:
+        invoice["good"] = False
+        return "Errore: impossibile scaricare fattura %s: link al pdf mancante\n" % invoice["id"]
+    if policy is None:
+        policy = http_client.RequestPolicy()
+    start = time.perf_counter()
+    size = 0
+    content_hash = None
+    attempts = 0
 
-    tmp_dir = tempfile.mkdtemp()
+    def attempt(timeout):
+        nonlocal size, content_hash, attempts
+        attempts += 1
+        with session.get(invoice["url"], stream=True, timeout=timeout) as resp:
+            http_client.check_status(resp)
+            if resp.status_code != 200:
+                return resp.status_code
+            invoice["path"] = os.path.join(tmp_dir, invoice["id"]+".pdf")
+            with open(invoice["path"], "wb") as output_file:
+                size, content_hash = streaming.stream_to_file(resp, output_file, progress=progress)
+            return resp.status_code
 
-    invoices_count = len(invoices)
-    downloaded_count = 0
-
-    for invoice_id, invoice in invoices.items():
-        try:
-            resp = parent.session.get(invoice["url"])
-            if resp.status_code == 200:
-                with open(tmp_dir+"/"+invoice_id+".pdf", "wb") as output_file:
-                    output_file.write(resp.content)
-                    invoice["path"] = output_file.name
-                    try:
-                        PyPDF2.PdfFileReader(open(invoice["path"], "rb"))
-                    except (PyPDF2.utils.PdfReadError, OSError):
-                        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.RED, font=wx.Font(wx.FontInfo(8).Bold())))
-                        parent.log_dialog.log_text.AppendText("Errore: fattura %s corrotta!\n" % invoice_id)
-                        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-                        wx.Yield()
-                        invoice["good"] = False
-                    else:
-                        downloaded_count += 1
-                        if parent.verbose:
-                            parent.log_dialog.log_text.AppendText("%d/%d scaricata fattura %s in %s\n" % (downloaded_count, invoices_count, invoice_id, invoice["path"]))
-                            wx.Yield()
-                        invoice["good"] = True
-            else:
-                parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.RED, font=wx.Font(wx.FontInfo(8).Bold())))
-                parent.log_dialog.log_text.AppendText("Errore: impossibile scaricare fattura %s: %d\n" % (invoice_id, resp.status_code))
-                parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-                wx.Yield()
-                invoice["good"] = False
-        except requests.exceptions.RequestException:
-            parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.RED, font=wx.Font(wx.FontInfo(8).Bold())))
-            parent.log_dialog.log_text.AppendText("Errore: impossibile scaricare fattura %s: errore di connessione\n" % invoice_id)
-            parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-            wx.Yield()
-            invoice["good"] = False
-
-    parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.BLACK, font=wx.Font(wx.FontInfo(8).Bold())))
-    parent.log_dialog.log_text.AppendText("Download terminato.\n")
-    parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-    wx.Yield()
-
-    parent.output_pdf_dialog.SetFilename("fatture_%s.pdf" % invoices_info[0])
-
-    if parent.output_pdf_dialog.ShowModal() == wx.ID_OK:
-        output_all_file_path = parent.output_pdf_dialog.GetPath()
-        path, ext = os.path.splitext(output_all_file_path)
-        output_ft_file_path = path+"_ft"+ext
-        output_nc_file_path = path+"_nc"+ext
-
-        merger_ft = PyPDF2.PdfFileMerger()
-        merger_nc = PyPDF2.PdfFileMerger()
-        merger_all = PyPDF2.PdfFileMerger()
+    try:
+        status_code = policy.call(attempt)
+    except exc.RetryableStatusError as e:
+        status_code = e.status_code
+    except requests.exceptions.RequestException:
+        invoice["good"] = False
+        return "Errore: impossibile scaricare fattura %s: errore di connessione\n" % invoice["id"]
+    finally:
+        if run_metrics is not None:
+            run_metrics.add_item('invoice_download', invoice["id"], time.perf_counter()-start, size, attempts)
+    if status_code != 200:
+        invoice["good"] = False
+        return "Errore: impossibile scaricare fattura %s: %d\n" % (invoice["id"], status_code)
+
+    start = time.perf_counter()
+    try:
+        with open(invoice["path"], "rb") as pdf_file:
+            PyPDF2.PdfFileReader(pdf_file)
+    except (PyPDF2.utils.PdfReadError, OSError):
+        invoice["good"] = False
+        return "Errore: fattura %s corrotta!\n" % invoice["id"]
+    finally:
+        if run_metrics is not None:
+            run_metrics.add_item('pdf_validation', invoice["id"], time.perf_counter()-start, size)
+    if cache is not None:
+        cache.put(invoice["id"], invoice["path"], content_hash)
+    invoice["hash"] = content_hash
+    invoice["good"] = True
+    return None
+
+def record_in_catalog(context, invoices, output_path: str):
+    """upsert the downloaded invoices in the catalog, if enabled, as written to output_path"""
+    try:
+        catalog = invoice_catalog.open_catalog(context.config)
+        if catalog is None:
+            return
+        with catalog, context.metrics.stage('catalog'):
+            catalog.upsert_downloaded(invoices, output_path)
+    except (sqlite3.Error, OSError) as e:
+        context.error("Errore: impossibile aggiornare il catalogo delle fatture: %s\n" % e)
+
+def get_output_mode(context) -> str:
+    """return the output mode set in the config file"""
+    mode = context.config.get('DOWNLOADER', 'OUTPUT', fallback=OUTPUT_PDF).lower()
+    if mode not in OUTPUT_MODES:
+        context.error("ERRORE: modalità di output %s sconosciuta, uso %s\n" % (mode, OUTPUT_PDF))
+        mode = OUTPUT_PDF
+    return mode
+
+def read_invoices_info(context, report_format: str, input_file_paths: list):
+    """return the (owner, invoices) of the reports of the period, None if a csv report is not valid"""
+    fast_reader = context.config.getboolean('DOWNLOADER', 'FAST-XLSX-READER', fallback=True)
+    with context.metrics.stage('invoices_info'):
+        if report_format == report_server.FORMAT_CSV:
+            try:
+                return merge_invoices_info(csv_reader.get_invoices_info(input_file_path) for input_file_path in input_file_paths)
+            except (csv.Error, ValueError) as e:
+                context.error("ERRORE: file di input csv non valido: %s\n" % e)
+                return None
+        return merge_invoices_info(get_invoices_info(input_file_path, fast_reader) for input_file_path in input_file_paths)
+
+def open_bundle(context, owner_name: str):
+    """return the InvoiceBundle of the zip output, None if it has not been chosen or cannot be created"""
+    bundle_path = context.ask_zip_output_path("fatture_%s.zip" % owner_name)
+    if bundle_path is None:
+        context.error("ERRORE: non è stato selezionato il file .zip di output.\n")
+        return None
+    try:
+        return invoice_bundle.InvoiceBundle(bundle_path)
+    except OSError as e:
+        context.error("ERRORE: impossibile creare il file %s: %s\n" % (bundle_path, e))
+        return None
+
+class InvoiceDownloader:
+    """download the invoices of a report in tmp_dir with a pool of worker threads, each with its own session
+
+    The invoices found in the cache are resolved first, the others are fetched by the workers and
+    the failed ones fetched again for up to RETRY-PASSES more passes. With a bundle every invoice is
+    added to it as soon as it is available, removing its temporary file.
+    """
+    def __init__(self, context, invoices: dict, tmp_dir: str, cache=None, bundle=None):
+        self.context = context
+        self.invoices = invoices
+        self.tmp_dir = tmp_dir
+        self.cache = cache
+        self.bundle = bundle
+        self.workers = context.config.getint('DOWNLOADER', 'WORKERS', fallback=DEFAULT_WORKERS)
+        self.pool_size = context.config.getint('DOWNLOADER', 'POOL-SIZE', fallback=DEFAULT_POOL_SIZE)
+        self.retry_passes = context.config.getint('DOWNLOADER', 'RETRY-PASSES', fallback=DEFAULT_RETRY_PASSES)
+        self.downloaded_count = 0
+        self.local = threading.local()
+        self.sessions = list()
+        self.sessions_lock = threading.Lock()
+
+    def run(self) -> list:
+        """download every invoice and return the (invoice, error message) of the ones failed, already logged"""
+        pending = self.resolve_cached()
+        failed = self.retry_failed(self.fetch_pending(pending))
+        for _, error in failed:
+            self.context.error(error)
+        return failed
+
+    def resolve_cached(self) -> list:
+        """mark the invoices in the cache as downloaded, adding them to the bundle, and return the ones to download"""
+        pending = list()
+        for invoice in self.invoices.values():
+            cached_path = None
+            if self.cache is not None and not self.context.force_refresh:
+                cached_path = self.cache.get(invoice["id"])
+            if cached_path is None:
+                pending.append(invoice)
+                continue
+            invoice["path"] = cached_path
+            invoice["hash"] = os.path.splitext(os.path.basename(cached_path))[0]  # the cache names the pdfs by content hash
+            invoice["good"] = True
+            self.downloaded_count += 1
+            if self.context.verbose:
+                self.context.log("%d/%d fattura %s già presente in cache\n" % (self.downloaded_count, len(self.invoices), invoice["id"]))
+            if self.bundle is not None:
+                self.context.check_cancelled()
+                self.add_to_bundle(invoice)
+        return pending
+
+    def retry_failed(self, failed: list) -> list:
+        """download again the failed invoices for up to RETRY-PASSES passes, return the ones still failed"""
+        for _ in range(self.retry_passes):
+            if not failed:
+                break
+            if self.context.verbose:
+                for _, error in failed:
+                    self.context.error(error)
+            self.context.log("Nuovo tentativo di download di %d fatture\n" % len(failed))
+            failed = self.fetch_pending([invoice for invoice, _ in failed])
+        return failed
+
+    def fetch_pending(self, pending: list) -> list:
+        """download the pending invoices in the worker pool, return the (invoice, error message) of the failed ones"""
+        failed = list()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.workers), initializer=self.init_worker) as executor:
+            futures = {executor.submit(self.download_worker, invoice): invoice for invoice in pending}
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    invoice = futures[future]
+                    error = future.result()
+                    if error is not None:
+                        failed.append((invoice, error))
+                        continue
+                    self.downloaded_count += 1
+                    if self.context.verbose:
+                        self.context.log("%d/%d scaricata fattura %s in %s\n" % (self.downloaded_count, len(self.invoices), invoice["id"], invoice["path"]))
+                    if self.bundle is not None:
+                        self.add_to_bundle(invoice)
+            except exc.ActionError:
+                for future in futures:
+                    future.cancel()
+                raise
+        return failed
+
+    def init_worker(self):
+        """give the worker thread a warm session, or a new one sharing the cookies of the login"""
+        session = self.context.warmer.take_session() if self.context.warmer is not None else None
+        if session is None:
+            session = http_client.clone_session(self.context.session, self.pool_size)
+        self.local.session = session
+        with self.sessions_lock:
+            self.sessions.append(session)
+
+    def check_cancelled(self, *_):
+        """progress of the downloads, raising if the run is cancelled or past its deadline"""
+        self.context.check_cancelled()
+        self.context.http_policy.check_deadline()
+
+    def download_worker(self, invoice: dict):
+        """download_invoice in a worker thread"""
+        self.context.check_cancelled()
+        return download_invoice(self.local.session, invoice, self.tmp_dir, self.cache, progress=self.check_cancelled,
+                                run_metrics=self.context.metrics, policy=self.context.http_policy)
+
+    def add_to_bundle(self, invoice: dict):
+        """copy a downloaded invoice in the bundle, removing the temporary file"""
+        with self.context.metrics.stage('bundle_write') as stage:
+            stage.bytes = self.bundle.add(invoice["id"], invoice["type"], invoice["path"])
+        if invoice["type"] not in invoice_bundle.TYPE_FOLDERS:
+            self.context.error("Errore: la fattura %s ha tipo sconosciuto %s\n" % (invoice["id"], invoice["type"]))
+        if os.path.dirname(invoice["path"]) == self.tmp_dir:
+            os.remove(invoice["path"])
+
+    def close(self):
+        """close the worker sessions and save the cache index, a failed save is only logged"""
+        for session in self.sessions:
+            session.close()
+        if self.cache is not None:
+            try:
+                self.cache.save()
+            except OSError as e:
+                self.context.log("Impossibile salvare l'indice della cache delle fatture: %s\n" % e)
+
+def write_bundle_output(context, bundle, invoices: dict) -> bool:
+    """report the zip bundle written and record its invoices in the catalog"""
+    context.success("Il file .zip contenente %d documenti si trova in %s\n" % (len(bundle), bundle.output_path))
+    record_in_catalog(context, invoices.values(), bundle.output_path)
+    context.metrics.set_output(bundle.output_path)
+    metrics.write_summary(context)
+    return True
+
+def merge_pdfs(context, invoices: dict, outputs: dict) -> dict:
+    """merge the downloaded invoices in the outputs pdfs by type, return the (input size, written size) of each"""
+    optimize = context.config.getboolean('DOWNLOADER', 'OPTIMIZE-PDF', fallback=True)
+    with pdf_merge.InvoiceMerger(outputs, optimize) as merger:
         for invoice_id, invoice in invoices.items():
+            context.check_cancelled()
             if invoice["good"]:
-                merger_all.append(PyPDF2.PdfFileReader(open(invoice["path"], "rb")))
-                if invoice["type"] == "Fattura":
-                    merger_ft.append(PyPDF2.PdfFileReader(open(invoice["path"], "rb")))
-                elif invoice["type"] == "Nota di credito":
-                    merger_nc.append(PyPDF2.PdfFileReader(open(invoice["path"], "rb")))
-                else:
-                    parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.RED, font=wx.Font(wx.FontInfo(8).Bold())))
-                    parent.log_dialog.log_text.AppendText("Errore: la fattura %s ha tipo sconosciuto %s\n" % (invoice_id, invoice["type"]))
-                    parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-        merger_all.write(output_all_file_path)
-        merger_ft.write(output_ft_file_path)
-        merger_nc.write(output_nc_file_path)
+                with context.metrics.stage('pdf_merge'):
+                    if invoice["type"] in outputs:
+                        merger.add(invoice["path"], ("all", invoice["type"]))
+                    else:
+                        merger.add(invoice["path"], ("all",))
+                        context.error("Errore: la fattura %s ha tipo sconosciuto %s\n" % (invoice_id, invoice["type"]))
+        with context.metrics.stage('pdf_write') as stage:
+            sizes = merger.write()
+            stage.bytes = sum(written_size for _, written_size in sizes.values())
+    return sizes
+
+def write_pdf_outputs(context, invoices: dict, owner_name: str, tmp_dir: str) -> bool:
+    """merge the downloaded invoices in the all, invoices and credit notes pdfs, return False if no output has been chosen"""
+    output_all_file_path = context.ask_pdf_output_path("fatture_%s.pdf" % owner_name)
+    if output_all_file_path is None:
+        context.error("Non è stata eseguita l'unione delle fatture in un singolo pdf.\nLe singole fatture si trovano in %s\n" % tmp_dir)
+        return False
+
+    path, ext = os.path.splitext(output_all_file_path)
+    output_ft_file_path = path+"_ft"+ext
+    output_nc_file_path = path+"_nc"+ext
+
+    outputs = {
+        "all": output_all_file_path,
+        "Fattura": output_ft_file_path,
+        "Nota di credito": output_nc_file_path,
+    }
+    try:
+        sizes = merge_pdfs(context, invoices, outputs)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    for key, (input_size, written_size) in sizes.items():
+        if input_size:
+            context.log("%s: %s, le fatture unite occupavano %s (%.0f%% in meno)\n" % (
+                os.path.basename(outputs[key]), format_size(written_size), format_size(input_size), 100*(1-written_size/input_size)))
+
+    context.success("Il pdf contenente tutti i documenti si trova in %s\n" % output_all_file_path)
+    context.success("Il pdf contenente tutti le fatture si trova in %s\n" % output_ft_file_path)
+    context.success("Il pdf contenente tutti le note di credito si trova in %s\n" % output_nc_file_path)
+    context.pdf_written(outputs)
+    record_in_catalog(context, invoices.values(), output_all_file_path)
+    context.metrics.set_output(output_all_file_path)
+    metrics.write_summary(context)
+    return True
+
+def download_invoices(context) -> bool:
+    """download invoices from CCSR, return True if the merged pdfs or the zip bundle have been written"""
+    context.log("Download file input\n")
+    report_format = report_server.get_report_format(context, 'DOWNLOADER', REPORT_FORMATS, 'xlsx')
+    input_file_paths = report_server.download_reports(context, report_format)
+    if input_file_paths is None:
+        return False
+    invoices_info = read_invoices_info(context, report_format, input_file_paths)
+    if invoices_info is None:
+        return False
+    owner_name, invoices = invoices_info
+
+    bundle = None
+    if get_output_mode(context) == OUTPUT_ZIP:
+        bundle = open_bundle(context, owner_name)
+        if bundle is None:
+            return False
+
+    context.log("Inizio download fatture dal portale CCSR\n")
+    tmp_dir = tempfile.mkdtemp()
+    downloader = InvoiceDownloader(context, invoices, tmp_dir, invoice_cache.open_cache(context.config), bundle)
+    try:
+        downloader.run()
+        if bundle is not None:
+            bundle.close(invoices)
+    except exc.ActionError:
         shutil.rmtree(tmp_dir, ignore_errors=True)
+        if bundle is not None:
+            bundle.discard()
+        raise
+    except OSError as e:
+        if bundle is None:
+            raise
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        bundle.discard()
+        context.error("ERRORE: impossibile scrivere il file %s: %s\n" % (bundle.output_path, e))
+        return False
+    finally:
+        downloader.close()
+
+    context.success("Download terminato.\n")
 
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.BLACK, font=wx.Font(wx.FontInfo(8).Bold())))
-        parent.log_dialog.log_text.AppendText("Il pdf contenente tutti i documenti si trova in %s\n" % output_all_file_path)
-        parent.log_dialog.log_text.AppendText("Il pdf contenente tutti le fatture si trova in %s\n" % output_ft_file_path)
-        parent.log_dialog.log_text.AppendText("Il pdf contenente tutti le note di credito si trova in %s\n" % output_nc_file_path)
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-        wx.Yield()
-        parent.log_dialog.open_file_btn.Enable()
-
-    else:
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.RED, font=wx.Font(wx.FontInfo(8).Bold())))
-        parent.log_dialog.log_text.AppendText("Non è stata eseguita l'unione delle fatture in un singolo pdf.\nLe singole fatture si trovano in %s\n" % tmp_dir)
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-        wx.Yield()
+    if bundle is not None:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return write_bundle_output(context, bundle, invoices)
+    return write_pdf_outputs(context, invoices, owner_name, tmp_dir)
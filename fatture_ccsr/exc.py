@@ -26,6 +26,12 @@ class NoFileError(FileError):
     def __init__(self):
         super(NoFileError, self).__init__(None, msg="Not setted or empty file path!")
 
+class InvalidReportError(FileError):
+    """Raised when a report is not valid, so that the invoices read from it cannot be trusted"""
+    def __init__(self, file_path, error):
+        super(InvalidReportError, self).__init__(file_path, msg="Report %s is not valid: %s" % (file_path, error))
+        self.error = error
+
 
 class ActionError(FattureSanRossoreError):
     """Basic exception for errors raised by actions"""
@@ -39,3 +45,43 @@ class InvalidActionError(ActionError):
     """Raised when an invalid action is used"""
     def __init__(self, action):
         super(InvalidActionError, self).__init__(action, "Invalid action %s" % action)
+
+class ActionCancelledError(ActionError):
+    """Raised inside a running action when the user cancels it"""
+    def __init__(self, action=None):
+        super(ActionCancelledError, self).__init__(action, "Action cancelled" if action is None else "Action %s cancelled" % action)
+
+class DeadlineExceededError(ActionError):
+    """Raised inside a running action when its deadline has passed"""
+    def __init__(self, deadline, action=None):
+        super(DeadlineExceededError, self).__init__(action, "Deadline of %d seconds exceeded" % deadline)
+        self.deadline = deadline
+
+
+class RequestError(FattureSanRossoreError):
+    """Basic exception for errors raised by the requests to the report server"""
+
+class RetryableStatusError(RequestError):
+    """Raised when the report server answers with a status worth retrying the request for"""
+    def __init__(self, url, status_code):
+        super(RetryableStatusError, self).__init__("Request to %s failed with status %d" % (url, status_code))
+        self.url = url
+        self.status_code = status_code
+
+
+class RecordError(FattureSanRossoreError):
+    """Basic exception for errors raised building TRAF2000 records"""
+
+class FieldOverflowError(RecordError):
+    """Raised when a value does not fit in its TRAF2000 field"""
+    def __init__(self, field, value, width):
+        super(FieldOverflowError, self).__init__("Value %s does not fit in the %d characters of field %s" % (value, width, field))
+        self.field = field
+        self.value = value
+        self.width = width
+
+class TooManyLinesError(RecordError):
+    """Raised when an invoice has more lines than a TRAF2000 record can hold"""
+    def __init__(self, invoice_num, lines, max_lines):
+        super(TooManyLinesError, self).__init__("Invoice %s has %d lines, at most %d are allowed" % (invoice_num, lines, max_lines))
+        self.invoice_num = invoice_num
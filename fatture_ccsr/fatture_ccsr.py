@@ -1,32 +1,52 @@
 """This utility is used for downloading or converting to TRAF2000 invoices from a CCSR .xlsx, .csv or .xml report file"""
 
+import startup
+if __name__ == "__main__":
+    startup.begin()
+
+# pylint: disable=wrong-import-position
 import os
 import sys
 import argparse
+import datetime
 import subprocess
 import atexit
+import queue
+import threading
+import multiprocessing
 import wx
 import wx.adv
 import requests
-import requests_ntlm
 import configparser
 
-import downloader
-import traf2000_converter
+import connection_warmer
+import exc
+import report_server
+import run_context
+# pylint: enable=wrong-import-position
+
+startup.phase("imports")
 
 LOGIN_ACTION = 0
 LOGOUT_ACTION = 1
 DOWNLOAD_ACTION = 10
 CONVERT_ACTION = 20
+BOTH_ACTION = 30
+
+LOG_FLUSH_INTERVAL = 100  # ms between two flushes of the messages queued by a running action
 
 class FattureCCSRFrame(wx.Frame):
     """main application frame"""
     def __init__(self, *args, **kwds):
         self.verbose = False
+        self.force_refresh = False
+        self.profile = False
         try:
             parser = argparse.ArgumentParser(prog='fatture_ccsr')
             parser.add_argument('-v', '--verbose', action='store_true')
             parser.add_argument('-c', '--configfile', action='store', )
+            parser.add_argument('-f', '--force-refresh', action='store_true', help="ignore the invoices and reports caches and download everything again")
+            parser.add_argument('--profile', action='store_true', help="dump the cProfile stats of every action next to its output")
             input_args = parser.parse_args()
         except (argparse.ArgumentError, argparse.ArgumentTypeError) as e:
             print(f"Error in parsing arguments: {e}")
@@ -34,6 +54,10 @@ class FattureCCSRFrame(wx.Frame):
         
         if input_args.verbose:
             self.verbose = True
+        if input_args.force_refresh:
+            self.force_refresh = True
+        if input_args.profile:
+            self.profile = True
         if input_args.configfile:
             config_file = input_args.configfile
         else:
@@ -45,6 +69,7 @@ class FattureCCSRFrame(wx.Frame):
         except Exception as e:
             print(f"Error in reading the config file: {e}")
             sys.exit(2)
+        startup.phase("config")
 
         atexit.register(self.exit_handler)
 
@@ -54,11 +79,14 @@ class FattureCCSRFrame(wx.Frame):
 
         self._initial_locale = wx.Locale(wx.LANGUAGE_DEFAULT, wx.LOCALE_LOAD_DEFAULT)
 
-        self.input_files = list()
         self.log_dialog = None
+        self.context = None
+        self.log_queue = queue.Queue()
+        self.log_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.flush_log, self.log_timer)
         
-        self.session = requests.Session()
-        self.session.verify = self.config['REPORT_SERVER'].get('CA_BUNDLE', True)
+        self.session = report_server.new_session(self.config)
+        self.warmer = None
 
         self.panel = wx.Panel(self, wx.ID_ANY, style=wx.BORDER_NONE | wx.FULL_REPAINT_ON_RESIZE | wx.TAB_TRAVERSAL)
         self.main_sizer = wx.BoxSizer(wx.VERTICAL)
@@ -73,6 +101,7 @@ class FattureCCSRFrame(wx.Frame):
         self.login_dlg = LoginDialog(self)
         self.output_traf2000_dialog = wx.FileDialog(self.panel, "Scegli dove salvare il file TRAF2000", defaultFile="TRAF2000", style=wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT)
         self.output_pdf_dialog = wx.FileDialog(self.panel, "Scegli dove salvare il .pdf con le fatture scaricate", defaultFile="fatture.pdf", style=wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT)
+        self.output_zip_dialog = wx.FileDialog(self.panel, "Scegli dove salvare il .zip con le fatture scaricate", defaultFile="fatture.zip", style=wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT)
 
         self.login_btn = wx.Button(self.panel, LOGIN_ACTION, "Login")
         self.login_btn.SetFocus()
@@ -114,6 +143,11 @@ class FattureCCSRFrame(wx.Frame):
         self.traf2000_btn.Bind(wx.EVT_BUTTON, self.btn_onclick)
         action_sizer.Add(self.traf2000_btn, 0, wx.ALL, 2)
 
+        self.both_btn = wx.Button(self.panel, BOTH_ACTION, "Scarica e genera TRAF2000")
+        self.both_btn.Enable(False)
+        self.both_btn.Bind(wx.EVT_BUTTON, self.btn_onclick)
+        action_sizer.Add(self.both_btn, 0, wx.ALL, 2)
+
         self.panel.SetSizer(self.main_sizer)
 
         self.main_sizer.Fit(self)
@@ -124,6 +158,7 @@ class FattureCCSRFrame(wx.Frame):
         """enable and show what needed after login"""
         self.download_btn.Enable()
         self.traf2000_btn.Enable()
+        self.both_btn.Enable()
         self.start_date_picker.Enable()
         self.end_date_picker.Enable()
         self.login_btn.Hide()
@@ -135,6 +170,7 @@ class FattureCCSRFrame(wx.Frame):
         """disable and hide what needed after logout"""
         self.download_btn.Disable()
         self.traf2000_btn.Disable()
+        self.both_btn.Disable()
         self.start_date_picker.Disable()
         self.end_date_picker.Disable()
         self.login_dlg.disconnect()
@@ -146,7 +182,7 @@ class FattureCCSRFrame(wx.Frame):
         """event raised when a button is clicked"""
         btn_id = event.GetEventObject().GetId()
 
-        if btn_id not in (LOGIN_ACTION, LOGOUT_ACTION, DOWNLOAD_ACTION, CONVERT_ACTION):
+        if btn_id not in (LOGIN_ACTION, LOGOUT_ACTION, DOWNLOAD_ACTION, CONVERT_ACTION, BOTH_ACTION):
             pass
         elif btn_id == LOGIN_ACTION:
             self.login_dlg.ShowModal()
@@ -159,22 +195,167 @@ class FattureCCSRFrame(wx.Frame):
         elif not self.login_dlg.logged_in:
             pass
 
+        elif self.context is not None:
+            pass
+
         elif btn_id == DOWNLOAD_ACTION:
-            self.log_dialog = LogDialog(self, action = DOWNLOAD_ACTION)
-            self.log_dialog.Show()
-            downloader.download_invoices(self)
-            self.log_dialog.close_btn.Enable()
+            self.start_action(DOWNLOAD_ACTION, [run_context.download_invoices])
 
         elif btn_id == CONVERT_ACTION:
-            self.log_dialog = LogDialog(self, action = CONVERT_ACTION)
-            self.log_dialog.Show()
-            traf2000_converter.convert(self)
-            self.log_dialog.close_btn.Enable()
+            self.start_action(CONVERT_ACTION, [run_context.convert])
+
+        elif btn_id == BOTH_ACTION:
+            self.start_action(BOTH_ACTION, [run_context.download_invoices, run_context.convert])
+
+    def start_action(self, action: int, action_funcs: list):
+        """open the log dialog and run action_funcs on a worker thread"""
+        self.log_dialog = LogDialog(self, action = action)
+        self.log_dialog.Show()
+        self.context = GuiContext(self)
+        self.download_btn.Disable()
+        self.traf2000_btn.Disable()
+        self.both_btn.Disable()
+        self.logout_btn.Disable()
+        if self.warmer is not None:
+            self.warmer.pause()
+        self.log_timer.Start(LOG_FLUSH_INTERVAL)
+        threading.Thread(target=self.run_action, args=(action_funcs, self.context), daemon=True).start()
+
+    def run_action(self, action_funcs: list, context):
+        """body of the worker thread"""
+        try:
+            run_context.run_actions(context, action_funcs, self.profile)
+        except exc.ActionCancelledError:
+            context.error("Operazione annullata.\n")
+        except exc.DeadlineExceededError as e:
+            context.error("ERRORE: superato il tempo massimo dell'operazione (%d secondi).\n" % e.deadline)
+        except Exception as e: # pylint: disable=broad-except
+            context.error("ERRORE: %s\n" % e)
+        finally:
+            context.cleanup()
+            wx.CallAfter(self.on_action_done)
+
+    def on_action_done(self):
+        """flush the last messages and enable the buttons again"""
+        self.log_timer.Stop()
+        self.flush_log()
+        self.context = None
+        self.log_dialog.close_btn.Enable()
+        self.log_dialog.cancel_btn.Disable()
+        self.download_btn.Enable()
+        self.traf2000_btn.Enable()
+        self.both_btn.Enable()
+        self.logout_btn.Enable()
+        if self.warmer is not None:
+            self.warmer.resume()
+
+    def cancel_action(self):
+        """ask the running action to stop"""
+        if self.context is not None:
+            self.context.cancel()
+            self.log_dialog.cancel_btn.Disable()
+            self.log_queue.put(("log_text", wx.RED, "Annullamento in corso...\n"))
+
+    def flush_log(self, _=None):
+        """write the queued messages to the log dialog, joining the consecutive ones of the same style"""
+        pending = list()
+        while True:
+            try:
+                pending.append(self.log_queue.get_nowait())
+            except queue.Empty:
+                break
+        if not pending or self.log_dialog is None:
+            return
+        text_ctrl_name, colour, _ = pending[0]
+        texts = list()
+        for entry in pending + [(None, None, None)]:
+            if entry[:2] != (text_ctrl_name, colour):
+                text_ctrl = getattr(self.log_dialog, text_ctrl_name)
+                if colour is not None:
+                    text_ctrl.SetDefaultStyle(wx.TextAttr(colour, font=wx.Font(wx.FontInfo(8).Bold())))
+                text_ctrl.AppendText(''.join(texts))
+                if colour is not None:
+                    text_ctrl.SetDefaultStyle(wx.TextAttr())
+                text_ctrl_name, colour = entry[:2]
+                texts = list()
+            texts.append(entry[2])
+
+    def ask_output_path(self, file_dialog, default_name: str = None):
+        """flush the log and show file_dialog, return the chosen path or None"""
+        self.flush_log()
+        if default_name is not None:
+            file_dialog.SetFilename(default_name)
+        if file_dialog.ShowModal() == wx.ID_OK:
+            return file_dialog.GetPath()
+        return None
 
     def exit_handler(self):
         """clean the environment befor exiting"""
-        for input_file in self.input_files:
-            os.remove(input_file)
+        if self.context is not None:
+            self.context.cancel()
+            self.context.cleanup()
+        if self.warmer is not None:
+            self.warmer.stop()
+
+def wx_date(value) -> datetime.date:
+    """convert a wx.DateTime to a date"""
+    return datetime.date(value.GetYear(), value.GetMonth()+1, value.GetDay())
+
+def call_in_gui(func, *args):
+    """run func on the gui thread and return its result, blocking the calling worker thread"""
+    done = threading.Event()
+    result = list()
+    def call():
+        try:
+            result.append(func(*args))
+        finally:
+            done.set()
+    wx.CallAfter(call)
+    done.wait()
+    return result[0] if result else None
+
+class GuiContext(run_context.RunContext):
+    """run context of an action running on a worker thread
+
+    Messages are queued and written to the log dialog in batches by the frame timer, file dialogs
+    are shown on the gui thread while the worker waits for the answer.
+    """
+    def __init__(self, frame):
+        super(GuiContext, self).__init__(frame.config, frame.session, wx_date(frame.start_date_picker.GetValue()), wx_date(frame.end_date_picker.GetValue()), frame.verbose, frame.force_refresh)
+        self.frame = frame
+        self.warmer = frame.warmer
+
+    def log(self, text: str):
+        """queue a message for the log dialog"""
+        self.frame.log_queue.put(("log_text", None, text))
+
+    def error(self, text: str):
+        """queue a bold red message for the log dialog"""
+        self.frame.log_queue.put(("log_text", wx.RED, text))
+
+    def success(self, text: str):
+        """queue a bold black message for the log dialog"""
+        self.frame.log_queue.put(("log_text", wx.BLACK, text))
+
+    def credit_note(self, text: str):
+        """queue a message for the credit notes panel"""
+        self.frame.log_queue.put(("nc_text", None, text))
+
+    def ask_pdf_output_path(self, default_name: str):
+        """ask the merged pdf path with a file dialog"""
+        return call_in_gui(self.frame.ask_output_path, self.frame.output_pdf_dialog, default_name)
+
+    def ask_zip_output_path(self, default_name: str):
+        """ask the zip bundle path with a file dialog"""
+        return call_in_gui(self.frame.ask_output_path, self.frame.output_zip_dialog, default_name)
+
+    def ask_traf2000_output_path(self):
+        """ask the TRAF2000 file path with a file dialog"""
+        return call_in_gui(self.frame.ask_output_path, self.frame.output_traf2000_dialog)
+
+    def pdf_written(self, output_paths: dict):
+        """let the log dialog open the written pdfs"""
+        wx.CallAfter(self.frame.log_dialog.enable_open_pdf, list(output_paths.values()))
 
 class LogDialog(wx.Dialog):
     """logging panel"""
@@ -185,6 +366,8 @@ class LogDialog(wx.Dialog):
         wx.Dialog.__init__(self, *args, **kwds)
         self.SetTitle("Log")
 
+        self.output_paths = list()
+
         main_sizer = wx.BoxSizer(wx.VERTICAL)
 
         log_sizer = wx.BoxSizer(wx.HORIZONTAL)
@@ -202,12 +385,16 @@ class LogDialog(wx.Dialog):
         self.close_btn.Enable(False)
         btn_sizer.Add(self.close_btn, 0, wx.ALL, 2)
 
-        if action == CONVERT_ACTION:
+        self.cancel_btn = wx.Button(self, wx.ID_ANY, "Annulla")
+        self.cancel_btn.Bind(wx.EVT_BUTTON, self.on_cancel)
+        btn_sizer.Add(self.cancel_btn, 0, wx.ALL, 2)
+
+        if action in (CONVERT_ACTION, BOTH_ACTION):
             self.nc_text = wx.TextCtrl(self, wx.ID_ANY, "", style=wx.HSCROLL | wx.TE_MULTILINE | wx.TE_READONLY)
             self.nc_text.SetMinSize((250, 200))
             log_sizer.Add(self.nc_text, 0, wx.ALL | wx.EXPAND, 2)
 
-        elif action == DOWNLOAD_ACTION:
+        if action in (DOWNLOAD_ACTION, BOTH_ACTION):
             self.open_file_btn = wx.Button(self, wx.ID_ANY, "Apri pdf")
             self.open_file_btn.Bind(wx.EVT_BUTTON, self.open_pdf)
             self.open_file_btn.Enable(False)
@@ -223,21 +410,23 @@ class LogDialog(wx.Dialog):
         self.ScrollPages(-1)
         event.Skip()
 
+    def on_cancel(self, _):
+        """cancel the running action"""
+        self.GetParent().cancel_action()
+
+    def enable_open_pdf(self, output_paths: list):
+        """enable the button opening the written pdfs"""
+        self.output_paths = output_paths
+        self.open_file_btn.Enable()
+
     def open_pdf(self, _):
-        """open a file with the default software"""
-        output_all_file_path = self.GetParent().output_pdf_dialog.GetPath()
-        path, ext = os.path.splitext(output_all_file_path)
-        output_ft_file_path = path+"_ft"+ext
-        output_nc_file_path = path+"_nc"+ext
-        if sys.platform == "win32":
-            os.startfile(output_all_file_path) # pylint: disable=maybe-no-member
-            os.startfile(output_ft_file_path) # pylint: disable=maybe-no-member
-            os.startfile(output_nc_file_path) # pylint: disable=maybe-no-member
-        else:
-            opener = "open" if sys.platform == "darwin" else "xdg-open"
-            subprocess.call([opener, output_all_file_path])
-            subprocess.call([opener, output_ft_file_path])
-            subprocess.call([opener, output_nc_file_path])
+        """open the written pdfs with the default software"""
+        for output_path in self.output_paths:
+            if sys.platform == "win32":
+                os.startfile(output_path) # pylint: disable=maybe-no-member
+            else:
+                opener = "open" if sys.platform == "darwin" else "xdg-open"
+                subprocess.call([opener, output_path])
 
 class LoginDialog(wx.Dialog):
     """login dialog for basic auth download"""
@@ -291,18 +480,19 @@ class LoginDialog(wx.Dialog):
 
     def disconnect(self):
         """close session and reset input fields"""
+        if self.GetParent().warmer is not None:
+            self.GetParent().warmer.stop()
+            self.GetParent().warmer = None
         self.GetParent().session.close()
         self.logged_in = False
 
     def on_login(self, _):
         """check credentials and login"""
         if self.username.GetValue() not in ("", None) and self.password.GetValue() not in ("", None):
-            session = self.GetParent().session
-            session.auth = requests_ntlm.HttpNtlmAuth("sanrossore\\"+self.username.GetValue(), self.password.GetValue())
             try:
-                login = session.get(self.GetParent().config['REPORT_SERVER']['URL']+'/Reports/browse/')
-                if login.status_code == 200:
+                if report_server.login(self.GetParent().session, self.GetParent().config, self.username.GetValue(), self.password.GetValue()):
                     self.logged_in = True
+                    self.GetParent().warmer = connection_warmer.start_warmer(self.GetParent().session, self.GetParent().config)
                     self.username.SetValue('')
                     self.password.SetValue('')
                     self.Close()
@@ -318,10 +508,13 @@ class FattureCCSR(wx.App):
     def OnInit(self): # pylint: disable=invalid-name
         """execute on app initialization"""
         self.fatture_ccsr_frame = FattureCCSRFrame(None, wx.ID_ANY, "") # pylint: disable=attribute-defined-outside-init
+        startup.phase("frame built")
         self.SetTopWindow(self.fatture_ccsr_frame)
         self.fatture_ccsr_frame.Show()
+        startup.end("window shown")
         return True
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     fattureCCSR = FattureCCSR(0)
     fattureCCSR.MainLoop()
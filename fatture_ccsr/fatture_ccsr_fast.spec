@@ -0,0 +1,58 @@
+# -*- mode: python ; coding: utf-8 -*-
+# one-folder build tuned for a fast launch: nothing is unpacked to a temporary folder at every start,
+# the binaries are not upx compressed and only the modules the app imports are bundled
+# build it with: pyinstaller --clean ./fatture_ccsr_fast.spec
+
+hiddenimports = [
+    'lxml.etree',
+    'lxml._elementpath',
+    'downloader',  # imported when the action runs
+    'traf2000_converter',
+]
+
+excludes = [
+    'tkinter',
+    'numpy',  # optional in openpyxl
+    'PIL',
+    'pandas',
+    'unittest',
+    'pydoc',
+    'lxml.html',
+    'lxml.isoschematron',
+    'lxml.objectify',
+]
+
+
+block_cipher = None
+
+
+a = Analysis(['fatture_ccsr.py'],
+             binaries=[],
+             datas=[('.\\res\\schema.xsd', 'res')],
+             hiddenimports=hiddenimports,
+             hookspath=[],
+             runtime_hooks=[],
+             excludes=excludes,
+             win_no_prefer_redirects=False,
+             win_private_assemblies=False,
+             cipher=block_cipher,
+             noarchive=False)
+pyz = PYZ(a.pure, a.zipped_data,
+             cipher=block_cipher)
+exe = EXE(pyz,
+          a.scripts,
+          [],
+          exclude_binaries=True,
+          name='fatture_ccsr',
+          debug=False,
+          bootloader_ignore_signals=False,
+          strip=False,
+          upx=False,
+          console=False )
+coll = COLLECT(exe,
+               a.binaries,
+               a.zipfiles,
+               a.datas,
+               strip=False,
+               upx=False,
+               name='fatture_ccsr')
@@ -0,0 +1,133 @@
+"""timeouts, retries with backoff and the deadline of the requests to the report server"""
+
+import copy
+import time
+import random
+import requests
+import requests.adapters
+
+import exc
+
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 60.0
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5  # seconds, the longest wait before the first retry, doubled at every retry
+DEFAULT_BACKOFF_MAX = 30.0
+DEFAULT_DEADLINE = 0  # seconds a run may last, 0 for no deadline
+
+RETRY_STATUSES = frozenset((408, 429, 500, 502, 503, 504))
+RETRY_EXCEPTIONS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    exc.RetryableStatusError,
+)
+
+class RequestPolicy:
+    """connect and read timeouts, retries with exponential backoff and jitter and the deadline of a run
+
+    Every attempt of call gets the timeouts, capped to the time left before the deadline. A failed
+    attempt is retried after a random wait of up to backoff*2**retry seconds (at most backoff_max)
+    until the retries are exhausted or the wait would pass the deadline. Setting cancel_event
+    interrupts the wait with ActionCancelledError.
+    """
+    def __init__(self, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF, backoff_max: float = DEFAULT_BACKOFF_MAX, deadline: float = DEFAULT_DEADLINE, cancel_event=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.deadline_at = time.monotonic()+deadline if deadline > 0 else None
+        self.cancel_event = cancel_event
+
+    @classmethod
+    def from_config(cls, config, cancel_event=None):
+        """return the policy set in the [REPORT_SERVER] section, its deadline starts now"""
+        return cls(
+            config.getfloat('REPORT_SERVER', 'CONNECT-TIMEOUT', fallback=DEFAULT_CONNECT_TIMEOUT),
+            config.getfloat('REPORT_SERVER', 'READ-TIMEOUT', fallback=DEFAULT_READ_TIMEOUT),
+            config.getint('REPORT_SERVER', 'RETRIES', fallback=DEFAULT_RETRIES),
+            config.getfloat('REPORT_SERVER', 'BACKOFF', fallback=DEFAULT_BACKOFF),
+            config.getfloat('REPORT_SERVER', 'BACKOFF-MAX', fallback=DEFAULT_BACKOFF_MAX),
+            config.getfloat('REPORT_SERVER', 'DEADLINE', fallback=DEFAULT_DEADLINE),
+            cancel_event,
+        )
+
+    def remaining(self):
+        """return the seconds left before the deadline, None without a deadline"""
+        if self.deadline_at is None:
+            return None
+        return self.deadline_at-time.monotonic()
+
+    def check_deadline(self):
+        """raise DeadlineExceededError if the deadline has passed"""
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise exc.DeadlineExceededError(self.deadline)
+
+    def timeout(self) -> tuple:
+        """return the (connect, read) timeouts of a request, capped to the time left before the deadline"""
+        remaining = self.remaining()
+        if remaining is None:
+            return self.connect_timeout, self.read_timeout
+        return min(self.connect_timeout, remaining), min(self.read_timeout, remaining)
+
+    def backoff_wait(self, retry: int) -> float:
+        """return the random wait before the retry-th retry"""
+        return random.uniform(0, min(self.backoff_max, self.backoff*2**retry))
+
+    def wait(self, seconds: float):
+        """sleep for seconds, raise ActionCancelledError if the run is cancelled meanwhile"""
+        if self.cancel_event is None:
+            time.sleep(seconds)
+        elif self.cancel_event.wait(seconds):
+            raise exc.ActionCancelledError()
+
+    def call(self, attempt_func, on_retry=None):
+        """return attempt_func(timeout), calling it again after a backoff while it raises one of RETRY_EXCEPTIONS
+
+        on_retry, if given, is called as on_retry(error, retry, wait) before waiting; the error of
+        the last attempt is raised when no retry is left, DeadlineExceededError if the deadline
+        passes first
+        """
+        retry = 0
+        while True:
+            self.check_deadline()
+            try:
+                return attempt_func(self.timeout())
+            except requests.exceptions.SSLError:
+                raise
+            except RETRY_EXCEPTIONS as e:
+                self.check_deadline()
+                if retry >= self.retries:
+                    raise
+                wait = self.backoff_wait(retry)
+                remaining = self.remaining()
+                if remaining is not None and wait >= remaining:
+                    raise exc.DeadlineExceededError(self.deadline) from e
+                retry += 1
+                if on_retry is not None:
+                    on_retry(e, retry, wait)
+                self.wait(wait)
+
+def check_status(resp):
+    """raise RetryableStatusError, closing resp, if its status is worth a retry"""
+    if resp.status_code in RETRY_STATUSES:
+        resp.close()
+        raise exc.RetryableStatusError(resp.url, resp.status_code)
+
+def mount_adapter(session, pool_size: int):
+    """mount on session an adapter keeping up to pool_size connections alive, the retries are left to RequestPolicy"""
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+def clone_session(session, pool_size: int):
+    """create a new session with the same credentials of session and a connection pool of pool_size"""
+    new_session = requests.Session()
+    new_session.auth = copy.copy(session.auth)
+    new_session.verify = session.verify
+    mount_adapter(new_session, pool_size)
+    return new_session
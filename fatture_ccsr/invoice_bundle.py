@@ -0,0 +1,60 @@
+"""zip archive of the downloaded invoices, written while they are downloaded instead of merging them"""
+
+import io
+import os
+import csv
+import hashlib
+import zipfile
+
+MANIFEST_NAME = "manifest.csv"
+OTHER_FOLDER = "Altro"  # folder of the invoices of an unknown type
+TYPE_FOLDERS = ("Fattura", "Nota di credito")
+COPY_CHUNK_SIZE = 64*1024
+
+class InvoiceBundle:
+    """zip archive the invoice pdfs are copied into one at a time, in a folder per type, with a csv manifest
+
+    The pdfs are stored without compression, as they already are compressed, and each is read once
+    to copy and hash it, so it can be removed right after add. The manifest lists the invoices in
+    the order given to close.
+    """
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.zip_file = zipfile.ZipFile(output_path, 'w', zipfile.ZIP_STORED)
+        self.entries = dict()
+
+    def add(self, invoice_id: str, invoice_type: str, file_path: str) -> int:
+        """copy the pdf of an invoice in the folder of its type and return its size"""
+        folder = invoice_type if invoice_type in TYPE_FOLDERS else OTHER_FOLDER
+        entry_name = "%s/%s.pdf" % (folder, invoice_id)
+        digest = hashlib.sha256()
+        size = 0
+        with open(file_path, 'rb') as input_file, self.zip_file.open(entry_name, 'w') as entry:
+            for chunk in iter(lambda: input_file.read(COPY_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                entry.write(chunk)
+                size += len(chunk)
+        self.entries[invoice_id] = (invoice_id, invoice_type, entry_name, size, digest.hexdigest())
+        return size
+
+    def close(self, invoice_ids=None):
+        """write the manifest, listing the invoices in the order of invoice_ids if given, and close the archive"""
+        if invoice_ids is None:
+            invoice_ids = self.entries
+        manifest = io.StringIO(newline='')
+        writer = csv.writer(manifest)
+        writer.writerow(("id", "type", "file", "bytes", "sha256"))
+        writer.writerows(self.entries[invoice_id] for invoice_id in invoice_ids if invoice_id in self.entries)
+        self.zip_file.writestr(MANIFEST_NAME, manifest.getvalue())
+        self.zip_file.close()
+        self.zip_file = None
+
+    def discard(self):
+        """close and remove the archive"""
+        if self.zip_file is not None:
+            self.zip_file.close()
+            self.zip_file = None
+        os.remove(self.output_path)
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,167 @@
+"""persistent content-addressed cache of the downloaded invoices, keyed by invoice id"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.fatture_ccsr', 'cache')
+DEFAULT_MAX_SIZE_MB = 500
+DEFAULT_MAX_AGE_DAYS = 30
+INDEX_FILE_NAME = 'index.json'
+HASH_CHUNK_SIZE = 64*1024
+
+def file_sha256(file_path: str) -> str:
+    """return the hex sha256 digest of a file content"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_index(index_path: str) -> dict:
+    """return the entries of an index file, empty if missing or not valid"""
+    try:
+        with open(index_path, 'r', encoding='utf-8') as index_file:
+            return json.load(index_file)
+    except (OSError, ValueError):
+        return dict()
+
+def write_index(index_path: str, entries: dict):
+    """atomically write an index file through a temporary file of its own, so concurrent writers do not mix"""
+    index_file = tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=os.path.dirname(index_path), prefix=INDEX_FILE_NAME+'.', suffix='.tmp', delete=False)
+    try:
+        with index_file:
+            json.dump(entries, index_file)
+        os.replace(index_file.name, index_path)
+    except BaseException:
+        try:
+            os.remove(index_file.name)
+        except OSError:
+            pass
+        raise
+
+class InvoiceCache:
+    """on-disk cache mapping every invoice id to the sha256 of its pdf, stored once per content
+
+    The cache may be shared by concurrent runs: saving merges the index on disk with this one and a
+    pdf is removed only when an entry of this instance expired or was evicted, or when the file
+    is older than max_age, never just because the index does not list it.
+    """
+    def __init__(self, cache_dir: str, max_size: int, max_age: float):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.max_age = max_age
+        self.index_path = os.path.join(cache_dir, INDEX_FILE_NAME)
+        self.lock = threading.Lock()
+        self.dropped = set()  # ids whose entry this instance expired or evicted
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.entries = read_index(self.index_path)
+
+    def blob_path(self, content_hash: str) -> str:
+        """return the path where a content is stored"""
+        return os.path.join(self.cache_dir, content_hash[:2], content_hash+'.pdf')
+
+    def get(self, invoice_id: str):
+        """return the cached pdf path of invoice_id or None on a miss"""
+        with self.lock:
+            entry = self.entries.get(invoice_id)
+            if entry is None:
+                return None
+            path = self.blob_path(entry["hash"])
+            if time.time() - entry["stored"] > self.max_age or not os.path.isfile(path):
+                del self.entries[invoice_id]
+                self.dropped.add(invoice_id)
+                return None
+            entry["accessed"] = time.time()
+            return path
+
+    def put(self, invoice_id: str, file_path: str, content_hash: str = None) -> str:
+        """store a copy of file_path as the content of invoice_id and return the cached path"""
+        if content_hash is None:
+            content_hash = file_sha256(file_path)
+        path = self.blob_path(content_hash)
+        with self.lock:
+            if os.path.isfile(path):
+                os.utime(path)  # a content stored again is not old
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = path+'.%d.%d.tmp' % (os.getpid(), threading.get_ident())
+                shutil.copyfile(file_path, tmp_path)
+                os.replace(tmp_path, path)
+            now = time.time()
+            self.entries[invoice_id] = {
+                "hash": content_hash,
+                "size": os.path.getsize(path),
+                "stored": now,
+                "accessed": now,
+            }
+            self.dropped.discard(invoice_id)
+        return path
+
+    def evict(self):
+        """drop expired entries, then the least recently used ones until the cache fits max_size
+
+        the pdfs of the dropped entries no other entry refers to are removed, with any pdf older
+        than max_age
+        """
+        with self.lock:
+            now = time.time()
+            dropped_hashes = set()
+            for invoice_id in [k for k, v in self.entries.items() if now - v["stored"] > self.max_age]:
+                dropped_hashes.add(self.entries.pop(invoice_id)["hash"])
+                self.dropped.add(invoice_id)
+
+            blobs = dict()
+            for entry in self.entries.values():
+                blobs[entry["hash"]] = max(blobs.get(entry["hash"], 0), entry["accessed"])
+            sizes = {v["hash"]: v["size"] for v in self.entries.values()}
+            total_size = sum(sizes.values())
+            for content_hash in sorted(blobs, key=blobs.get):
+                if total_size <= self.max_size:
+                    break
+                total_size -= sizes[content_hash]
+                del blobs[content_hash]
+                dropped_hashes.add(content_hash)
+            for invoice_id in [k for k, v in self.entries.items() if v["hash"] not in blobs]:
+                del self.entries[invoice_id]
+                self.dropped.add(invoice_id)
+
+            for content_hash in dropped_hashes - set(blobs):
+                try:
+                    os.remove(self.blob_path(content_hash))
+                except OSError:
+                    pass
+            for dir_path, _, file_names in os.walk(self.cache_dir):
+                for file_name in file_names:
+                    if file_name.endswith('.pdf') and file_name[:-4] not in blobs:
+                        path = os.path.join(dir_path, file_name)
+                        try:
+                            if now - os.path.getmtime(path) > self.max_age:
+                                os.remove(path)
+                        except OSError:
+                            pass
+
+    def save(self):
+        """atomically write the cache index, keeping the entries other runs added meanwhile"""
+        with self.lock:
+            entries = read_index(self.index_path)
+            for invoice_id in self.dropped:
+                entries.pop(invoice_id, None)
+            entries.update(self.entries)
+            write_index(self.index_path, entries)
+
+def open_cache(config):
+    """return the InvoiceCache configured in config or None if disabled"""
+    if not config.getboolean('CACHE', 'ENABLED', fallback=True):
+        return None
+    cache_dir = os.path.expanduser(config.get('CACHE', 'PATH', fallback=DEFAULT_CACHE_DIR))
+    max_size = config.getint('CACHE', 'MAX-SIZE-MB', fallback=DEFAULT_MAX_SIZE_MB)*1024*1024
+    max_age = config.getfloat('CACHE', 'MAX-AGE-DAYS', fallback=DEFAULT_MAX_AGE_DAYS)*24*60*60
+    cache = InvoiceCache(cache_dir, max_size, max_age)
+    cache.evict()
+    return cache
@@ -0,0 +1,171 @@
+"""local sqlite catalog of the invoices met by the downloads and the conversions, queryable offline"""
+
+import os
+import time
+import sqlite3
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.expanduser('~'), '.fatture_ccsr', 'catalog.sqlite3')
+BATCH_SIZE = 5000  # rows upserted per transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id TEXT PRIMARY KEY,
+    type TEXT,
+    date TEXT,
+    customer TEXT,
+    cf TEXT,
+    total INTEGER,
+    withholding INTEGER,
+    stamp INTEGER,
+    url TEXT,
+    pdf_sha256 TEXT,
+    pdf_output TEXT,
+    downloaded_at REAL,
+    export_output TEXT,
+    exported_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS invoices_type_date ON invoices (type, date);
+CREATE INDEX IF NOT EXISTS invoices_date ON invoices (date);
+CREATE INDEX IF NOT EXISTS invoices_customer ON invoices (customer);
+CREATE INDEX IF NOT EXISTS invoices_cf ON invoices (cf);
+"""
+COLUMNS = ("id", "type", "date", "customer", "cf", "total", "withholding", "stamp", "url",
+           "pdf_sha256", "pdf_output", "downloaded_at", "export_output", "exported_at", "updated_at")
+
+# the values of a row left NULL by an action keep the ones recorded by the other
+UPSERT_DOWNLOADED = """
+INSERT INTO invoices (id, type, url, pdf_sha256, pdf_output, downloaded_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    type = excluded.type,
+    url = excluded.url,
+    pdf_sha256 = COALESCE(excluded.pdf_sha256, pdf_sha256),
+    pdf_output = COALESCE(excluded.pdf_output, pdf_output),
+    downloaded_at = COALESCE(excluded.downloaded_at, downloaded_at),
+    updated_at = excluded.updated_at
+"""
+UPSERT_IMPORTED = """
+INSERT INTO invoices (id, type, date, customer, cf, total, withholding, stamp, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    type = excluded.type,
+    date = excluded.date,
+    customer = excluded.customer,
+    cf = excluded.cf,
+    total = excluded.total,
+    withholding = excluded.withholding,
+    stamp = excluded.stamp,
+    updated_at = excluded.updated_at
+"""
+MARK_EXPORTED = "UPDATE invoices SET export_output = ?, exported_at = ?, updated_at = ? WHERE id = ?"
+
+def catalog_id(invoice_id: str) -> str:
+    """return the catalog id of a CCSR/00001/2020 number or of its CCSR-00001-2020 file name"""
+    return invoice_id.strip().replace('-', '/')
+
+def iso_date(ddmmyyyy: str) -> str:
+    """return the YYYY-MM-DD date of a TRAF2000 DDMMYYYY date"""
+    return "%s-%s-%s" % (ddmmyyyy[4:], ddmmyyyy[2:4], ddmmyyyy[:2])
+
+class Catalog:
+    """sqlite table of the invoices, one row per id merging what the downloads and the conversions know
+
+    The rows are upserted in transactions of BATCH_SIZE rows. Amounts are integer cents and dates
+    YYYY-MM-DD, so they compare and sort in sql.
+    """
+    def __init__(self, catalog_path: str):
+        self.catalog_path = catalog_path
+        if catalog_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(catalog_path)), exist_ok=True)
+        self.connection = sqlite3.connect(catalog_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def executemany(self, statement: str, rows):
+        """run statement for every row, committing every BATCH_SIZE rows"""
+        batch = list()
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                with self.connection:
+                    self.connection.executemany(statement, batch)
+                batch.clear()
+        if batch:
+            with self.connection:
+                self.connection.executemany(statement, batch)
+
+    def upsert_downloaded(self, invoices, pdf_output: str):
+        """record the invoices of a download, the dicts of downloader.get_invoices_info, the good ones as written to pdf_output"""
+        now = time.time()
+        self.executemany(UPSERT_DOWNLOADED, (
+            (catalog_id(invoice["id"]), invoice["type"], invoice["url"],
+             invoice.get("hash") if invoice["good"] else None,
+             pdf_output if invoice["good"] else None,
+             now if invoice["good"] else None,
+             now)
+            for invoice in invoices))
+
+    def upsert_imported(self, invoices):
+        """record the invoice_model.Invoice of a conversion"""
+        now = time.time()
+        self.executemany(UPSERT_IMPORTED, (
+            (catalog_id(invoice.num_fattura), invoice.tipo_fattura, iso_date(invoice.data_fattura), invoice.ragione_sociale, invoice.cf,
+             invoice.importo_totale, invoice.ritenuta_acconto, invoice.bollo, now)
+            for invoice in invoices))
+
+    def mark_exported(self, invoice_ids, export_output: str):
+        """record the invoices written to the TRAF2000 file export_output"""
+        now = time.time()
+        self.executemany(MARK_EXPORTED, ((export_output, now, now, catalog_id(invoice_id)) for invoice_id in invoice_ids))
+
+    def query(self, invoice_id: str = None, invoice_type: str = None, start_date=None, end_date=None, customer: str = None,
+              downloaded: bool = None, exported: bool = None, limit: int = None) -> list:
+        """return the rows matching every given filter, by date and id
+
+        customer matches a part of the name or the whole cf, downloaded and exported select the
+        invoices that have (True) or have not (False) been downloaded or exported
+        """
+        conditions = list()
+        params = list()
+        if invoice_id is not None:
+            conditions.append("id = ?")
+            params.append(catalog_id(invoice_id))
+        if invoice_type is not None:
+            conditions.append("type = ?")
+            params.append(invoice_type)
+        if start_date is not None:
+            conditions.append("date >= ?")
+            params.append(start_date.isoformat())
+        if end_date is not None:
+            conditions.append("date <= ?")
+            params.append(end_date.isoformat())
+        if customer is not None:
+            conditions.append("(customer LIKE ? OR cf = ?)")
+            params += ["%" + customer + "%", customer.upper()]
+        if downloaded is not None:
+            conditions.append("downloaded_at IS NOT NULL" if downloaded else "downloaded_at IS NULL")
+        if exported is not None:
+            conditions.append("exported_at IS NOT NULL" if exported else "exported_at IS NULL")
+        statement = "SELECT * FROM invoices"
+        if conditions:
+            statement += " WHERE " + " AND ".join(conditions)
+        statement += " ORDER BY date, id"
+        if limit is not None:
+            statement += " LIMIT %d" % limit
+        return [dict(row) for row in self.connection.execute(statement, params)]
+
+    def close(self):
+        """close the database"""
+        self.connection.close()
+
+def open_catalog(config):
+    """return the Catalog configured in the [CATALOG] section or None if disabled"""
+    if not config.getboolean('CATALOG', 'ENABLED', fallback=True):
+        return None
+    return Catalog(os.path.expanduser(config.get('CATALOG', 'PATH', fallback=DEFAULT_CATALOG_PATH)))
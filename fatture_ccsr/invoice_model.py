@@ -0,0 +1,63 @@
+"""compact records of the invoices imported from the xml report, amounts in integer cents"""
+
+class InvoiceLine:
+    """a line of an invoice"""
+    __slots__ = ('descrizione', 'importo')
+
+    def __init__(self, descrizione: str, importo: int):
+        self.descrizione = descrizione
+        self.importo = importo
+
+    def __getstate__(self):
+        return (self.descrizione, self.importo)
+
+    def __setstate__(self, state):
+        self.descrizione, self.importo = state
+
+    def __repr__(self):
+        return "InvoiceLine(%r, %d)" % (self.descrizione, self.importo)
+
+class Invoice:
+    """an invoice to convert to TRAF2000, righe is a tuple of InvoiceLine with distinct descriptions"""
+    __slots__ = ('num_fattura', 'tipo_fattura', 'rif_fattura', 'data_fattura', 'ragione_sociale', 'pos_divide', 'cf',
+                 'importo_totale', 'ritenuta_acconto', 'bollo', 'righe')
+
+    def __init__(self, num_fattura: str, tipo_fattura: str, rif_fattura: str, data_fattura: str, ragione_sociale: str, pos_divide: str, cf: str,
+                 importo_totale: int, ritenuta_acconto: int, bollo: int, righe: tuple):
+        self.num_fattura = num_fattura
+        self.tipo_fattura = tipo_fattura
+        self.rif_fattura = rif_fattura
+        self.data_fattura = data_fattura
+        self.ragione_sociale = ragione_sociale
+        self.pos_divide = pos_divide
+        self.cf = cf
+        self.importo_totale = importo_totale
+        self.ritenuta_acconto = ritenuta_acconto
+        self.bollo = bollo
+        self.righe = righe
+
+    def as_dict(self) -> dict:
+        """return the invoice as a dict with the field names of the TRAF2000 conversion, the lines as a description: amount dict"""
+        return {
+            "numFattura": self.num_fattura,
+            "tipoFattura": self.tipo_fattura,
+            "rifFattura": self.rif_fattura,
+            "dataFattura": self.data_fattura,
+            "ragioneSociale": self.ragione_sociale,
+            "posDivide": self.pos_divide,
+            "cf": self.cf,
+            "importoTotale": self.importo_totale,
+            "ritenutaAcconto": self.ritenuta_acconto,
+            "bollo": self.bollo,
+            "righe": {line.descrizione: line.importo for line in self.righe},
+        }
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return "Invoice(%r, %r)" % (self.num_fattura, self.tipo_fattura)
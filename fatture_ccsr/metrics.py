@@ -0,0 +1,121 @@
+"""time, bytes and requests spent by every stage of a run, saved as a summary next to its output"""
+
+import os
+import csv
+import json
+import time
+import types
+import cProfile
+import threading
+import contextlib
+
+class RunMetrics:
+    """thread safe accumulator of the durations, byte and request counts of the stages of a run
+
+    Every stage sums the calls, seconds, bytes and requests added to it; add_item also records a
+    row for a single invoice. write() saves the stage totals as <output>_metrics.json and the
+    invoice rows as <output>_metrics.csv next to the output set with set_output.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stages = dict()
+        self.items = list()
+        self.output_base = None
+
+    def add(self, stage: str, seconds: float, bytes_count: int = 0, requests: int = 0):
+        """add a call of stage"""
+        with self.lock:
+            totals = self.stages.setdefault(stage, {"calls": 0, "seconds": 0.0, "bytes": 0, "requests": 0})
+            totals["calls"] += 1
+            totals["seconds"] += seconds
+            totals["bytes"] += bytes_count
+            totals["requests"] += requests
+
+    def add_item(self, stage: str, item_id: str, seconds: float, bytes_count: int = 0, requests: int = 0):
+        """add a call of stage for the invoice item_id"""
+        self.add(stage, seconds, bytes_count, requests)
+        with self.lock:
+            self.items.append((stage, item_id, seconds, bytes_count, requests))
+
+    @contextlib.contextmanager
+    def stage(self, stage: str):
+        """time the with block as a call of stage, bytes and requests can be set on the yielded object"""
+        counters = types.SimpleNamespace(bytes=0, requests=0)
+        start = time.perf_counter()
+        try:
+            yield counters
+        finally:
+            self.add(stage, time.perf_counter()-start, counters.bytes, counters.requests)
+
+    def timed_iter(self, stage: str, iterable):
+        """yield from iterable adding the time spent producing every item to stage, as a single call"""
+        seconds = 0.0
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.perf_counter()-start
+                yield item
+        finally:
+            self.add(stage, seconds)
+
+    def set_output(self, output_path: str):
+        """write the summary and the profile next to output_path"""
+        self.output_base = os.path.splitext(output_path)[0]
+
+    def artifact_path(self, name: str) -> str:
+        """return the path of a run artifact, next to the output or else in the working directory"""
+        base = self.output_base or os.path.abspath(time.strftime("fatture_ccsr_%Y%m%d_%H%M%S", time.localtime(self.started)))
+        return base+"_"+name
+
+    def summary(self) -> dict:
+        """return the run summary"""
+        finished = time.time()
+        with self.lock:
+            return {
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "seconds": finished-self.started,
+                "stages": {stage: dict(totals) for stage, totals in self.stages.items()},
+                "items": len(self.items),
+            }
+
+    def write(self) -> tuple:
+        """write the json summary and the csv of the invoices, return their paths"""
+        json_path = self.artifact_path("metrics.json")
+        csv_path = self.artifact_path("metrics.csv")
+        with open(json_path, "w") as json_file:
+            json.dump(self.summary(), json_file, indent=2)
+        with self.lock:
+            items = list(self.items)
+        with open(csv_path, "w", newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(("stage", "id", "seconds", "bytes", "requests"))
+            writer.writerows(items)
+        return json_path, csv_path
+
+def write_summary(context):
+    """write the metrics of the run if enabled by [METRICS] SUMMARY"""
+    if not context.config.getboolean('METRICS', 'SUMMARY', fallback=True):
+        return
+    try:
+        json_path, _ = context.metrics.write()
+    except OSError as e:
+        context.error("Errore: impossibile salvare le metriche dell'esecuzione: %s\n" % e)
+        return
+    context.log("Metriche dell'esecuzione salvate in %s\n" % json_path)
+
+def run_profiled(action_func, context):
+    """run action_func(context) under cProfile and dump the stats next to the run summary"""
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(action_func, context)
+    finally:
+        profile_path = context.metrics.artifact_path("profile.pstats")
+        profiler.dump_stats(profile_path)
+        context.log("Profilo dell'esecuzione salvato in %s\n" % profile_path)
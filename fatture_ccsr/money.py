@@ -0,0 +1,31 @@
+"""exact fixed-point amounts: decimal strings of the report parsed into integer cents and TRAF2000 signed fields"""
+
+import decimal
+
+CENT = decimal.Decimal('0.01')
+
+def parse_cents(text: str) -> int:
+    """return the integer cents of an xs:decimal amount as '-1234.5'
+
+    Amounts with more than two decimals are rounded half to even on their exact decimal value, as
+    round does on a Decimal: '0.125' is 12 cents and '2.6750' is 268, where the float formatting of
+    the first converter gave 267 as the float of 2.675 is slightly less.
+    """
+    digits = text.strip()
+    negative = digits[:1] == '-'
+    if digits[:1] in ('-', '+'):
+        digits = digits[1:]
+    units, _, fraction = digits.partition('.')
+    if not (units or fraction) or not (units+fraction).isdigit() or not (units+fraction).isascii():
+        raise ValueError("invalid amount %r" % text)
+    if len(fraction) > 2:
+        cents = int(decimal.Decimal(units+'.'+fraction).quantize(CENT, decimal.ROUND_HALF_EVEN)*100)
+    else:
+        cents = int(units or '0')*100 + int(fraction.ljust(2, '0'))
+    return -cents if negative else cents
+
+def format_signed(cents, width: int) -> str:
+    """return a TRAF2000 signed numeric field: absolute value zero padded and followed by its sign, None is an empty field"""
+    if cents is None:
+        return '0'*width
+    return str(abs(cents)).rjust(width-1, '0') + ('-' if cents < 0 else '+')
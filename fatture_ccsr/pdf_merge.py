@@ -0,0 +1,142 @@
+"""merge the downloaded invoices into one or more pdf outputs parsing every invoice only once"""
+
+import io
+import zlib
+import hashlib
+import PyPDF2
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, StreamObject
+
+MIN_COMPRESS_SIZE = 64  # bytes, shorter unfiltered streams are left as they are
+
+def compress_stream(stream):
+    """flate encode in place a stream written without any filter"""
+    if "/Filter" in stream or len(stream._data) < MIN_COMPRESS_SIZE: # pylint: disable=protected-access
+        return
+    stream._data = zlib.compress(stream._data) # pylint: disable=protected-access
+    stream[NameObject("/Filter")] = NameObject("/FlateDecode")
+
+class ResourceDeduplicator:
+    """replace the resources of the pages by the first identical ones met in any document
+
+    Every indirect object reachable from the /Resources of a page (fonts, font files, images, form
+    xobjects...) is identified by a digest of its content and of the digests of the objects it refers
+    to, so the fonts and letterhead images every invoice embeds end up referring to the objects of
+    the first invoice and the writers store them once. The canonical streams are also compressed.
+    """
+    def __init__(self):
+        self.objects = dict()  # digest: first indirect object with that content
+        self.refs = dict()  # (pdf, generation, idnum): (digest, canonical indirect object)
+        self.visiting = set()
+
+    def dedupe_page(self, page):
+        """dedupe the resources of page and compress its contents"""
+        if "/Resources" in page:
+            self.intern(page, "/Resources")
+        contents = page["/Contents"] if "/Contents" in page else None
+        for content in contents if isinstance(contents, ArrayObject) else (contents,):
+            if content is not None and isinstance(content.getObject(), StreamObject):
+                compress_stream(content.getObject())
+
+    def intern(self, container, key) -> bytes:
+        """replace container[key] by its canonical object and return its digest"""
+        value = dict.__getitem__(container, key) if isinstance(container, dict) else container[key]
+        digest, canonical = self.canonical(value)
+        if canonical is not value:
+            if isinstance(container, dict):
+                dict.__setitem__(container, key, canonical)
+            else:
+                container[key] = canonical
+        return digest
+
+    def canonical(self, value) -> tuple:
+        """return the digest of value and the object to use in its place"""
+        if isinstance(value, IndirectObject):
+            ref = (id(value.pdf), value.generation, value.idnum)
+            if ref in self.refs:
+                return self.refs[ref]
+            if ref in self.visiting:
+                return repr(ref).encode(), value
+            self.visiting.add(ref)
+            try:
+                digest, _ = self.canonical(value.getObject())
+            finally:
+                self.visiting.discard(ref)
+            canonical = self.objects.get(digest)
+            if canonical is None:
+                canonical = self.objects[digest] = value
+                if isinstance(value.getObject(), StreamObject):
+                    compress_stream(value.getObject())
+            self.refs[ref] = (digest, canonical)
+            return digest, canonical
+
+        hasher = hashlib.sha1(type(value).__name__.encode())
+        if isinstance(value, DictionaryObject):
+            for key in sorted(dict.keys(value)):
+                hasher.update(key.encode() + b'\0' + self.intern(value, key))
+            if isinstance(value, StreamObject):
+                hasher.update(hashlib.sha1(value._data).digest()) # pylint: disable=protected-access
+        elif isinstance(value, ArrayObject):
+            for i in range(len(value)):
+                hasher.update(self.intern(value, i))
+        else:
+            output = io.BytesIO()
+            value.writeToStream(output, None)
+            hasher.update(output.getvalue())
+        return hasher.digest(), value
+
+class InvoiceMerger:
+    """parse every invoice once and route its pages to any number of outputs
+
+    outputs maps an output key to the path of the pdf to write. Each invoice file is read into
+    memory and closed immediately, so at most one input file handle is open at any time, and its
+    pages are shared by all the outputs it is routed to instead of being parsed once per output.
+    Outputs are written one after the other and every buffer is released by close().
+    With optimize the resources shared by the invoices are written once and the streams compressed.
+    """
+    def __init__(self, outputs: dict, optimize: bool = False):
+        self.outputs = outputs
+        self.pages = {key: list() for key in outputs}
+        self.input_sizes = dict.fromkeys(outputs, 0)
+        self.buffers = list()
+        self.deduplicator = ResourceDeduplicator() if optimize else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def add(self, file_path: str, keys):
+        """append all the pages of file_path to the outputs in keys"""
+        with open(file_path, 'rb') as input_file:
+            data = input_file.read()
+        buffer = io.BytesIO(data)
+        self.buffers.append(buffer)
+        reader = PyPDF2.PdfFileReader(buffer)
+        pages = [reader.getPage(i) for i in range(reader.getNumPages())]
+        if self.deduplicator is not None:
+            for page in pages:
+                self.deduplicator.dedupe_page(page)
+        for key in keys:
+            self.pages[key].extend(pages)
+            self.input_sizes[key] += len(data)
+
+    def write(self) -> dict:
+        """write every output file, return the (merged invoices bytes, written bytes) of each output key"""
+        sizes = dict()
+        for key, output_path in self.outputs.items():
+            writer = PyPDF2.PdfFileWriter()
+            for page in self.pages[key]:
+                writer.addPage(page)
+            with open(output_path, 'wb') as output_file:
+                writer.write(output_file)
+                sizes[key] = (self.input_sizes[key], output_file.tell())
+        return sizes
+
+    def close(self):
+        """release the parsed pages and the input buffers"""
+        for pages in self.pages.values():
+            pages.clear()
+        for buffer in self.buffers:
+            buffer.close()
+        self.buffers.clear()
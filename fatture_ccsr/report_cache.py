@@ -0,0 +1,98 @@
+"""on-disk cache of the downloaded reports, keyed by report, period and format and valid for a ttl"""
+
+import os
+import time
+import shutil
+import hashlib
+import threading
+
+import invoice_cache
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.fatture_ccsr', 'reports')
+DEFAULT_TTL_MINUTES = 60
+INDEX_FILE_NAME = 'index.json'
+
+def report_key(server_url: str, report_path: str, start_date, end_date, report_format: str) -> str:
+    """return the cache key of the report of start_date..end_date in report_format"""
+    return "%s|%s|%s|%s|%s" % (server_url, report_path, start_date.isoformat(), end_date.isoformat(), report_format)
+
+class ReportCache:
+    """on-disk cache of report files, an entry expires ttl seconds after it has been stored
+
+    As the invoice cache it may be shared by concurrent runs: the index is merged with the one on
+    disk when saved and only the files of the entries this instance expired are removed.
+    """
+    def __init__(self, cache_dir: str, ttl: float):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.index_path = os.path.join(cache_dir, INDEX_FILE_NAME)
+        self.lock = threading.Lock()
+        self.dropped = set()  # keys whose entry this instance expired
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.entries = invoice_cache.read_index(self.index_path)
+
+    def get(self, key: str):
+        """return the cached report path of key or None on a miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            path = os.path.join(self.cache_dir, entry["file"])
+            if time.time() - entry["stored"] > self.ttl or not os.path.isfile(path):
+                del self.entries[key]
+                self.dropped.add(key)
+                return None
+            return path
+
+    def put(self, key: str, file_path: str) -> str:
+        """store a copy of file_path as the report of key, save the index and return the cached path"""
+        file_name = hashlib.sha1(key.encode('utf-8')).hexdigest()+os.path.splitext(file_path)[1]
+        path = os.path.join(self.cache_dir, file_name)
+        with self.lock:
+            tmp_path = path+'.%d.%d.tmp' % (os.getpid(), threading.get_ident())
+            shutil.copyfile(file_path, tmp_path)
+            os.replace(tmp_path, path)
+            self.entries[key] = {
+                "file": file_name,
+                "stored": time.time(),
+            }
+            self.dropped.discard(key)
+            self.save_index()
+        return path
+
+    def evict(self):
+        """drop the expired entries and remove their report files"""
+        with self.lock:
+            now = time.time()
+            expired = [key for key, entry in self.entries.items() if now - entry["stored"] > self.ttl]
+            stored = invoice_cache.read_index(self.index_path) if expired else dict()
+            for key in expired:
+                entry = self.entries.pop(key)
+                if stored.get(key, entry)["stored"] > entry["stored"]:
+                    continue  # stored again by another run meanwhile, its entry is kept
+                self.dropped.add(key)
+                try:
+                    os.remove(os.path.join(self.cache_dir, entry["file"]))
+                except OSError:
+                    pass
+            if expired:
+                self.save_index()
+
+    def save_index(self):
+        """atomically write the cache index, keeping the entries other runs added meanwhile, the lock must be held"""
+        entries = invoice_cache.read_index(self.index_path)
+        for key in self.dropped:
+            entries.pop(key, None)
+        entries.update(self.entries)
+        invoice_cache.write_index(self.index_path, entries)
+
+def open_cache(config):
+    """return the ReportCache configured in config or None if disabled"""
+    if not config.getboolean('REPORT_CACHE', 'ENABLED', fallback=True):
+        return None
+    cache_dir = os.path.expanduser(config.get('REPORT_CACHE', 'PATH', fallback=DEFAULT_CACHE_DIR))
+    ttl = config.getfloat('REPORT_CACHE', 'TTL-MINUTES', fallback=DEFAULT_TTL_MINUTES)*60
+    cache = ReportCache(cache_dir, ttl)
+    cache.evict()
+    return cache
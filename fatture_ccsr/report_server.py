@@ -0,0 +1,198 @@
+"""log in to the CCSR SQL Server Reporting Services (SSRS) and download its reports"""
+
+import os
+import datetime
+import tempfile
+import concurrent.futures
+import requests
+
+import exc
+import http_client
+import report_cache
+import streaming
+
+DOMAIN = "sanrossore"
+REPORT_PATH = '/reportserver?/STAT_FATTURATO_CTERZI'
+FORMAT_XLSX = 'EXCELOPENXML'
+FORMAT_XML = 'XML'
+FORMAT_CSV = 'CSV'
+REPORT_SUFFIXES = {
+    FORMAT_XLSX: '.xlsx',
+    FORMAT_XML: '.xml',
+    FORMAT_CSV: '.csv',
+}
+REPORT_DEVICE_INFO = {
+    FORMAT_CSV: '&rc:Encoding=UTF-8',  # the default is utf-16
+}
+
+SHARDING_OFF = 'off'  # download the whole period in one report
+SHARDING_WEEK = 'week'  # download a report per calendar week of the period
+SHARDING_MONTH = 'month'  # download a report per calendar month of the period
+SHARDING_MODES = (SHARDING_OFF, SHARDING_WEEK, SHARDING_MONTH)
+DEFAULT_SHARD_WORKERS = 4
+
+def new_session(config) -> requests.Session:
+    """create a session verifying the report server certificate with the configured ca bundle"""
+    session = requests.Session()
+    session.verify = config['REPORT_SERVER'].get('CA_BUNDLE', True)
+    http_client.mount_adapter(session, max(DEFAULT_SHARD_WORKERS, config.getint('REPORT_SERVER', 'SHARD-WORKERS', fallback=DEFAULT_SHARD_WORKERS),
+                                           config.getint('REPORT_SERVER', 'PREWARM-CONNECTIONS', fallback=0)))
+    return session
+
+def login(session, config, username: str, password: str) -> bool:
+    """set the ntlm credentials of session and check them against the report server"""
+    import requests_ntlm # pylint: disable=import-outside-toplevel
+    session.auth = requests_ntlm.HttpNtlmAuth(DOMAIN+"\\"+username, password)
+
+    def attempt(timeout):
+        resp = session.get(config['REPORT_SERVER']['URL']+'/Reports/browse/', timeout=timeout)
+        resp.close()
+        http_client.check_status(resp)
+        return resp.status_code
+
+    try:
+        return http_client.RequestPolicy.from_config(config).call(attempt) == 200
+    except exc.RetryableStatusError:
+        return False
+
+def report_url(config, start_date, end_date, report_format: str) -> str:
+    """return the url of the report of the invoices issued between start_date and end_date"""
+    return config['REPORT_SERVER']['URL']+REPORT_PATH+'&dataI='+start_date.strftime("%d/%m/%Y")+'&dataF='+end_date.strftime("%d/%m/%Y")+'&rs:Format='+report_format+REPORT_DEVICE_INFO.get(report_format, '')
+
+def get_sharding(context) -> str:
+    """return the sharding mode of the report downloads set in the config file"""
+    sharding = context.config.get('REPORT_SERVER', 'SHARDING', fallback=SHARDING_OFF).lower()
+    if sharding not in SHARDING_MODES:
+        context.error("ERRORE: suddivisione del periodo %s sconosciuta, uso %s\n" % (sharding, SHARDING_OFF))
+        sharding = SHARDING_OFF
+    return sharding
+
+def get_report_format(context, section: str, formats: dict, default: str) -> str:
+    """return the report format of the action of section, formats maps the REPORT-FORMAT names to the FORMAT_ constants"""
+    name = context.config.get(section, 'REPORT-FORMAT', fallback=default).lower()
+    if name not in formats:
+        context.error("ERRORE: formato del file di input %s sconosciuto, uso %s\n" % (name, default))
+        name = default
+    return formats[name]
+
+def shard_periods(start_date, end_date, sharding: str) -> list:
+    """split start_date..end_date in the (start, end) of its calendar weeks or months"""
+    if sharding == SHARDING_OFF:
+        return [(start_date, end_date)]
+    periods = list()
+    shard_start = start_date
+    while shard_start <= end_date:
+        if sharding == SHARDING_WEEK:
+            shard_end = shard_start + datetime.timedelta(days=6-shard_start.weekday())
+        else:
+            next_month = (shard_start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+            shard_end = next_month - datetime.timedelta(days=1)
+        shard_end = min(shard_end, end_date)
+        periods.append((shard_start, shard_end))
+        shard_start = shard_end + datetime.timedelta(days=1)
+    return periods
+
+def download_report(context, report_format: str, start_date=None, end_date=None, cache=None):
+    """download the report of start_date..end_date, the context period by default, in a temporary file and return its path, None on errors
+
+    the request and the download are retried together following context.http_policy. With a
+    report_cache.ReportCache a report still valid in it is returned without asking the server,
+    unless context.force_refresh is set, and every downloaded report is stored in it.
+    """
+    start_date = start_date or context.start_date
+    end_date = end_date or context.end_date
+    input_file_url = report_url(context.config, start_date, end_date, report_format)
+    cache_key = report_cache.report_key(context.config['REPORT_SERVER']['URL'], REPORT_PATH, start_date, end_date, report_format)
+    if cache is not None and not context.force_refresh:
+        cached_path = cache.get(cache_key)
+        if cached_path is not None:
+            context.metrics.add('report_cache_hit', 0)
+            if context.verbose:
+                context.log("File input dal %s al %s già presente in cache\n" % (start_date.strftime("%d/%m/%Y"), end_date.strftime("%d/%m/%Y")))
+            return cached_path
+
+    def log_progress(size, total_size, bytes_per_second):
+        context.check_cancelled()
+        context.http_policy.check_deadline()
+        if context.verbose:
+            context.log("File input: %s\n" % streaming.format_progress(size, total_size, bytes_per_second))
+
+    def log_retry(error, retry, wait):
+        context.error("Errore nel download del file di input (%s), nuovo tentativo %d/%d tra %.1f secondi\n" % (error, retry, context.http_policy.retries, wait))
+
+    context.check_cancelled()
+    input_file_descriptor, input_file_path = tempfile.mkstemp(suffix=REPORT_SUFFIXES[report_format])
+    os.close(input_file_descriptor)
+    context.input_files.append(input_file_path)
+
+    def attempt(timeout):
+        with context.metrics.stage('report_request') as stage:
+            stage.requests = 1
+            downloaded_input_file = context.session.get(input_file_url, stream=True, timeout=timeout)
+        with downloaded_input_file:
+            http_client.check_status(downloaded_input_file)
+            if downloaded_input_file.status_code != 200:
+                return downloaded_input_file.status_code
+            context.check_cancelled()
+            with context.metrics.stage('report_download') as stage, open(input_file_path, 'wb') as input_file:
+                stage.bytes, _ = streaming.stream_to_file(downloaded_input_file, input_file, progress=log_progress)
+        return downloaded_input_file.status_code
+
+    try:
+        status_code = context.http_policy.call(attempt, on_retry=log_retry)
+    except exc.RetryableStatusError as e:
+        status_code = e.status_code
+    except requests.exceptions.RequestException:
+        context.error("ERRORE: impossibile connettersi al portale CCSR o connessione interrotta durante il download del file di input.\n")
+        return None
+    if status_code != 200:
+        context.error("ERRORE: impossibile scaricare il file di input.\nControllare la connessione ad internet e l'operatività del portale CCSR. Code %d\n" % status_code)
+        return None
+
+    if cache is not None:
+        try:
+            cache.put(cache_key, input_file_path)
+        except OSError as e:
+            context.error("Errore: impossibile salvare il file di input in cache: %s\n" % e)
+    return input_file_path
+
+def open_report_cache(context):
+    """return the report cache of the config, None if disabled or not usable"""
+    try:
+        return report_cache.open_cache(context.config)
+    except OSError as e:
+        context.error("Errore: impossibile aprire la cache dei file di input: %s\n" % e)
+        return None
+
+def download_reports(context, report_format: str):
+    """download the reports of the context period and return their paths in period order, None on errors
+
+    With sharding enabled the period is split in weeks or months whose reports are downloaded in
+    parallel by SHARD-WORKERS threads, otherwise a single report covers the whole period. Every
+    report goes through the [REPORT_CACHE], so the actions of a run ask each one only once.
+    """
+    periods = shard_periods(context.start_date, context.end_date, get_sharding(context))
+    cache = open_report_cache(context)
+    if len(periods) == 1:
+        input_file_path = download_report(context, report_format, *periods[0], cache)
+        return None if input_file_path is None else [input_file_path]
+
+    context.log("Download del periodo in %d parti\n" % len(periods))
+    workers = context.config.getint('REPORT_SERVER', 'SHARD-WORKERS', fallback=DEFAULT_SHARD_WORKERS)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(download_report, context, report_format, start_date, end_date, cache) for start_date, end_date in periods]
+        input_file_paths = list()
+        try:
+            for future, (start_date, end_date) in zip(futures, periods):
+                input_file_path = future.result()
+                if input_file_path is None:
+                    context.error("ERRORE: impossibile scaricare il periodo dal %s al %s\n" % (start_date.strftime("%d/%m/%Y"), end_date.strftime("%d/%m/%Y")))
+                    for pending in futures:
+                        pending.cancel()
+                    return None
+                input_file_paths.append(input_file_path)
+        except exc.ActionError:
+            for pending in futures:
+                pending.cancel()
+            raise
+    return input_file_paths
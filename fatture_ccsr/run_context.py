@@ -0,0 +1,107 @@
+"""state of a download or conversion run and the channel its messages are sent to"""
+
+import os
+import sys
+import threading
+
+import exc
+import http_client
+import metrics
+
+class RunContext:
+    """everything a download or a conversion needs from the caller, writing to the console
+
+    The gui subclasses it to write to its log dialog and to ask the output paths with file dialogs;
+    here they are the ones given to the constructor, or a default name in the working directory.
+    """
+    def __init__(self, config, session, start_date, end_date, verbose: bool = False, force_refresh: bool = False, pdf_output: str = None, traf2000_output: str = None, zip_output: str = None):
+        self.config = config
+        self.session = session
+        self.start_date = start_date
+        self.end_date = end_date
+        self.verbose = verbose
+        self.force_refresh = force_refresh
+        self.pdf_output = pdf_output
+        self.traf2000_output = traf2000_output
+        self.zip_output = zip_output
+        self.input_files = list()
+        self.cancel_event = threading.Event()
+        self.metrics = metrics.RunMetrics()
+        self.http_policy = http_client.RequestPolicy.from_config(config, self.cancel_event)
+        self.warmer = None  # connection_warmer.ConnectionWarmer giving the download workers warm sessions
+
+    def log(self, text: str):
+        """write a progress message"""
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    def error(self, text: str):
+        """write an error message"""
+        sys.stderr.write(text)
+        sys.stderr.flush()
+
+    def success(self, text: str):
+        """write the message of a completed step"""
+        self.log(text)
+
+    def credit_note(self, text: str):
+        """write to the list of the credit notes skipped by the conversion"""
+        self.log(text)
+
+    def ask_pdf_output_path(self, default_name: str):
+        """return the path of the merged invoices pdf, None to skip merging"""
+        return self.pdf_output or os.path.abspath(default_name)
+
+    def ask_zip_output_path(self, default_name: str):
+        """return the path of the zip bundle of the invoices, None to abort the download"""
+        return self.zip_output or os.path.abspath(default_name)
+
+    def ask_traf2000_output_path(self):
+        """return the path of the TRAF2000 file, None to abort the conversion"""
+        return self.traf2000_output or os.path.abspath("TRAF2000")
+
+    def cancel(self):
+        """ask the running action to stop at the next check_cancelled"""
+        self.cancel_event.set()
+
+    def check_cancelled(self):
+        """raise ActionCancelledError if the run has been cancelled"""
+        if self.cancel_event.is_set():
+            raise exc.ActionCancelledError()
+
+    def pdf_written(self, output_paths: dict):
+        """called once the merged invoices pdfs have been written"""
+
+    def cleanup(self):
+        """remove the downloaded reports"""
+        for input_file in self.input_files:
+            try:
+                os.remove(input_file)
+            except OSError:
+                pass
+        self.input_files.clear()
+
+def download_invoices(context) -> bool:
+    """run downloader.download_invoices, importing the downloader and its pdf and xlsx libraries only now"""
+    import downloader # pylint: disable=import-outside-toplevel
+    return downloader.download_invoices(context)
+
+def convert(context) -> bool:
+    """run traf2000_converter.convert, importing the converter and its xml libraries only now"""
+    import traf2000_converter # pylint: disable=import-outside-toplevel
+    return traf2000_converter.convert(context)
+
+def run_actions(context, action_funcs, profile: bool = False) -> bool:
+    """run the action_funcs one after the other on context, each with its own metrics, and return True if all succeeded
+
+    the actions share context.input_files, so a report downloaded by the first one is read again by
+    the next ones from the report cache instead of asking the server
+    """
+    succeeded = True
+    for action_func in action_funcs:
+        context.metrics = metrics.RunMetrics()
+        if profile:
+            succeeded = metrics.run_profiled(action_func, context) and succeeded
+        else:
+            succeeded = action_func(context) and succeeded
+    return succeeded
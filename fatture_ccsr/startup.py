@@ -0,0 +1,123 @@
+"""startup timing report: the time of every import and phase from the start of the main script to the first window
+
+Enabled by --startup-report[=PATH] on the command line or by the FATTURE_CCSR_STARTUP_REPORT
+environment variable (set to a path or to - for stderr), it must be imported and started before
+any other module to see their imports.
+"""
+
+import os
+import sys
+import time
+import builtins
+
+ENV_VAR = 'FATTURE_CCSR_STARTUP_REPORT'
+ARGUMENT = '--startup-report'
+STDERR = '-'
+MIN_REPORTED_IMPORT = 0.001  # seconds, faster imports are summed in a single row
+
+class StartupTimer:
+    """collect the time of the imports, as python -X importtime does, and of the startup phases
+
+    The imports are timed by wrapping builtins.__import__: every module not imported yet gets its
+    cumulative time, including the modules it imports, and its nesting depth.
+    """
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.phases = list()
+        self.imports = list()
+        self.depth = 0
+        self.original_import = None
+
+    def install(self):
+        """start timing the imports"""
+        self.original_import = builtins.__import__
+        builtins.__import__ = self.timed_import
+
+    def uninstall(self):
+        """stop timing the imports"""
+        if self.original_import is not None:
+            builtins.__import__ = self.original_import
+            self.original_import = None
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0): # pylint: disable=redefined-builtin
+        """builtins.__import__ timing the modules not imported yet"""
+        if level or name in sys.modules:
+            return self.original_import(name, globals, locals, fromlist, level)
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            self.depth -= 1
+            self.imports.append((self.depth, name, time.perf_counter()-start))
+
+    def phase(self, name: str):
+        """mark the end of a startup phase"""
+        now = time.perf_counter()
+        self.phases.append((name, now-self.last))
+        self.last = now
+
+    def report(self) -> str:
+        """return the report of the phases and of the top level imports, slowest first"""
+        lines = ["startup: %.0f ms" % ((self.last-self.start)*1000)]
+        for name, seconds in self.phases:
+            lines.append("  %-30s %8.1f ms" % (name, seconds*1000))
+        top_level = sorted((item for item in self.imports if item[0] == 0), key=lambda item: item[2], reverse=True)
+        lines.append("imports: %.0f ms" % (sum(seconds for _, _, seconds in top_level)*1000))
+        others = 0.0
+        for _, name, seconds in top_level:
+            if seconds < MIN_REPORTED_IMPORT:
+                others += seconds
+                continue
+            lines.append("  %-30s %8.1f ms" % (name, seconds*1000))
+        if others:
+            lines.append("  %-30s %8.1f ms" % ("(others)", others*1000))
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """stop timing the imports and write the report"""
+        self.uninstall()
+        if self.output_path == STDERR:
+            sys.stderr.write(self.report())
+            return
+        with open(self.output_path, 'w') as report_file:
+            report_file.write(self.report())
+
+_timer = None
+
+def begin(argv=None):
+    """start the timer if the report is requested, removing --startup-report[=PATH] from argv
+
+    the path is only taken joined by '=', so that the argument never swallows the next positional one
+    """
+    global _timer # pylint: disable=global-statement
+    argv = sys.argv if argv is None else argv
+    output_path = os.environ.get(ENV_VAR)
+    for index, argument in enumerate(argv):
+        if argument == ARGUMENT or argument.startswith(ARGUMENT+'='):
+            del argv[index]
+            output_path = argument[len(ARGUMENT)+1:] or STDERR
+            break
+    if output_path:
+        _timer = StartupTimer(output_path)
+        _timer.install()
+
+def phase(name: str):
+    """mark the end of a startup phase, if the report is enabled"""
+    if _timer is not None:
+        _timer.phase(name)
+
+def end(name: str = None):
+    """mark the last phase and write the report, if enabled"""
+    global _timer # pylint: disable=global-statement
+    if _timer is None:
+        return
+    if name is not None:
+        _timer.phase(name)
+    try:
+        _timer.write()
+    except OSError as e:
+        sys.stderr.write("Error in writing the startup report: %s\n" % e)
+    _timer = None
@@ -0,0 +1,44 @@
+"""stream http responses straight to disk"""
+
+import time
+import hashlib
+
+DEFAULT_CHUNK_SIZE = 64*1024
+DEFAULT_PROGRESS_INTERVAL = 0.5
+
+def stream_to_file(resp, output_file, chunk_size: int = DEFAULT_CHUNK_SIZE, progress=None, progress_interval: float = DEFAULT_PROGRESS_INTERVAL) -> tuple:
+    """write the body of a stream=True response to output_file chunk by chunk and return (size, sha256)
+
+    progress, if given, is called as progress(size, total_size, bytes_per_second) at most every
+    progress_interval seconds and once at the end; total_size is None without a Content-Length
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        total_size = int(resp.headers.get('Content-Length'))
+    except (TypeError, ValueError):
+        total_size = None
+    start = time.perf_counter()
+    last_progress = start
+
+    for chunk in resp.iter_content(chunk_size=chunk_size):
+        if not chunk:
+            continue
+        output_file.write(chunk)
+        digest.update(chunk)
+        size += len(chunk)
+        if progress is not None:
+            now = time.perf_counter()
+            if now - last_progress >= progress_interval:
+                last_progress = now
+                progress(size, total_size, size / max(now - start, 1e-9))
+
+    if progress is not None:
+        progress(size, total_size, size / max(time.perf_counter() - start, 1e-9))
+    return size, digest.hexdigest()
+
+def format_progress(size: int, total_size, bytes_per_second: float) -> str:
+    """return a human readable progress line"""
+    if total_size:
+        return "%.1f/%.1f MB (%.0f KB/s)" % (size/1048576, total_size/1048576, bytes_per_second/1024)
+    return "%.1f MB (%.0f KB/s)" % (size/1048576, bytes_per_second/1024)
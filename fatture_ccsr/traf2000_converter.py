@@ -1,360 +1,544 @@
-"""download and parse an xml file from CCSR to generate a TRAF2000 record"""
+"""download and parse an xml or csv file from CCSR to generate a TRAF2000 record"""
 
 import os
+import csv
 import sys
+import time
+import sqlite3
 import datetime
-import tempfile
+import functools
+import itertools
+import collections
+import concurrent.futures
 import lxml.etree
 import unidecode
-import wx
-import requests
-
-def download_input_file(parent):
-    """download input file from CCSR SSRS web service"""
-    start_date = parent.start_date_picker.GetValue().Format("%d/%m/%Y")
-    end_date = parent.end_date_picker.GetValue().Format("%d/%m/%Y")
-    input_file_url = parent.config['REPORT_SERVER']['URL']+'/reportserver?/STAT_FATTURATO_CTERZI&dataI='+start_date+'&dataF='+end_date+'&rs:Format=XML'
-    try:
-        downloaded_input_file = parent.session.get(input_file_url)
-    except requests.exceptions.RequestException:
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.RED, font=wx.Font(wx.FontInfo(8).Bold())))
-        parent.log_dialog.log_text.AppendText("ERRORE: impossibile connettersi al portale CCSR.")
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-        wx.Yield()
-        return None
-    if downloaded_input_file.status_code != 200:
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.RED, font=wx.Font(wx.FontInfo(8).Bold())))
-        parent.log_dialog.log_text.AppendText("ERRORE: impossibile scaricare il file di input.\nCode %d\n" % downloaded_input_file.status_code)
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-        wx.Yield()
-        return None
-
-    input_file_descriptor, input_file_path = tempfile.mkstemp(suffix='.xml')
-    parent.input_files.append(input_file_path)
-    with open(input_file_descriptor, 'wb') as input_file:
-        input_file.write(downloaded_input_file.content)
 
-    return input_file_path
-
-def validate_xml(xml_tree) -> bool:
-    """validate an xml file with an xml schema (xsd)"""
+import csv_reader
+import exc
+import invoice_catalog
+import invoice_model
+import metrics
+import money
+import report_server
+import traf2000_layout
+import traf2000_ledger
+
+XML_NAMESPACE = '{STAT_FATTURATO_CTERZI}'
+
+VALIDATION_STRICT = 'strict'  # validate the whole tree before importing and abort if not valid, memory grows with the report
+VALIDATION_REPORT = 'report'  # validate while streaming and only log if not valid
+VALIDATION_FAST = 'fast'  # validate while streaming, lxml reports the errors only at the end of the file and the conversion fails
+VALIDATION_OFF = 'off'  # do not validate
+VALIDATION_MODES = (VALIDATION_STRICT, VALIDATION_REPORT, VALIDATION_FAST, VALIDATION_OFF)
+
+WRITE_BATCH_SIZE = 256
+DEFAULT_WORKERS = 1  # serial conversion, 0 uses a worker process per cpu
+RENDER_CHUNK_SIZE = 64  # invoices sent to a worker process at a time
+
+REPORT_FORMATS = {
+    'xml': report_server.FORMAT_XML,
+    'csv': report_server.FORMAT_CSV,
+}
+
+@functools.lru_cache(maxsize=None)
+def get_xmlschema():
+    """return the compiled xml schema (xsd), loaded once per process"""
     __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
     if getattr(sys, 'frozen', False):
         xsd_path = os.path.join(sys._MEIPASS, 'res/schema.xsd') # pylint: disable=no-member, protected-access
     else:
         xsd_path = os.path.join(__location__, 'res/schema.xsd')
     xmlschema_doc = lxml.etree.parse(xsd_path) # pylint: disable=c-extension-no-member
-    xmlschema = lxml.etree.XMLSchema(xmlschema_doc) # pylint: disable=c-extension-no-member
+    return lxml.etree.XMLSchema(xmlschema_doc) # pylint: disable=c-extension-no-member
 
-    return xmlschema.validate(xml_tree)
+def validate_xml(xml_tree) -> bool:
+    """validate an xml file with an xml schema (xsd)"""
+    return get_xmlschema().validate(xml_tree)
+
+def get_validation_mode(context) -> str:
+    """return the xsd validation mode set in the config file"""
+    mode = context.config.get('TRAF2000', 'XSD-VALIDATION', fallback=VALIDATION_REPORT).lower()
+    if mode not in VALIDATION_MODES:
+        context.error("ERRORE: modalità di validazione %s sconosciuta, uso %s\n" % (mode, VALIDATION_REPORT))
+        mode = VALIDATION_REPORT
+    return mode
+
+def check_xml(context, input_file_path) -> bool:
+    """validate an xml input file logging an error if it is not valid"""
+    xml_tree = lxml.etree.parse(input_file_path) # pylint: disable=c-extension-no-member
+    if not validate_xml(xml_tree):
+        context.error("ERRORE: xml non valido secondo lo schema xsd\n")
+        return False
+    return True
+
+def prepare_xml(context, input_file_path, mode: str):
+    """run the pre-import validation of mode, return the schema to stream with or False to abort"""
+    if mode == VALIDATION_STRICT:
+        if not check_xml(context, input_file_path):
+            return False
+    elif mode in (VALIDATION_REPORT, VALIDATION_FAST):
+        return get_xmlschema()
+    return None
+
+def parse_invoice(context, invoice):
+    """Return the Invoice of a Dettagli element or None if it is not valid"""
+    lines = ((line.get('descrizione_fatturariga1'), line.get('prezzounitario_fatturariga1')) for line in invoice.iter(XML_NAMESPACE+'Dettagli2'))
+    return build_invoice(context, invoice, lines)
+
+def build_invoice(context, invoice, invoice_lines):
+    """Return the Invoice of the attributes of a Dettagli element, or of a csv record, and of its (description, price) lines, None if it is not valid"""
+    lines = dict()
+    invoice_num = invoice.get('protocollo_fatturatestata')
+    invoice_type = invoice.get('fat_ndc')
+    is_credit_note = invoice_type == 'Nota di credito'
+    total_calculated_amount = 0
+    ritenuta_acconto = 0
+    bollo = 0
+
+    for desc, price in invoice_lines:
+        amount = abs(money.parse_cents(price))
+        if is_credit_note and '-' not in price:
+            amount = -amount
+        if desc == "Ritenuta d'acconto":
+            ritenuta_acconto = amount
+        elif desc == "Bollo":
+            lines[desc] = invoice_model.InvoiceLine(desc, amount)
+            bollo = amount
+            total_calculated_amount += amount
+        else:
+            lines[desc] = invoice_model.InvoiceLine(desc, amount)
+            total_calculated_amount += amount
+    try:
+        ragione_sociale = unidecode.unidecode(invoice.get('cognome_cliente') + ' ' + ' '.join(invoice.get('nome_cliente').split()[0:2]))
+    except TypeError:
+        context.error("ERRORE: il documento %s ha ragione sociale non valida!\n" % invoice_num)
+        return None
 
-def import_xml(parent, input_file_path) -> dict:
-    """Return a dict containing the invoices info"""
-    invoices = dict()
+    invoice_elem = invoice_model.Invoice(
+        invoice_num,
+        invoice_type,
+        invoice.get('protocollo_fatturatestata1'),
+        datetime.datetime.fromisoformat(invoice.get('data_fatturatestata')).strftime("%d%m%Y"),
+        ragione_sociale,
+        str(len(invoice.get('cognome_cliente')) + 1),
+        invoice.get('cf_piva_cliente'),
+        total_calculated_amount,
+        ritenuta_acconto,
+        bollo,
+        tuple(lines.values()),
+    )
+    if context.verbose:
+        context.log("Importata fattura n. %s\n" % invoice_num)
+    return invoice_elem
+
+def iter_xml(context, input_file_path, schema=None):
+    """Yield the invoices of an xml input file one at a time, parsing it incrementally
+
+    if schema is given the file is validated while parsing and lxml.etree.XMLSyntaxError is raised
+    at the first error
+    """
+    seen = set()
+    for _, invoice in lxml.etree.iterparse(input_file_path, events=('end',), tag=XML_NAMESPACE+'Dettagli', schema=schema): # pylint: disable=c-extension-no-member
+        invoice_elem = parse_invoice(context, invoice)
+        invoice.clear()
+        while invoice.getprevious() is not None:
+            del invoice.getparent()[0]
+        if invoice_elem is not None and invoice_elem.num_fattura not in seen:
+            seen.add(invoice_elem.num_fattura)
+            yield invoice_elem
+
+def log_invalid_xml(context, error):
+    """log a validation error raised while streaming"""
+    context.error("ERRORE: xml non valido secondo lo schema xsd, importazione interrotta: %s\n" % error)
+
+def iter_checked_xml(context, input_file_paths, schema=None, report_only: bool = False):
+    """Yield the invoices of iter_xml of the reports in order, once each
+
+    a report not valid is logged and raises InvalidReportError, the invoices already yielded must be
+    discarded; with report_only a report not valid against schema is only logged and the rest of it
+    is read again without validating, so that only a malformed one raises
+    """
+    seen = set()
+
+    def iter_new(input_file_path, schema):
+        for invoice in iter_xml(context, input_file_path, schema):
+            if invoice.num_fattura not in seen:
+                seen.add(invoice.num_fattura)
+                yield invoice
+
+    for input_file_path in input_file_paths:
+        try:
+            try:
+                yield from iter_new(input_file_path, schema)
+            except lxml.etree.XMLSyntaxError as e: # pylint: disable=c-extension-no-member
+                if schema is None or not report_only:
+                    raise
+                context.error("ERRORE: xml non valido secondo lo schema xsd: %s\n" % e)
+                yield from iter_new(input_file_path, None)
+        except lxml.etree.XMLSyntaxError as e: # pylint: disable=c-extension-no-member
+            log_invalid_xml(context, e)
+            raise exc.InvalidReportError(input_file_path, e) from e
+
+def iter_csv(context, input_file_path):
+    """Yield the invoices of a csv input file one at a time, streaming its records"""
+    seen = set()
+    for attributes, lines in csv_reader.iter_invoice_rows(input_file_path):
+        invoice_elem = build_invoice(context, attributes, lines)
+        if invoice_elem is not None and invoice_elem.num_fattura not in seen:
+            seen.add(invoice_elem.num_fattura)
+            yield invoice_elem
+
+def log_invalid_csv(context, error):
+    """log a malformed csv record"""
+    context.error("ERRORE: csv non valido, importazione interrotta: %s\n" % error)
+
+def iter_checked_csv(context, input_file_paths):
+    """Yield the invoices of iter_csv of the reports in order, once each
+
+    a malformed record is logged and raises InvalidReportError, the invoices already yielded must be discarded
+    """
+    seen = set()
+    for input_file_path in input_file_paths:
+        try:
+            for invoice in iter_csv(context, input_file_path):
+                if invoice.num_fattura not in seen:
+                    seen.add(invoice.num_fattura)
+                    yield invoice
+        except (csv.Error, ValueError) as e:
+            log_invalid_csv(context, e)
+            raise exc.InvalidReportError(input_file_path, e) from e
+
+def import_csv(context, input_file_path) -> dict:
+    """Return a dict of the Invoice records of a csv input file by numFattura"""
     if not input_file_path:
         return None
+    try:
+        return {invoice.num_fattura: invoice for invoice in iter_csv(context, input_file_path)}
+    except (csv.Error, ValueError) as e:
+        log_invalid_csv(context, e)
+        return None
 
-    xml_tree = lxml.etree.parse(input_file_path) # pylint: disable=c-extension-no-member
-    if not validate_xml(xml_tree):
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.RED, font=wx.Font(wx.FontInfo(8).Bold())))
-        parent.log_dialog.log_text.AppendText("ERRORE: xml non valido secondo lo schema xsd\n")
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-        wx.Yield()
-
-    root = xml_tree.getroot()
-
-    for invoice in root.iter('{STAT_FATTURATO_CTERZI}Dettagli'):
-        lines = dict()
-        invoice_num = invoice.get('protocollo_fatturatestata')
-        invoice_type = invoice.get('fat_ndc')
-        # total_amount = int(format(round(float(invoice.get('denorm_importototale_fatturatestata')), 2), '.2f').replace('.', '').replace('-', '')) * -1 if '-' in invoice.get('denorm_importototale_fatturatestata') else 1
-        total_calculated_amount = 0
-        ritenuta_acconto = 0
-        bollo = 0
-
-        for line in invoice.iter('{STAT_FATTURATO_CTERZI}Dettagli2'):
-            desc = line.get('descrizione_fatturariga1')
-            sign = 1
-            if invoice_type == 'Nota di credito' and '-' not in line.get('prezzounitario_fatturariga1'):
-                sign = -1
-            amount = int(format(round(float(line.get('prezzounitario_fatturariga1')), 2), '.2f').replace('.', '').replace('-', '')) * sign
-            if desc == "Ritenuta d'acconto":
-                ritenuta_acconto = amount
-            elif desc == "Bollo":
-                lines[desc] = amount
-                bollo = amount
-                total_calculated_amount += amount
-            else:
-                lines[desc] = amount
-                total_calculated_amount += amount
-        try:
-            ragione_sociale = unidecode.unidecode(invoice.get('cognome_cliente') + ' ' + ' '.join(invoice.get('nome_cliente').split()[0:2]))
-        except TypeError:
-            parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.RED, font=wx.Font(wx.FontInfo(8).Bold())))
-            parent.log_dialog.log_text.AppendText("ERRORE: il documento %s ha ragione sociale non valida!\n" % invoice_num)
-            parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-            wx.Yield()
-            continue
+def import_xml(context, input_file_path) -> dict:
+    """Return a dict of the Invoice records by numFattura"""
+    if not input_file_path:
+        return None
+    mode = get_validation_mode(context)
+    schema = prepare_xml(context, input_file_path, mode)
+    if schema is False:
+        return None
+    try:
+        return {invoice.num_fattura: invoice for invoice in iter_checked_xml(context, [input_file_path], schema, mode == VALIDATION_REPORT)}
+    except exc.InvalidReportError:
+        return None
 
-        invoice_elem = {
-            "numFattura": invoice_num,
-            "tipoFattura": invoice_type,
-            "rifFattura": invoice.get('protocollo_fatturatestata1'),
-            "dataFattura": datetime.datetime.fromisoformat(invoice.get('data_fatturatestata')).strftime("%d%m%Y"),
-            "ragioneSociale": ragione_sociale,
-            "posDivide": str(len(invoice.get('cognome_cliente')) + 1),
-            "cf": invoice.get('cf_piva_cliente'),
-            "importoTotale": total_calculated_amount,
-            "ritenutaAcconto": ritenuta_acconto,
-            "bollo": bollo,
-            "righe": lines,
-        }
-        invoices[invoice_num] = invoice_elem
-        if parent.verbose:
-            parent.log_dialog.log_text.AppendText("Importata fattura n. %s\n" % invoice_num)
-            wx.Yield()
-    return invoices
-
-
-def convert(parent):
-    """Output to a file the TRAF2000 records"""
-    output_file_path = None
-
-    parent.log_dialog.log_text.AppendText("Download file input\n")
-    wx.Yield()
-    input_xml = download_input_file(parent)
-
-    invoices = import_xml(parent, input_xml)
-    if not invoices:
-        return
 
-    if parent.output_traf2000_dialog.ShowModal() == wx.ID_OK:
-        output_file_path = parent.output_traf2000_dialog.GetPath()
-    else:
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.RED, font=wx.Font(wx.FontInfo(8).Bold())))
-        parent.log_dialog.log_text.AppendText("ERRORE: non è stato selezionato il file di output del tracciato.\n")
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-        wx.Yield()
+A21CO_SPESA = [{"TRF-A21CO-TIPO": 'F', "TRF-A21CO-TIPO-SPESA": 'SR'}]*2
+A21CO_PAGAMENTI = [{"TRF-A21CO-PAGAM": 'S'}]*2
+
+def render_invoice(records, invoice) -> str:
+    """Return the TRAF2000 records 0, 5 and 1 of an invoice"""
+    if len(invoice.righe) > traf2000_layout.IVA_SLOTS:
+        raise exc.TooManyLinesError(invoice.num_fattura, len(invoice.righe), traf2000_layout.IVA_SLOTS)
+
+    has_cf = len(invoice.cf) == 16
+    is_invoice = invoice.tipo_fattura == "Fattura"
+    ndoc = invoice.num_fattura[4:9]
+
+    record_0 = {
+        "TRF-RASO": invoice.ragione_sociale,
+        "TRF-COFI": invoice.cf if has_cf else None,
+        "TRF-PIVA": None if has_cf else invoice.cf,
+        "TRF-PF": 'S' if has_cf else 'N',
+        "TRF-DIVIDE": invoice.pos_divide,
+        "TRF-CAUSALE": '001' if is_invoice else '002',
+        "TRF-CAU-DES": "FATTURA VENDITA" if is_invoice else "N.C. A CLIENTE",
+        "TRF-DATA-REGISTRAZIONE": invoice.data_fattura,
+        "TRF-DATA-DOC": invoice.data_fattura,
+        "TRF-NDOC": ndoc,
+        "TRF-TOT-FAT": invoice.importo_totale,
+        "TRF-RIT-ACC": invoice.ritenuta_acconto or None,
+        "TRF-RIF-FATTURA": 'N' if is_invoice else 'S',
+    }
+    iva = list()
+    ric = list()
+    for line in invoice.righe:
+        is_bollo = line.descrizione == "Bollo"
+        iva.append({
+            "TRF-IMPONIB": line.importo,
+            "TRF-ALIQ": records.aliq_bollo if is_bollo else records.aliq,
+        })
+        ric.append({
+            "TRF-CONTO-RIC": records.conto_ric_bollo if is_bollo else records.conto_ric,
+            "TRF-IMP-RIC": line.importo,
+        })
+    record_0["TRF-IVA"] = iva
+    record_0["TRF-RIC"] = ric
+
+    #RECORD 5 per Tessera Sanitaria
+    a21co = [{
+        "TRF-A21CO-COFI": invoice.cf,
+        "TRF-A21CO-DATA": invoice.data_fattura,
+        "TRF-A21CO-FLAG": 'S',
+        "TRF-A21CO-ALQ": records.aliq,
+        "TRF-A21CO-IMPORTO": invoice.importo_totale - invoice.bollo,
+        "TRF-A21CO-NDOC": ndoc,
+    }]
+    if invoice.bollo != 0:
+        a21co.append(dict(a21co[0], **{
+            "TRF-A21CO-ALQ": records.aliq_bollo,
+            "TRF-A21CO-IMPORTO": invoice.bollo,
+        }))
+    record_5 = {
+        "TRF-A21CO": a21co,
+        "TRF-RIF-FATT-NDOC": None if is_invoice else invoice.rif_fattura[4:9],
+        "TRF-A21CO-SPESA": A21CO_SPESA[:len(a21co)],
+        "TRF-A21CO-PAGAMENTI": A21CO_PAGAMENTI[:len(a21co)],
+    }
+
+    #RECORD 1 per num. doc. originale
+    record_1 = {
+        "TRF-XNUM-DOC-ORI": invoice.num_fattura,
+    }
+
+    return records.render(record_0, record_5, record_1)
+
+def try_render_invoice(records, invoice) -> tuple:
+    """Return (records, None, seconds) or (None, error message, seconds) of an invoice, an error message can be sent back by a worker process"""
+    start = time.perf_counter()
+    try:
+        return render_invoice(records, invoice), None, time.perf_counter()-start
+    except exc.RecordError as e:
+        return None, str(e), time.perf_counter()-start
+
+_worker_records = None
+
+def init_render_worker(records):
+    """Store the compiled records in a worker process"""
+    global _worker_records # pylint: disable=global-statement
+    _worker_records = records
+
+def render_worker(invoice) -> tuple:
+    """try_render_invoice in a worker process"""
+    return try_render_invoice(_worker_records, invoice)
+
+def get_workers(context) -> int:
+    """Return the number of conversion worker processes, 1 means serial conversion"""
+    workers = context.config.getint('TRAF2000', 'WORKERS', fallback=DEFAULT_WORKERS)
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+def iter_rendered(context, records, invoices):
+    """Yield (invoice, records, error message, render seconds) for each invoice in input order
+
+    With more than one worker the invoices are rendered in a process pool: they are read in windows
+    of RENDER_CHUNK_SIZE invoices per worker and the next window is already being rendered while the
+    results of the current one are yielded, so the input is never read in full.
+    """
+    workers = get_workers(context)
+    if workers == 1:
+        for invoice in invoices:
+            yield (invoice,) + try_render_invoice(records, invoice)
         return
 
-    with open(output_file_path, "w") as traf2000_file:
-        trf_ditta = parent.config['TRAF2000']['TRF-DITTA']
-        trf_aliq = parent.config['TRAF2000']['TRF-ALIQ']
-        trf_aliq_bollo = parent.config['TRAF2000']['TRF-ALIQ-BOLLO']
-        trf_conto_ric = parent.config['TRAF2000']['TRF-CONTO-RIC']
-        trf_conto_ric_bollo = parent.config['TRAF2000']['TRF-CONTO-RIC-BOLLO']
-
-        parent.log_dialog.nc_text.AppendText("Note di credito:\n")
-        wx.Yield()
-
-        for invoice in invoices.values():
-            if invoice["tipoFattura"] != "Fattura" and invoice["tipoFattura"] != "Nota di credito":
-                parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.RED, font=wx.Font(wx.FontInfo(8).Bold())))
-                parent.log_dialog.log_text.AppendText("Errore: il documento %s può essere FATTURA o NOTA DI CREDITO\n" % invoice["numFattura"])
-                parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-                wx.Yield()
-                continue
-
-            if len(invoice["cf"]) != 16 and len(invoice["cf"]) == 11:
-                parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.RED, font=wx.Font(wx.FontInfo(8).Bold())))
-                parent.log_dialog.log_text.AppendText("Errore: il documento %s non ha cf/piva\n" % invoice["numFattura"])
-                parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-                wx.Yield()
-                continue
-
-            if invoice["tipoFattura"] == "Nota di credito":
-                # As for now this script doesn't handle "Note di credito"
-                parent.log_dialog.nc_text.AppendText(invoice["numFattura"]+"\n")
-                wx.Yield()
-                continue
-
-            line = [trf_ditta, "3", "0", "00000"]  # TRF-DITTA + TRF-VERSIONE + TRF-TARC + TRF-COD-CLIFOR
-            line.append(invoice["ragioneSociale"][:32]+' '*(32-len(invoice["ragioneSociale"])))  # TRF-RASO
-            line.append(' '*30)  # TRF-IND
-            line.append('00000')  # TRF-CAP
-            line.append(' '*27)  # TRF-CITTA + TRF-PROV
-
-            if len(invoice["cf"]) == 16:  # se c.f. presente
-                line.append(invoice["cf"])  # TRF-COFI
-                line.append('0'*11)  # TRF-PIVA
-                line.append('S')  # TRF-PF
-            else:  # se piva presente
-                line.append(' '*16)  # TRF-COFI
-                line.append(invoice["cf"])  # TRF-PIVA
-                line.append('N')  # TRF-PF
-
-            line.append('0'*(2-len(invoice["posDivide"])) + invoice["posDivide"])  # TRF-DIVIDE
-            line.append('0000')  # TRF-PAESE
-            line.append(' '*33)  # TRF-PIVA-ESTERO + TRF-COFI-ESTERO + TRF-SESSO
-            line.append('0'*8)  # TRF-DTNAS
-            line.append(' '*64)  # TRF-COMNA + TRF-PRVNA + TRF-PREF + TRF-NTELE-NUM + TRF-FAX-PREF + TRF-FAX-NUM
-            line.append('0'*22)  # TRF-CFCONTO + TRF-CFCODPAG + TRF-CFBANCA + TRF-CFAGENZIA + TRF-CFINTERM
-
-            if invoice["tipoFattura"] == "Fattura":
-                line.append('001')  # TRF-CAUSALE
-                line.append("FATTURA VENDITA")  # TRF-CAU-DES
-            else:
-                line.append('002')  # TRF-CAUSALE
-                line.append("N.C. A CLIENTE ")  # TRF-CAU-DES
-
-            line.append(' '*86)  # TRF-CAU-AGG + TRF-CAU-AGG-1 + TRF-CAU-AGG-2
-            line.append(invoice["dataFattura"]*2)  # TRF-DATA-REGISTRAZIONE + TRF-DATA-DOC
-            line.append('00000000')  # TRF-NUM-DOC-FOR
-            line.append(invoice["numFattura"][4:9])  # TRF-NDOC
-            line.append('00')  # TRF-SERIE
-            line.append('0'*72)  # TRF-EC-PARTITA + TRF-EC-PARTITA-ANNO + TRF-EC-COD-VAL + TRF-EC-CAMBIO + TRF-EC-DATA-CAMBIO + TRF-EC-TOT-DOC-VAL + TRF-EC-TOT-IVA-VAL + TRF-PLAFOND
-
-            count = 0
-            for desc, imponibile in invoice["righe"].items():
-                count += 1
-                imponibile = str(imponibile)
-                if '-' in imponibile:
-                    imponibile.replace('-', '')
-                    imponibile = '0'*(11-len(imponibile)) + imponibile + "-"
+    window_size = workers*RENDER_CHUNK_SIZE
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=init_render_worker, initargs=(records,)) as executor:
+        pending = collections.deque()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < 2:
+                window = list(itertools.islice(invoices, window_size))
+                if window:
+                    pending.append((window, executor.map(render_worker, window, chunksize=RENDER_CHUNK_SIZE)))
                 else:
-                    imponibile = '0'*(11-len(imponibile)) + imponibile + "+"
-                line.append(imponibile)  # TRF-IMPONIB
-                if desc != "Bollo":
-                    line.append(trf_aliq)  # TRF-ALIQ
-                else:
-                    line.append(trf_aliq_bollo)  # TRF-ALIQ
-                line.append('0'*16)  # TRF-ALIQ-AGRICOLA + TRF-IVA11 + TRF-IMPOSTA
+                    exhausted = True
+            if not pending:
+                return
+            window, results = pending.popleft()
+            for invoice, result in zip(window, results):
+                yield (invoice,) + result
+
+def iter_convertible(context, input_file_paths, schema=None):
+    """Yield the invoices of the reports to convert to TRAF2000, logging the ones skipped"""
+    return filter_convertible(context, iter_checked_xml(context, input_file_paths, schema))
+
+def filter_convertible(context, invoices):
+    """Yield the invoices to convert to TRAF2000, logging the ones skipped"""
+    for invoice in invoices:
+        if invoice.tipo_fattura != "Fattura" and invoice.tipo_fattura != "Nota di credito":
+            context.error("Errore: il documento %s può essere FATTURA o NOTA DI CREDITO\n" % invoice.num_fattura)
+            continue
 
-            for _ in range(8-count):
-                line.append('0'*31)
+        if len(invoice.cf) != 16 and len(invoice.cf) == 11:
+            context.error("Errore: il documento %s non ha cf/piva\n" % invoice.num_fattura)
+            continue
 
-            total = str(invoice["importoTotale"])
-            if '-' in total:
-                total.replace('-', '')
-                total = '0'*(11-len(total)) + total + "-"
-            else:
-                total = '0'*(11-len(total)) + total + "+"
-            line.append(total)  # TRF-TOT-FAT
-
-            count = 0
-            for desc, imponibile in invoice["righe"].items():
-                count += 1
-                imponibile = str(imponibile)
-                if '-' in imponibile:
-                    imponibile.replace('-', '')
-                    imponibile = '0'*(11-len(imponibile)) + imponibile + "-"
-                else:
-                    imponibile = '0'*(11-len(imponibile)) + imponibile + "+"
-                if desc != "Bollo":
-                    line.append(trf_conto_ric)  # TRF-CONTO-RIC
-                else:
-                    line.append(trf_conto_ric_bollo)  # TRF-CONTO-RIC
-                line.append(imponibile)  # TRF-IMP-RIC
-
-            for _ in range(8-count):
-                line.append('0'*19)
-
-            line.append('000')  # TRF-CAU-PAG
-            line.append(' '*83)  # TRF-CAU-DES-PAGAM + TRF-CAU-AGG-1-PAGAM + TRF-CAU-AGG-2-PAGAM
-            line.append(('0000000' + ' ' + '0'*12 + ' '*18 + '0'*26)*80)  # TRF-CONTO + TRF-DA + TRF-IMPORTO + TRF-CAU-AGGIUNT + TRF-EC-PARTITA-PAG + TRF-EC-PARTITA-ANNO-PAG + TRF-EC-IMP-VAL
-            line.append((' ' + '0'*18)*10)  # TRF-RIFER-TAB + TRF-IND-RIGA + TRF-DT-INI + TRF-DT-FIN
-            line.append('000000')  # TRF-DOC6
-            line.append('N' + '0')  # TRF-AN-OMONIMI + TRF-AN-TIPO-SOGG
-            line.append('00'*80)  # TRF-EC-PARTITA-SEZ-PAG
-            line.append('0'*15)  # TRF-NUM-DOC-PAG-PROF + TRF-DATA-DOC-PAG-PROF
-
-            if invoice["ritenutaAcconto"] != 0:
-                imponibile = str(invoice["ritenutaAcconto"])
-                imponibile = '0'*(11-len(imponibile)) + imponibile + "+"
-                line.append(imponibile)  # TRF-RIT-ACC
-            else:
-                line.append('0'*12)  # TRF-RIT-ACC
-
-            line.append('0'*60)  # TRF-RIT-PREV + TRF-RIT-1 + TRF-RIT-2 + TRF-RIT-3 + TRF-RIT-4
-            line.append('00'*8)  # TRF-UNITA-RICAVI
-            line.append('00'*80)  # TRF-UNITA-PAGAM
-            line.append(' '*24)  # TRF-FAX-PREF-1 + TRF-FAX-NUM-1
-            line.append(' ' + ' ')  # TRF-SOLO-CLIFOR + TRF-80-SEGUENTE
-            line.append('0000000')  # TRF-CONTO-RIT-ACC
-            line.append('0'*35)   # TRF-CONTO-RIT-PREV + TRF-CONTO-RIT-1 + TRF-CONTO-RIT-2 + TRF-CONTO-RIT-3 + TRF-CONTO-RIT-4
-            line.append('N' + 'N' + '00000000' + '000')  # TRF-DIFFERIMENTO-IVA + TRF-STORICO + TRF-STORICO-DATA + TRF-CAUS-ORI
-            line.append(' ' + ' ' + '0'*16 + ' ')  # TRF-PREV-TIPOMOV + TRF-PREV-RATRIS + TRF-PREV-DTCOMP-INI + TRF-PREV-DTCOMP-FIN + TRF-PREV-FLAG-CONT
-            line.append(' '*20 + '0'*21 + ' '*44 + '0'*8 + ' ' + '0'*6 + ' ' + '00' + ' ')  # TRF-RIFERIMENTO + TRF-CAUS-PREST-ANA + TRF-EC-TIPO-PAGA + TRF-CONTO-IVA-VEN-ACQ + TRF-PIVA-VECCHIA + TRF-PIVA-ESTERO-VECCHIA + # TRF-RISERVATO + TRF-DATA-IVA-AGVIAGGI + TRF-DATI-AGG-ANA-REC4 + TRF-RIF-IVA-NOTE-CRED + TRF-RIF-IVA-ANNO-PREC + TRF-NATURA-GIURIDICA + TRF-STAMPA-ELENCO
-            line.append('000'*8 + ' '*20 + '0' + ' '*4 + '0'*6 + ' '*20 + 'S' + 'N')  # TRF-PERC-FORF + TRF-SOLO-MOV-IVA + TRF-COFI-VECCHIO + TRF-USA-PIVA-VECCHIA + TRF-USA-PIVA-EST-VECCHIA + TRF-USA-COFI-VECCHIO + TRF-ESIGIBILITA-IVA + TRF-TIPO-MOV-RISCONTI + TRF-AGGIORNA-EC + TRF-BLACKLIST-ANAG + TRF-BLACKLIST-IVA-ANNO + TRF-CONTEA-ESTERO + TRF-ART21-ANAG + TRF-ART21-IVA
-
-            if invoice["tipoFattura"] == "Fattura":
-                line.append('N')  # TRF-RIF-FATTURA
-            else:
-                line.append('S')  # TRF-RIF-FATTURA
-            line.append('S' + ' '*2 + 'S' + ' '*2)  # TRF-RISERVATO-B + TRF-MASTRO-CF + TRF-MOV-PRIVATO + TRF-SPESE-MEDICHE + TRF-FILLER
-            line.append('\n')
-            if parent.verbose:
-                parent.log_dialog.log_text.AppendText("Creato record #0 per fattura n. %s\n" % invoice["numFattura"])
-                wx.Yield()
-
-            #RECORD 5 per Tessera Sanitaria
-            line.append(trf_ditta + '3' + '5')  # TRF5-DITTA + TRF5-VERSIONE + TRF5-TARC
-            line.append(' '*1200)  # TRF-ART21-CONTRATTO
-            line.append('0'*6 + invoice["cf"])  # TRF-A21CO-ANAG + # TRF-A21CO-COFI
-            total = str(invoice["importoTotale"] - invoice["bollo"])
-            total = '0'*(13-len(total)) + total + "+"
-            line.append(invoice["dataFattura"] + 'S' + trf_aliq + total + '0'*14 + '0' + invoice["numFattura"][4:9] + '00' + 'N' + ' '*39)  # TRF-A21CO-DATA + TRF-A21CO-FLAG + TRF-A21CO-ALQ + TRF-A21CO-IMPORTO + TRF-A21CO-IMPOSTA + TRF-A21CO-NDOC + TRF-A21CO-FLAG-OPPOS + FILLER
-            if invoice["bollo"] != 0:
-                line.append('0'*6 + invoice["cf"])  # TRF-A21CO-ANAG + # TRF-A21CO-COFI
-                bollo = str(invoice["bollo"])
-                bollo = '0'*(13-len(bollo)) + bollo + "+"
-                line.append(invoice["dataFattura"] + 'S' + trf_aliq_bollo + bollo + '0'*14 + '0' + invoice["numFattura"][4:9] + '00' + 'N' + ' '*39)  # TRF-A21CO-DATA + TRF-A21CO-FLAG + TRF-A21CO-ALQ + TRF-A21CO-IMPORTO + TRF-A21CO-IMPOSTA + TRF-A21CO-NDOC + TRF-A21CO-FLAG-OPPOS + FILLER
-            else:
-                line.append('0'*6 + ' '*16 + '0'*8 + ' ' + '000' + '0'*14 + '0'*14 + '0'*8 + 'N' + ' '*39)  # TRF-A21CO-ANAG + TRF-A21CO-COFI + TRF-A21CO-DATA + TRF-A21CO-FLAG + TRF-A21CO-ALQ + TRF-A21CO-IMPORTO + TRF-A21CO-IMPOSTA + TRF-A21CO-NDOC + TRF-A21CO-FLAG-OPPOS + FILLER    
-            line.append(('0'*6 + ' '*16 + '0'*8 + ' ' + '000' + '0'*14 + '0'*14 + '0'*8 + 'N' + ' '*39)*48)  # TRF-A21CO-ANAG + TRF-A21CO-COFI + TRF-A21CO-DATA + TRF-A21CO-FLAG + TRF-A21CO-ALQ + TRF-A21CO-IMPORTO + TRF-A21CO-IMPOSTA + TRF-A21CO-NDOC + TRF-A21CO-FLAG-OPPOS + FILLER
+        if invoice.tipo_fattura == "Nota di credito":
+            # As for now this script doesn't handle "Note di credito"
+            context.credit_note(invoice.num_fattura+"\n")
+            continue
 
-            if invoice["tipoFattura"] == "Nota di credito":
-                line.append('000' + invoice["rifFattura"][4:9])  # TRF-RIF-FATT-NDOC
-                line.append('0'*8)  # TRF-RIF-FATT-DDOC
-            else:
-                line.append('0'*16)  # TRF-RIF-FATT-NDOC + TRF-RIF-FATT-DDOC
-            line.append('F' + 'SR' + ' ')  # TRF-A21CO-TIPO + TRF-A21CO-TIPO-SPESA + TRF-A21CO-FLAG-SPESA
-            if invoice["bollo"] != 0:
-                line.append('F' + 'SR' + ' ')  # TRF-A21CO-TIPO + TRF-A21CO-TIPO-SPESA + TRF-A21CO-FLAG-SPESA
-            else:
-                line.append(' ' + '  ' + ' ')  # TRF-A21CO-TIPO + TRF-A21CO-TIPO-SPESA + TRF-A21CO-FLAG-SPESA
-            line.append((' ' + '  ' + ' ')*48)  # TRF-A21CO-TIPO + TRF-A21CO-TIPO-SPESA + TRF-A21CO-FLAG-SPESA
-            line.append(' ') # TRF-SPESE-FUNEBRI
-            line.append('S') # TRF-A21CO-PAGAM
-            if invoice["bollo"] != 0:
-                line.append('S')
+        yield invoice
+
+def iter_cataloged(context, catalog, invoices):
+    """Yield the invoices recording them in catalog in batches, a catalog error is logged and stops the recording"""
+    batch = list()
+    for invoice in invoices:
+        if catalog is not None:
+            batch.append(invoice)
+            if len(batch) >= invoice_catalog.BATCH_SIZE:
+                try:
+                    catalog.upsert_imported(batch)
+                except sqlite3.Error as e:
+                    context.error("Errore: impossibile aggiornare il catalogo delle fatture: %s\n" % e)
+                    catalog = None
+                batch.clear()
+        yield invoice
+    if catalog is not None and batch:
+        try:
+            catalog.upsert_imported(batch)
+        except sqlite3.Error as e:
+            context.error("Errore: impossibile aggiornare il catalogo delle fatture: %s\n" % e)
+
+def iter_delta(context, ledger, invoices, hashes: dict):
+    """Yield the invoices never exported according to ledger or changed since, storing their content hashes in hashes"""
+    exported_count = 0
+    for invoice in invoices:
+        content_hash = traf2000_ledger.invoice_hash(invoice)
+        status = ledger.status(invoice.num_fattura, content_hash)
+        if status is None:
+            exported_count += 1
+            if context.verbose:
+                context.log("Fattura n. %s già esportata\n" % invoice.num_fattura)
+            continue
+        if status == 'changed':
+            context.log("Fattura n. %s modificata dall'ultima esportazione, verrà esportata di nuovo\n" % invoice.num_fattura)
+        hashes[invoice.num_fattura] = content_hash
+        yield invoice
+    if exported_count:
+        context.log("%d fatture già esportate non sono state convertite\n" % exported_count)
+
+def convert(context) -> bool:
+    """Output to a file the TRAF2000 records, return True if the file has been written"""
+    context.log("Download file input\n")
+    report_format = report_server.get_report_format(context, 'TRAF2000', REPORT_FORMATS, 'xml')
+    input_files = report_server.download_reports(context, report_format)
+    if not input_files:
+        return False
+    schema = None
+    report_only = False
+    if report_format == report_server.FORMAT_XML:
+        mode = get_validation_mode(context)
+        report_only = mode == VALIDATION_REPORT
+        with context.metrics.stage('xsd_validation'):
+            for input_xml in input_files:
+                schema = prepare_xml(context, input_xml, mode)
+                if schema is False:
+                    break
+        if schema is False:
+            context.error("ERRORE: conversione annullata.\n")
+            return False
+
+    try:
+        records = traf2000_layout.Traf2000Records(
+            context.config['TRAF2000']['TRF-DITTA'],
+            context.config['TRAF2000']['TRF-ALIQ'],
+            context.config['TRAF2000']['TRF-ALIQ-BOLLO'],
+            context.config['TRAF2000']['TRF-CONTO-RIC'],
+            context.config['TRAF2000']['TRF-CONTO-RIC-BOLLO'],
+        )
+    except exc.FieldOverflowError as e:
+        context.error("ERRORE: configurazione TRAF2000 non valida: %s\n" % e)
+        return False
+
+    try:
+        ledger = traf2000_ledger.open_ledger(context.config)
+    except (OSError, ValueError) as e:
+        context.error("ERRORE: impossibile leggere il registro delle fatture esportate: %s\n" % e)
+        return False
+    append = context.config.getboolean('TRAF2000', 'APPEND', fallback=False)
+
+    output_file_path = context.ask_traf2000_output_path()
+    if output_file_path is None:
+        context.error("ERRORE: non è stato selezionato il file di output del tracciato.\n")
+        return False
+
+    try:
+        catalog = invoice_catalog.open_catalog(context.config)
+    except (sqlite3.Error, OSError) as e:
+        context.error("Errore: impossibile aprire il catalogo delle fatture: %s\n" % e)
+        catalog = None
+
+    try:
+        append_offset = os.path.getsize(output_file_path) if append and os.path.isfile(output_file_path) else None
+        hashes = dict()
+        converted = list()
+        try:
+            with open(output_file_path, "a" if append else "w") as traf2000_file:
+                context.credit_note("Note di credito:\n")
+
+                batch = list()
+                if report_format == report_server.FORMAT_CSV:
+                    invoices = context.metrics.timed_iter('csv_import', iter_checked_csv(context, input_files))
+                else:
+                    invoices = context.metrics.timed_iter('xml_import', iter_checked_xml(context, input_files, schema, report_only))
+                if catalog is not None:
+                    invoices = iter_cataloged(context, catalog, invoices)
+                invoices = filter_convertible(context, invoices)
+                if ledger is not None:
+                    invoices = iter_delta(context, ledger, invoices, hashes)
+                for invoice, rendered, error, seconds in iter_rendered(context, records, invoices):
+                    context.check_cancelled()
+                    if error is not None:
+                        context.error("Errore: impossibile convertire il documento %s: %s\n" % (invoice.num_fattura, error))
+                        continue
+                    context.metrics.add_item('render', invoice.num_fattura, seconds, len(rendered))
+                    if ledger is not None:
+                        ledger.record(invoice.num_fattura, hashes.pop(invoice.num_fattura), output_file_path)
+                    converted.append(invoice.num_fattura)
+                    batch.append(rendered)
+                    if len(batch) >= WRITE_BATCH_SIZE:
+                        with context.metrics.stage('write') as stage:
+                            stage.bytes = traf2000_file.write(''.join(batch))
+                        batch.clear()
+
+                    if context.verbose:
+                        context.log("Creato record #0 per fattura n. %s\n" % invoice.num_fattura)
+                        context.log("Creato record #5 per fattura n. %s\n" % invoice.num_fattura)
+                        context.log("Creato record #1 per fattura n. %s\n" % invoice.num_fattura)
+                        context.log("Convertita fattura n. %s\n" % invoice.num_fattura)
+
+                with context.metrics.stage('write') as stage:
+                    stage.bytes = traf2000_file.write(''.join(batch))
+        except (exc.ActionError, exc.InvalidReportError) as e:
+            if append_offset is None:
+                os.remove(output_file_path)
             else:
-                line.append(' ')
-            line.append(' '*74)  # TRF-A21CO-PAGAM + FILLER + FILLER
-            line.append('\n')
-            if parent.verbose:
-                parent.log_dialog.log_text.AppendText("Creato record #5 per fattura n. %s\n" % invoice["numFattura"])
-                wx.Yield()
-
-            #RECORD 1 per num. doc. originale
-            line.append(trf_ditta + '3' + '1')  # TRF1-DITTA + TRF1-VERSIONE + TRF1-TARC
-            line.append('0'*7 + ' '*3 + '0'*14)  # TRF-NUM-AUTOFATT + TRF-SERIE-AUTOFATT + TRF-COD-VAL + TRF-TOTVAL
-            line.append((' '*8 + '0'*24 + ' ' + '0'*36 + ' '*2 + '0'*9 + ' '*5)*20)  # TRF-NOMENCLATURA + TRF-IMP-LIRE + TRF-IMP-VAL + TRF-NATURA + TRF-MASSA + TRF-UN-SUPPL + TRF-VAL-STAT + TRF-REGIME + TRF-TRASPORTO + TRF-PAESE-PROV + TRF-PAESE-ORIG + TRF-PAESE-DEST + TRF-PROV-DEST + TRF-PROV-ORIG + TRF-SEGNO-RET
-            line.append(' ' + '0'*6 + ' '*173)  # TRF-INTRA-TIPO + TRF-MESE-ANNO-RIF + SPAZIO
-            line.append('0'*45 + ' '*4 + '0'*20 + ' '*28 + '0'*25)  # TRF-RITA-TIPO + TRF-RITA-IMPON + TRF-RITA-ALIQ + TRF-RITA-IMPRA + TRF-RITA-PRONS + TRF-RITA-MESE + TRF-RITA-CAUSA + TRF-RITA-TRIBU + TRF-RITA-DTVERS + TRF-RITA-IMPAG + TRF-RITA-TPAG + TRF-RITA-SERIE + TRF-RITA-QUIETANZA + TRF-RITA-NUM-BOLL + TRF-RITA-ABI + TRF-RITA-CAB + TRF-RITA-AACOMP + TRF-RITA-CRED
-            line.append(' ' + '0'*44 + ' '*11 + '0'*64)  #TRF-RITA-SOGG + TRF-RITA-BASEIMP + TRF-RITA-FRANCHIGIA + TRF-RITA-CTO-PERC + TRF-RITA-CTO-DITT + FILLER + TRF-RITA-DATA + TRF-RITA-TOTDOC + TRF-RITA-IMPVERS + TRF-RITA-DATA-I + TRF-RITA-DATA-F + TRF-EMENS-ATT + TRF-EMENS-RAP + TRF-EMENS-ASS + TRF-RITA-TOTIVA
-            line.append('0'*6 + ' '*178)  # TRF-CAUS-PREST-ANA-B + TRF-RITA-CAUSA-B + FILLER
-            line.append('0'*13 + ' '*30 + '0'*14)  # TRF-POR-CODPAG + TRF-POR-BANCA + TRF-POR-AGENZIA + TRF-POR-DESAGENZIA + TRF-POR-TOT-RATE + TRF-POR-TOTDOC
-            line.append(('0'*65 + ' '*2)*12)  # TRF-POR-NUM-RATA + TRF-POR-DATASCAD + TRF-POR-TIPOEFF + TRF-POR-IMPORTO-EFF + TRF-POR-IMPORTO-EFFVAL + TRF-POR-IMPORTO-BOLLI + TRF-POR-IMPORTO-BOLLIVAL + TRF-POR-FLAG + TRF-POR-TIPO-RD
-            line.append('0'*4 + ' '*336)  # TRF-POR-CODAGE + TRF-POR-EFFETTO-SOSP + TRF-POR-CIG + TRF-POR-CUP + SPAZIO
-            line.append((' '*3 + '0'*16)*20)  # TRF-COD-VAL-IV + TRF-IMP-VALUTA-IV
-            line.append((' '*6 + '0'*35 + ' '*2 + '0'*20 + ' '*19 + '0'*16)*20)  # TRF-CODICE-SERVIZIO + TRF-STATO-PAGAMENTO + TRF-SERV-IMP-EURO + TRF-SERV-IMP-VAL + TRF-DATA-DOC-ORIG + TRF-MOD-EROGAZIONE + TRF-MOD-INCASSO + TRF-PROT-REG + TRF-PROG-REG + TRF-COD-SEZ-DOG-RET + TRF-ANNO-REG-RET + TRF-NUM-DOC-ORIG + TRF-SERV-SEGNO-RET + TRF-SERV-COD-VAL-IV + TRF-SERV-IMP-VALUTA-IV
-            line.append(' '*1 + '0'*6)  # TRF-INTRA-TIPO-SERVIZIO + TRF-SERV-MESE-ANNO-RIF
-            line.append(' '*8)  # TRF-CK-RCHARGE
-            line.append('0'*(15-len(invoice["numFattura"])) + invoice["numFattura"])  # TRF-XNUM-DOC-ORI
-            line.append(' ' + '00' + ' '*1090)  # TRF-MEM-ESIGIB-IVA + TRF-COD-IDENTIFICATIVO + TRF-ID-IMPORTAZIONE + TRF-XNUM-DOC-ORI-20 + SPAZIO + FILLER
-            if parent.verbose:
-                parent.log_dialog.log_text.AppendText("Creato record #1 per fattura n. %s\n" % invoice["numFattura"])
-                wx.Yield()
-
-            line = ''.join(line) + '\n'
-
-            traf2000_file.write(line)
-            if parent.verbose:
-                parent.log_dialog.log_text.AppendText("Convertita fattura n. %s\n" % invoice["numFattura"])
-                wx.Yield()
-
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr(wx.BLACK, font=wx.Font(wx.FontInfo(8).Bold())))
-        parent.log_dialog.log_text.AppendText("Conversione terminata.\nTracciato TRAF2000 salvato in %s\n" % output_file_path)
-        parent.log_dialog.log_text.SetDefaultStyle(wx.TextAttr())
-        wx.Yield()
+                os.truncate(output_file_path, append_offset)
+            if isinstance(e, exc.ActionError):
+                raise
+            context.error("ERRORE: conversione annullata.\n")
+            return False
+
+        if ledger is not None:
+            try:
+                ledger.save()
+            except OSError as e:
+                context.error("ERRORE: impossibile aggiornare il registro delle fatture esportate, le fatture convertite ora verranno esportate di nuovo: %s\n" % e)
+                return False
+
+        if ledger is not None:
+            context.log("%d fatture nuove o modificate convertite\n" % len(converted))
+        if catalog is not None:
+            try:
+                with context.metrics.stage('catalog'):
+                    catalog.mark_exported(converted, output_file_path)
+            except sqlite3.Error as e:
+                context.error("Errore: impossibile aggiornare il catalogo delle fatture: %s\n" % e)
+        context.success("Conversione terminata.\nTracciato TRAF2000 salvato in %s\n" % output_file_path)
+        context.metrics.set_output(output_file_path)
+        metrics.write_summary(context)
+        return True
+    finally:
+        if catalog is not None:
+            catalog.close()
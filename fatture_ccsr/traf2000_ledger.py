@@ -0,0 +1,58 @@
+"""persistent ledger of the invoices exported to TRAF2000, for the incremental conversions"""
+
+import os
+import json
+import time
+import hashlib
+
+DEFAULT_LEDGER_PATH = os.path.join(os.path.expanduser('~'), '.fatture_ccsr', 'traf2000_ledger.json')
+
+def invoice_hash(invoice) -> str:
+    """return the hex sha256 digest of the content of an imported Invoice"""
+    return hashlib.sha256(json.dumps(invoice.as_dict(), sort_keys=True).encode('utf-8')).hexdigest()
+
+class Ledger:
+    """on-disk index mapping every exported numFattura to the hash of its content and the file it went to"""
+    def __init__(self, ledger_path: str):
+        self.ledger_path = ledger_path
+        self.entries = dict()
+
+        try:
+            with open(ledger_path, 'r', encoding='utf-8') as ledger_file:
+                self.entries = json.load(ledger_file)
+        except FileNotFoundError:
+            self.entries = dict()
+
+    def status(self, invoice_num: str, content_hash: str):
+        """return None if the invoice has been exported with this content, 'new' or 'changed' otherwise"""
+        entry = self.entries.get(invoice_num)
+        if entry is None:
+            return 'new'
+        if entry["hash"] != content_hash:
+            return 'changed'
+        return None
+
+    def record(self, invoice_num: str, content_hash: str, output_path: str):
+        """mark the invoice as exported to output_path with this content"""
+        self.entries[invoice_num] = {
+            "hash": content_hash,
+            "output": output_path,
+            "exported": time.time(),
+        }
+
+    def save(self):
+        """atomically write the ledger"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.ledger_path)), exist_ok=True)
+        tmp_path = self.ledger_path+'.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as ledger_file:
+            json.dump(self.entries, ledger_file)
+        os.replace(tmp_path, self.ledger_path)
+
+def open_ledger(config):
+    """return the Ledger configured in the [TRAF2000] section or None if the conversions are not incremental
+
+    a ledger that cannot be read raises OSError or ValueError, it is not silently started over
+    """
+    if not config.getboolean('TRAF2000', 'INCREMENTAL', fallback=False):
+        return None
+    return Ledger(os.path.expanduser(config.get('TRAF2000', 'LEDGER', fallback=DEFAULT_LEDGER_PATH)))
@@ -0,0 +1,166 @@
+"""read the invoices index straight from the xml parts of a CCSR .xlsx report, without openpyxl"""
+
+import re
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+OFFICE_DOCUMENT_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+SHARED_STRINGS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings'
+
+ID_COLUMN = "I"
+TYPE_COLUMN = "AP"
+URL_COLUMN = "BG"
+OWNER_CELL = ("B", 1)
+
+CELL_REF_RE = re.compile(r'([A-Z]+)(\d+)')
+
+def column_letter(index: int) -> str:
+    """return the column letters of a 1-based column index"""
+    letters = ''
+    while index > 0:
+        index, rem = divmod(index-1, 26)
+        letters = chr(65+rem) + letters
+    return letters
+
+def rels_path(part_path: str) -> str:
+    """return the path of the relationships part of part_path"""
+    directory, name = posixpath.split(part_path)
+    return posixpath.join(directory, '_rels', name+'.rels')
+
+def read_rels(xlsx_zip, part_path: str) -> dict:
+    """return {Id: (Type, Target)} of the relationships of part_path, targets resolved to zip paths when internal"""
+    rels = dict()
+    try:
+        data = xlsx_zip.read(rels_path(part_path))
+    except KeyError:
+        return rels
+    for rel in ET.fromstring(data).iter(PKG_REL_NS+'Relationship'):
+        target = rel.get('Target')
+        if rel.get('TargetMode') != 'External':
+            if target.startswith('/'):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join(posixpath.dirname(part_path), target))
+        rels[rel.get('Id')] = (rel.get('Type'), target)
+    return rels
+
+def shared_string_text(si_elem) -> str:
+    """return the text of a si element, either plain or rich text, skipping phonetic runs"""
+    text = si_elem.find(MAIN_NS+'t')
+    if text is not None:
+        return text.text or ''
+    return ''.join(run.findtext(MAIN_NS+'t') or '' for run in si_elem.findall(MAIN_NS+'r'))
+
+def read_shared_strings(xlsx_zip, path: str) -> list:
+    """return the shared strings table"""
+    strings = list()
+    if path is None:
+        return strings
+    with xlsx_zip.open(path) as shared_strings:
+        for _, elem in ET.iterparse(shared_strings, events=('end',)):
+            if elem.tag == MAIN_NS+'si':
+                strings.append(shared_string_text(elem))
+                elem.clear()
+    return strings
+
+def active_sheet_paths(xlsx_zip) -> tuple:
+    """return (sheet path, shared strings path) of the active sheet"""
+    workbook_path = 'xl/workbook.xml'
+    for rel_type, target in read_rels(xlsx_zip, '').values():
+        if rel_type == OFFICE_DOCUMENT_REL:
+            workbook_path = target
+    workbook = ET.fromstring(xlsx_zip.read(workbook_path))
+    workbook_rels = read_rels(xlsx_zip, workbook_path)
+
+    active_tab = 0
+    view = workbook.find(MAIN_NS+'bookViews/'+MAIN_NS+'workbookView')
+    if view is not None:
+        active_tab = int(view.get('activeTab', 0))
+    sheets = workbook.findall(MAIN_NS+'sheets/'+MAIN_NS+'sheet')
+    sheet_path = workbook_rels[sheets[active_tab].get(REL_NS+'id')][1]
+
+    shared_strings_path = None
+    for rel_type, target in workbook_rels.values():
+        if rel_type == SHARED_STRINGS_REL:
+            shared_strings_path = target
+    return sheet_path, shared_strings_path
+
+def cell_value(cell, shared_strings: list):
+    """return the string value of a c element"""
+    cell_type = cell.get('t')
+    if cell_type == 'inlineStr':
+        inline_string = cell.find(MAIN_NS+'is')
+        return None if inline_string is None else shared_string_text(inline_string)
+    value = cell.find(MAIN_NS+'v')
+    if value is None or value.text is None:
+        return None
+    if cell_type == 's':
+        return shared_strings[int(value.text)]
+    return value.text
+
+def get_invoices_info(input_file_path: str) -> tuple:
+    """extract invoices IDs and URLs from xlsx input file streaming the active sheet"""
+    owner_value = None
+    rows = dict()
+    hyperlinks = dict()
+
+    with zipfile.ZipFile(input_file_path) as xlsx_zip:
+        sheet_path, shared_strings_path = active_sheet_paths(xlsx_zip)
+        shared_strings = read_shared_strings(xlsx_zip, shared_strings_path)
+
+        row_index = 0
+        column_index = 0
+        with xlsx_zip.open(sheet_path) as sheet:
+            for event, elem in ET.iterparse(sheet, events=('start', 'end')):
+                tag = elem.tag
+                if event == 'start':
+                    if tag == MAIN_NS+'row':
+                        row_index = int(elem.get('r', row_index+1))
+                        column_index = 0
+                    continue
+                if tag == MAIN_NS+'c':
+                    ref = elem.get('r')
+                    if ref is None:
+                        column_index += 1
+                        column = column_letter(column_index)
+                    else:
+                        column = CELL_REF_RE.match(ref).group(1)
+                    if column in (ID_COLUMN, TYPE_COLUMN):
+                        rows.setdefault(row_index, dict())[column] = cell_value(elem, shared_strings)
+                    elif (column, row_index) == OWNER_CELL:
+                        owner_value = cell_value(elem, shared_strings)
+                elif tag == MAIN_NS+'row':
+                    elem.clear()
+                elif tag == MAIN_NS+'hyperlink':
+                    first, _, last = elem.get('ref').partition(':')
+                    first_column, first_row = CELL_REF_RE.match(first).groups()
+                    last_row = CELL_REF_RE.match(last).group(2) if last else first_row
+                    if first_column == URL_COLUMN:
+                        for row in range(int(first_row), int(last_row)+1):
+                            hyperlinks[row] = elem.get(REL_NS+'id')
+
+        sheet_rels = read_rels(xlsx_zip, sheet_path)
+
+    owner_name = '_'.join(owner_value.split()[2:])
+    invoices = dict()
+    for row in sorted(rows):
+        invoice_id = rows[row].get(ID_COLUMN)
+        if invoice_id is not None and "CCSR" in invoice_id:
+            invoice_id = invoice_id.replace("/", "-")
+            invoice_url = None
+            if row in hyperlinks and hyperlinks[row] in sheet_rels:
+                invoice_url = sheet_rels[hyperlinks[row]][1]
+            invoice = {
+                "id": invoice_id,
+                "type": rows[row].get(TYPE_COLUMN),
+                "url": invoice_url,
+                "path": None,
+                "good": None,
+            }
+            invoices[invoice_id] = invoice
+    invoices_info = (owner_name, invoices)
+    return invoices_info
@@ -0,0 +1,7 @@
+"""make the flat modules of the application and of the benchmarks importable by the tests"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT_DIR, 'fatture_ccsr'), os.path.join(ROOT_DIR, 'benchmarks')]
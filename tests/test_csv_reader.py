@@ -0,0 +1,26 @@
+"""amounts of the csv reports in either locale"""
+
+import pytest
+
+import csv_reader
+
+@pytest.mark.parametrize('value, amount', [
+    ('1234.50', '1234.50'),
+    ('1234,50', '1234.50'),
+    ('1.234,50', '1234.50'),
+    ('1,234.50', '1234.50'),
+    ('-1.234,50', '-1234.50'),
+    ('1.234.567', '1234567'),
+    ('1,234,567.89', '1234567.89'),
+    ('0,125', '0.125'),
+    ('-0.125', '-0.125'),
+    ('12', '12'),
+    ('', ''),
+])
+def test_normalize_amount(value, amount):
+    assert csv_reader.normalize_amount(value) == amount
+
+@pytest.mark.parametrize('value', ['1,234', '1.234', '-1,234', '1,23.45', '1.2345,6', '1.234,567,8', 'abc,5', '1,234.5x'])
+def test_normalize_amount_invalid(value):
+    with pytest.raises(ValueError):
+        csv_reader.normalize_amount(value)
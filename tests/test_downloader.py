@@ -0,0 +1,80 @@
+"""tests of the download of the invoices against the fake report server of the benchmarks"""
+
+import threading
+import configparser
+
+import PyPDF2
+import pytest
+
+import downloader
+import fake_report_server
+import generators
+import report_server
+import run_context
+
+INVOICES = 30
+CORRUPT_RATE = 0.2
+FAULT_SEED = 1
+
+class LogContext(run_context.RunContext):
+    """run context keeping its progress and error messages"""
+    def __init__(self, *args, **kwargs):
+        super(LogContext, self).__init__(*args, **kwargs)
+        self.messages = list()
+
+    def log(self, text: str):
+        self.messages.append(text)
+
+    def error(self, text: str):
+        self.messages.append(text)
+
+@pytest.fixture(name='server')
+def fixture_server():
+    args = fake_report_server.parse_args(['--port', '0', '--auth', 'none', '--invoices', str(INVOICES),
+                                          '--corrupt-rate', str(CORRUPT_RATE), '--fault-seed', str(FAULT_SEED)])
+    server = fake_report_server.ReportServer((args.host, args.port), args)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+def new_context(server, tmp_path, pdf_output) -> LogContext:
+    """return a context downloading every invoice of server in a single worker, caching them in tmp_path"""
+    config = configparser.ConfigParser()
+    config['REPORT_SERVER'] = {'URL': server.base_url()}
+    config['DOWNLOADER'] = {'WORKERS': '1', 'RETRY-PASSES': '10'}
+    config['CACHE'] = {'PATH': str(tmp_path / 'cache')}
+    config['REPORT_CACHE'] = {'ENABLED': 'no'}
+    config['CATALOG'] = {'ENABLED': 'no'}
+    config['METRICS'] = {'SUMMARY': 'no'}
+    end_date = generators.FIRST_DATE.replace(year=generators.FIRST_DATE.year+1)
+    return LogContext(config, report_server.new_session(config), generators.FIRST_DATE, end_date, pdf_output=str(pdf_output))
+
+def count_pages(path) -> int:
+    """return the number of pages of a pdf"""
+    with open(path, 'rb') as pdf_file:
+        return PyPDF2.PdfFileReader(pdf_file).getNumPages()
+
+def test_download_invoices(server, tmp_path):
+    # the server sends a pdf of two pages every ten invoices
+    pages = sum(1 + (index % 10 == 0) for index in range(1, INVOICES+1))
+
+    first_output = tmp_path / 'first.pdf'
+    context = new_context(server, tmp_path, first_output)
+    assert downloader.download_invoices(context)
+    assert server.counters['corrupt'] > 0
+    assert any(message.startswith("Nuovo tentativo di download") for message in context.messages)
+    assert server.counters['invoice'] == INVOICES + server.counters['corrupt']
+    assert count_pages(first_output) == pages
+
+    # every invoice is in the cache now, a second download asks the server only the report
+    invoice_requests = server.counters['invoice']
+    second_output = tmp_path / 'second.pdf'
+    context = new_context(server, tmp_path, second_output)
+    context.verbose = True
+    assert downloader.download_invoices(context)
+    assert server.counters['invoice'] == invoice_requests
+    assert sum("già presente in cache" in message for message in context.messages) == INVOICES
+    assert count_pages(second_output) == pages
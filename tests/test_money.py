@@ -0,0 +1,66 @@
+"""edge cases of the integer-cent amounts"""
+
+import pytest
+
+import money
+
+@pytest.mark.parametrize('text, cents', [
+    ('1234.56', 123456),
+    ('1234.5', 123450),
+    ('1234', 123400),
+    ('.5', 50),
+    ('+2.00', 200),
+    ('0.00', 0),
+    ('-0.00', 0),
+    ('-0.01', -1),
+    ('-1234.56', -123456),
+    (' 12.30 ', 1230),
+])
+def test_parse_cents(text, cents):
+    assert money.parse_cents(text) == cents
+
+@pytest.mark.parametrize('text, cents', [
+    # half to even on the exact decimal value
+    ('0.125', 12),
+    ('0.375', 38),
+    ('0.135', 14),
+    ('2.675', 268),
+    ('1.005', 100),
+    ('1.015', 102),
+    ('-2.675', -268),
+    ('-0.005', 0),
+    ('-0.015', -2),
+    ('-0.001', 0),
+    ('10.9999', 1100),
+    ('1.2345', 123),
+    ('1.2351', 124),
+])
+def test_parse_cents_rounding(text, cents):
+    assert money.parse_cents(text) == cents
+
+def test_parse_cents_four_decimals_exact():
+    # SSRS renders money columns with four decimals: the float of 2.6750 is 2.67499999..., which
+    # would round to 267 cents, while the exact value is a tie rounded to the even 268
+    assert round(float('2.6750'), 2) == 2.67
+    assert money.parse_cents('2.6750') == 268
+    assert money.parse_cents('0.0150') == 2
+
+@pytest.mark.parametrize('text', ['', ' ', '-', '.', '1.2.3', '1,50', 'abc', '1e3', '--1', '١٢'])
+def test_parse_cents_invalid(text):
+    with pytest.raises(ValueError):
+        money.parse_cents(text)
+
+@pytest.mark.parametrize('cents, width, text', [
+    (0, 12, '00000000000+'),
+    (123456, 12, '00000123456+'),
+    (-123456, 12, '00000123456-'),
+    (-1, 14, '0000000000001-'),
+    (None, 12, '000000000000'),
+    (10**11-1, 12, '99999999999+'),
+])
+def test_format_signed(cents, width, text):
+    assert money.format_signed(cents, width) == text
+
+def test_format_signed_overflow_is_longer():
+    # the layout tells the overflow from the length of the record
+    assert len(money.format_signed(-10**11, 12)) == 13
@@ -0,0 +1,25 @@
+"""command line of the startup report"""
+
+import pytest
+
+import startup
+
+@pytest.fixture(autouse=True)
+def fixture_no_timer(monkeypatch):
+    monkeypatch.delenv(startup.ENV_VAR, raising=False)
+    yield
+    if startup._timer is not None: # pylint: disable=protected-access
+        startup._timer.uninstall() # pylint: disable=protected-access
+        startup._timer = None # pylint: disable=protected-access
+
+@pytest.mark.parametrize('argv, remaining, output_path', [
+    (['cli.py', '--startup-report', 'download', '-s', '2020-01-01'], ['cli.py', 'download', '-s', '2020-01-01'], startup.STDERR),
+    (['cli.py', 'download', '--startup-report=./startup.txt'], ['cli.py', 'download'], './startup.txt'),
+    (['cli.py', '--startup-report=', 'both'], ['cli.py', 'both'], startup.STDERR),
+    (['cli.py', 'download'], ['cli.py', 'download'], None),
+])
+def test_begin(argv, remaining, output_path):
+    startup.begin(argv)
+    assert argv == remaining
+    timer = startup._timer # pylint: disable=protected-access
+    assert (timer and timer.output_path) == output_path
@@ -0,0 +1,193 @@
+"""regression tests of the TRAF2000 conversion against a golden file
+
+The golden file is the TRAF2000 export of a fixed generated report: every path rendering it, serial
+or in the process pool, from xml or from csv, at once or appended incrementally, must write the
+same bytes. After an intended change of the export write it again running the tests with the
+environment variable UPDATE_GOLDEN=1.
+"""
+
+import os
+import csv
+import gzip
+import datetime
+import configparser
+
+import pytest
+
+import generators
+import run_benchmarks
+import report_server
+import traf2000_converter
+
+INVOICES = 60
+SEED = 3
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'traf2000_golden.txt.gz')
+UPDATE_GOLDEN_VAR = 'UPDATE_GOLDEN'
+
+def read_golden() -> str:
+    """return the golden TRAF2000 export"""
+    with gzip.open(GOLDEN_PATH, 'rt', encoding='utf-8', newline='') as golden_file:
+        return golden_file.read()
+
+def write_golden(text: str):
+    """write the golden TRAF2000 export, with no timestamp in the gzip header"""
+    with open(GOLDEN_PATH, 'wb') as golden_file, gzip.GzipFile(fileobj=golden_file, mode='wb', mtime=0) as output:
+        output.write(text.encode('utf-8'))
+
+def render(workers: int, report_path: str) -> str:
+    """return the TRAF2000 records of the convertible invoices of an xml report"""
+    context = run_benchmarks.new_context(workers)
+    records = run_benchmarks.new_records()
+    invoices = traf2000_converter.iter_convertible(context, [report_path])
+    rendered = list()
+    for invoice, text, error, _ in traf2000_converter.iter_rendered(context, records, invoices):
+        assert error is None, invoice.num_fattura
+        rendered.append(text)
+    return ''.join(rendered)
+
+def new_context(output_path, **traf2000_options) -> run_benchmarks.BenchmarkContext:
+    """return a context converting to output_path without the catalog and with the given [TRAF2000] options"""
+    config = configparser.ConfigParser()
+    config['TRAF2000'] = dict(run_benchmarks.TRAF2000_CONFIG, **traf2000_options)
+    config['CATALOG'] = {'ENABLED': 'no'}
+    config['METRICS'] = {'SUMMARY': 'no'}
+    return run_benchmarks.BenchmarkContext(config, None, None, None, traf2000_output=str(output_path))
+
+def convert(monkeypatch, context, report_path) -> bool:
+    """run the conversion of context on report_path instead of the downloaded reports"""
+    monkeypatch.setattr(report_server, 'download_reports', lambda context, report_format: [str(report_path)])
+    return traf2000_converter.convert(context)
+
+def invoice_date(index: int) -> datetime.date:
+    """return the issue date of the index-th generated invoice"""
+    for current, attributes, _ in generators.iter_invoices(INVOICES, SEED):
+        if current == index:
+            return datetime.date.fromisoformat(attributes["data_fatturatestata"][:10])
+    raise ValueError(index)
+
+@pytest.fixture(name='report_xml', scope='module')
+def fixture_report_xml(tmp_path_factory):
+    path = tmp_path_factory.mktemp('report') / 'report.xml'
+    generators.write_report_xml(str(path), INVOICES, SEED)
+    return path
+
+def test_render_serial(report_xml):
+    rendered = render(1, str(report_xml))
+    if os.environ.get(UPDATE_GOLDEN_VAR):
+        write_golden(rendered)
+    assert rendered == read_golden()
+
+def test_render_pool(report_xml):
+    assert render(2, str(report_xml)) == read_golden()
+
+def test_convert_xml(monkeypatch, tmp_path, report_xml):
+    output_path = tmp_path / 'TRAF2000'
+    assert convert(monkeypatch, new_context(output_path, **{'XSD-VALIDATION': 'strict'}), report_xml)
+    assert output_path.read_bytes() == read_golden().encode('utf-8')
+
+def test_convert_csv(monkeypatch, tmp_path):
+    report_csv = tmp_path / 'report.csv'
+    generators.write_report_csv(str(report_csv), INVOICES, seed=SEED)
+    output_path = tmp_path / 'TRAF2000'
+    assert convert(monkeypatch, new_context(output_path, **{'REPORT-FORMAT': 'csv'}), report_csv)
+    assert output_path.read_bytes() == read_golden().encode('utf-8')
+
+def test_convert_incremental_append(monkeypatch, tmp_path, report_xml):
+    first_report = tmp_path / 'first.xml'
+    generators.write_report_xml(str(first_report), INVOICES, SEED, end_date=invoice_date(INVOICES//2))
+    output_path = tmp_path / 'TRAF2000'
+    options = {'INCREMENTAL': 'yes', 'APPEND': 'yes', 'LEDGER': str(tmp_path / 'ledger.json')}
+
+    assert convert(monkeypatch, new_context(output_path, **options), first_report)
+    first_size = output_path.stat().st_size
+    assert 0 < first_size < len(read_golden())
+    assert convert(monkeypatch, new_context(output_path, **options), report_xml)
+    assert output_path.read_bytes() == read_golden().encode('utf-8')
+    # nothing new: the whole period again appends nothing
+    assert convert(monkeypatch, new_context(output_path, **options), report_xml)
+    assert output_path.read_bytes() == read_golden().encode('utf-8')
+
+def write_invalid_xml(path, invoice_index: int):
+    """write the generated report with a paid amount that is not an xs:decimal in the invoice_index-th invoice"""
+    generators.write_report_xml(str(path), INVOICES, SEED)
+    attribute = 'denorm_importopagato_fatturatestata="'
+    parts = path.read_text(encoding='utf-8').split(attribute)
+    parts[invoice_index] = 'abc' + parts[invoice_index][parts[invoice_index].index('"'):]
+    path.write_text(attribute.join(parts), encoding='utf-8')
+
+@pytest.mark.parametrize('invoice_index', [5, INVOICES-5])
+def test_convert_invalid_xml_fast(monkeypatch, tmp_path, invoice_index):
+    report_xml = tmp_path / 'report.xml'
+    write_invalid_xml(report_xml, invoice_index)
+    output_path = tmp_path / 'TRAF2000'
+    ledger_path = tmp_path / 'ledger.json'
+    options = {'XSD-VALIDATION': 'fast', 'INCREMENTAL': 'yes', 'LEDGER': str(ledger_path)}
+    assert not convert(monkeypatch, new_context(output_path, **options), report_xml)
+    assert not output_path.exists()
+    assert not ledger_path.exists()
+
+def test_convert_invalid_xml_report(monkeypatch, tmp_path, report_xml):
+    # the default validation only logs a report not valid against the schema and converts it all
+    invalid_xml = tmp_path / 'report.xml'
+    write_invalid_xml(invalid_xml, 5)
+    output_path = tmp_path / 'TRAF2000'
+    assert convert(monkeypatch, new_context(output_path), invalid_xml)
+    assert output_path.read_bytes() == read_golden().encode('utf-8')
+
+def test_convert_malformed_xml_report(monkeypatch, tmp_path, report_xml):
+    malformed_xml = tmp_path / 'report.xml'
+    text = report_xml.read_text(encoding='utf-8')
+    malformed_xml.write_text(text[:len(text)//2] + '<<' + text[len(text)//2:], encoding='utf-8')
+    output_path = tmp_path / 'TRAF2000'
+    assert not convert(monkeypatch, new_context(output_path), malformed_xml)
+    assert not output_path.exists()
+
+def test_convert_invalid_xml_append(monkeypatch, tmp_path):
+    report_xml = tmp_path / 'report.xml'
+    write_invalid_xml(report_xml, 5)
+    output_path = tmp_path / 'TRAF2000'
+    output_path.write_text("previous export\n", encoding='utf-8')
+    options = {'XSD-VALIDATION': 'fast', 'APPEND': 'yes', 'WORKERS': '2'}
+    assert not convert(monkeypatch, new_context(output_path, **options), report_xml)
+    assert output_path.read_text(encoding='utf-8') == "previous export\n"
+
+def test_convert_invalid_csv(monkeypatch, tmp_path):
+    report_csv = tmp_path / 'report.csv'
+    generators.write_report_csv(str(report_csv), INVOICES, seed=SEED)
+    with open(report_csv, newline='', encoding='utf-8-sig') as input_file:
+        records = list(csv.reader(input_file))
+    # a price of one of the last invoices that is either 1.234 or 1234
+    records[records.index([]) - 5][records[0].index('prezzounitario_fatturariga1')] = '1.234'
+    with open(report_csv, 'w', newline='', encoding='utf-8-sig') as output_file:
+        csv.writer(output_file).writerows(records)
+    output_path = tmp_path / 'TRAF2000'
+    ledger_path = tmp_path / 'ledger.json'
+    options = {'REPORT-FORMAT': 'csv', 'INCREMENTAL': 'yes', 'LEDGER': str(ledger_path)}
+    assert not convert(monkeypatch, new_context(output_path, **options), report_csv)
+    assert not output_path.exists()
+    assert not ledger_path.exists()
+
+def test_build_credit_note():
+    context = run_benchmarks.new_context()
+    attributes = {
+        "protocollo_fatturatestata": "CCSR/00010/2020",
+        "protocollo_fatturatestata1": "CCSR/00009/2020",
+        "fat_ndc": "Nota di credito",
+        "data_fatturatestata": "2020-01-15T00:00:00",
+        "nome_cliente": "Mario",
+        "cognome_cliente": "Rossi",
+        "cf_piva_cliente": "RSSMRA80A01H501A",
+    }
+    # as the first converter, only the unsigned prices of a credit note are made negative
+    invoice = traf2000_converter.build_invoice(context, attributes, [("Visita specialistica", "-50.00"), ("Bollo", "-2.00")])
+    assert [line.importo for line in invoice.righe] == [5000, 200]
+    invoice = traf2000_converter.build_invoice(context, attributes, [("Visita specialistica", "50.00"), ("Bollo", "2.00")])
+    assert [line.importo for line in invoice.righe] == [-5000, -200]
+    assert invoice.importo_totale == -5200
+    assert invoice.bollo == -200
+
+    record_0, record_5, _, _ = traf2000_converter.render_invoice(run_benchmarks.new_records(), invoice).split('\n')
+    assert "N.C. A CLIENTE" in record_0
+    assert "00000005200-" in record_0  # TRF-TOT-FAT
+    assert "0000000005000-" in record_5  # TRF-A21CO-IMPORTO without the bollo
+    assert "0000000000200-" in record_5  # TRF-A21CO-IMPORTO of the bollo